@@ -54,7 +54,8 @@ class Channel(object):
             settle_timeout,
             reveal_timeout,
             balance,
-            state):
+            state,
+            verified=True):
         self.channel_address = channel_address
         self.token_address = token_address
         self.partner_address = partner_address
@@ -62,6 +63,7 @@ class Channel(object):
         self.reveal_timeout = reveal_timeout
         self.balance = balance
         self.state = state
+        self.verified = verified
 
 
 class ChannelNew(object):
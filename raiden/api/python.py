@@ -670,24 +670,22 @@ class RaidenAPI(object):
             from_block=from_block,
             to_block=to_block,
         )
-        raiden_events = self.raiden.transaction_log.get_events_in_block_range(
-            from_block=from_block,
-            to_block=to_block
-        )
         # Here choose which raiden internal events we want to expose to the end user
-        for event in raiden_events:
-            is_user_transfer_event = isinstance(event.event_object, (
+        raiden_events = self.raiden.transaction_log.get_events(
+            from_block=from_block,
+            to_block=to_block,
+            event_types=(
                 EventTransferSentSuccess,
                 EventTransferSentFailed,
-                EventTransferReceivedSuccess
-            ))
-
-            if is_user_transfer_event:
-                new_event = {
-                    'block_number': event.block_number,
-                    '_event_type': type(event.event_object).__name__,
-                }
-                new_event.update(event.event_object.__dict__)
-                returned_events.append(new_event)
+                EventTransferReceivedSuccess,
+            ),
+        )
+        for event in raiden_events:
+            new_event = {
+                'block_number': event.block_number,
+                '_event_type': type(event.event_object).__name__,
+            }
+            new_event.update(event.event_object.__dict__)
+            returned_events.append(new_event)
 
         return returned_events
@@ -190,6 +190,7 @@ class ChannelSchema(BaseSchema):
         CHANNEL_STATE_OPENED,
         CHANNEL_STATE_SETTLED,
     ]))
+    verified = fields.Boolean()
 
     class Meta:
         strict = True
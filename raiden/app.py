@@ -6,15 +6,36 @@ from ethereum.utils import decode_hex
 
 from raiden.raiden_service import RaidenService
 from raiden.settings import (
+    DEFAULT_DATABASE_ACK_RETENTION,
+    DEFAULT_DATABASE_ARCHIVE,
+    DEFAULT_DATABASE_BACKEND,
+    DEFAULT_DATABASE_SERIALIZER,
+    DEFAULT_DATABASE_SYNCHRONOUS,
+    DEFAULT_DATABASE_GROUP_COMMIT_SIZE,
+    DEFAULT_DATABASE_GROUP_COMMIT_TIMEOUT,
+    DEFAULT_DATABASE_RETENTION_BLOCKS,
+    DEFAULT_DATABASE_SEGMENT_SIZE,
+    DEFAULT_LAZY_RESTORE,
     DEFAULT_NAT_INVITATION_TIMEOUT,
     DEFAULT_NAT_KEEPALIVE_RETRIES,
     DEFAULT_NAT_KEEPALIVE_TIMEOUT,
+    DEFAULT_PROTOCOL_ACK_CACHE_SIZE,
+    DEFAULT_PROTOCOL_ACK_CACHE_TTL,
+    DEFAULT_PROTOCOL_ACK_DELAY,
+    DEFAULT_PROTOCOL_BATCH_MESSAGES,
     DEFAULT_PROTOCOL_RETRIES_BEFORE_BACKOFF,
     DEFAULT_PROTOCOL_THROTTLE_CAPACITY,
     DEFAULT_PROTOCOL_THROTTLE_FILL_RATE,
     DEFAULT_PROTOCOL_RETRY_INTERVAL,
+    DEFAULT_PROTOCOL_SCHEDULER_WORKERS,
+    DEFAULT_PROTOCOL_SEND_WINDOW,
+    DEFAULT_PROTOCOL_VERIFY_WORKERS,
+    DEFAULT_RESTORE_CONCURRENCY,
     DEFAULT_REVEAL_TIMEOUT,
     DEFAULT_SETTLE_TIMEOUT,
+    DEFAULT_SNAPSHOT_DELTAS_PER_BASE,
+    DEFAULT_SNAPSHOT_INTERVAL,
+    DEFAULT_SNAPSHOT_STATE_CHANGES,
     INITIAL_PORT,
 )
 from raiden.network.transport import UDPTransport, TokenBucket
@@ -34,6 +55,20 @@ class App(object):  # pylint: disable=too-few-public-methods
         'reveal_timeout': DEFAULT_REVEAL_TIMEOUT,
         'settle_timeout': DEFAULT_SETTLE_TIMEOUT,
         'database_path': '',
+        'database_backend': DEFAULT_DATABASE_BACKEND,
+        'database_synchronous': DEFAULT_DATABASE_SYNCHRONOUS,
+        'database_serializer': DEFAULT_DATABASE_SERIALIZER,
+        'database_group_commit_size': DEFAULT_DATABASE_GROUP_COMMIT_SIZE,
+        'database_group_commit_timeout': DEFAULT_DATABASE_GROUP_COMMIT_TIMEOUT,
+        'database_retention_blocks': DEFAULT_DATABASE_RETENTION_BLOCKS,
+        'database_segment_size': DEFAULT_DATABASE_SEGMENT_SIZE,
+        'database_archive': DEFAULT_DATABASE_ARCHIVE,
+        'database_ack_retention': DEFAULT_DATABASE_ACK_RETENTION,
+        'snapshot_state_changes': DEFAULT_SNAPSHOT_STATE_CHANGES,
+        'snapshot_interval': DEFAULT_SNAPSHOT_INTERVAL,
+        'snapshot_deltas_per_base': DEFAULT_SNAPSHOT_DELTAS_PER_BASE,
+        'lazy_restore': DEFAULT_LAZY_RESTORE,
+        'restore_concurrency': DEFAULT_RESTORE_CONCURRENCY,
         'msg_timeout': 100.0,
         'protocol': {
             'retry_interval': DEFAULT_PROTOCOL_RETRY_INTERVAL,
@@ -43,6 +78,13 @@ class App(object):  # pylint: disable=too-few-public-methods
             'nat_invitation_timeout': DEFAULT_NAT_INVITATION_TIMEOUT,
             'nat_keepalive_retries': DEFAULT_NAT_KEEPALIVE_RETRIES,
             'nat_keepalive_timeout': DEFAULT_NAT_KEEPALIVE_TIMEOUT,
+            'verify_workers': DEFAULT_PROTOCOL_VERIFY_WORKERS,
+            'ack_cache_size': DEFAULT_PROTOCOL_ACK_CACHE_SIZE,
+            'ack_cache_ttl': DEFAULT_PROTOCOL_ACK_CACHE_TTL,
+            'send_window': DEFAULT_PROTOCOL_SEND_WINDOW,
+            'ack_delay': DEFAULT_PROTOCOL_ACK_DELAY,
+            'batch_messages': DEFAULT_PROTOCOL_BATCH_MESSAGES,
+            'scheduler_workers': DEFAULT_PROTOCOL_SCHEDULER_WORKERS,
         },
         'rpc': True,
         'console': False,
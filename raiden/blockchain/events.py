@@ -156,7 +156,11 @@ def get_all_netting_channel_events(
     )
 
 
-def get_relevant_proxies(chain, node_address, registry_address):
+def get_relevant_proxies(chain, node_address, registry_address, skip_channels=()):
+    """ Return the proxies of the registry, its channel managers and the
+    netting channels `node_address` participates in, except for the channels
+    in `skip_channels`.
+    """
     registry = chain.registry(registry_address)
 
     channel_managers = list()
@@ -169,6 +173,9 @@ def get_relevant_proxies(chain, node_address, registry_address):
         participating_channels = channel_manager.channels_by_participant(node_address)
         netting_channels = []
         for channel_address in participating_channels:
+            if channel_address in skip_channels:
+                continue
+
             # FIXME: implement proper cleanup of self-killed channel after close+settle
             try:
                 netting_channels.append(chain.netting_channel(channel_address))
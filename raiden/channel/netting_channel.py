@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import logging
+from collections import namedtuple
 
 from gevent.event import Event
 from ethereum import slogging
@@ -35,14 +36,58 @@ from raiden.transfer.merkle_tree import LEAVES, merkleroot
 
 log = slogging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# The amounts of a channel from our point of view, see the `Channel`
+# properties with the same names
+ChannelBalanceView = namedtuple(
+    'ChannelBalanceView',
+    ('balance', 'distributable', 'locked', 'outstanding'),
+)
+
+
+class LazyNettingChannel(object):
+    """ Stand-in for the netting channel proxy of a channel restored from a
+    snapshot.
+
+    Instantiating the proxy queries the blockchain, so it is only done once
+    the proxy is used.
+    """
+
+    def __init__(self, chain, address, opened_block, closed_block):
+        self.chain = chain
+        self.address = address
+        self._opened_block = opened_block
+        self._closed_block = closed_block
+        self._proxy = None
+
+    def opened(self):
+        return self._opened_block
+
+    def closed(self):
+        return self._closed_block
+
+    def get_proxy(self):
+        if self._proxy is None:
+            self._proxy = self.chain.netting_channel(self.address)
+        return self._proxy
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return getattr(self.get_proxy(), name)
+
 
 class ChannelExternalState(object):
     # pylint: disable=too-many-instance-attributes
 
-    def __init__(self, register_channel_for_hashlock, netting_channel):
+    def __init__(self, register_channel_for_hashlock, netting_channel, log_transfer=None):
         self.register_channel_for_hashlock = register_channel_for_hashlock
         self.netting_channel = netting_channel
 
+        # Called with (channel, block_number, transfer) for every registered
+        # transfer, None if the transfers are not logged
+        self.log_transfer = log_transfer
+
         self._opened_block = netting_channel.opened()
         self._closed_block = netting_channel.closed()
         self._settled_block = 0
@@ -198,6 +243,19 @@ class Channel(object):
         self.received_transfers = list()
         self.sent_transfers = list()
 
+        # Incremented when a transfer, a secret, a deposit, or the channel
+        # being closed or settled changes the channel, used to find the
+        # channels that changed since the last snapshot and by caches that
+        # depend on the channel balances
+        self.version = 0
+
+        # The balances computed from the end states, dropped by `changed`
+        self._balance_view = None
+
+        # False for a channel restored from a snapshot which on-chain state
+        # was not checked yet, it can receive but not send transfers
+        self.verified = True
+
     @property
     def state(self):
         if self.external_state.settled_block != 0:
@@ -223,6 +281,7 @@ class Channel(object):
     @property
     def can_transfer(self):
         return (
+            self.verified and
             self.state == CHANNEL_STATE_OPENED and
             self.distributable > 0
         )
@@ -237,6 +296,24 @@ class Channel(object):
         """ Return how much we transferred to partner. """
         return self.our_state.transferred_amount
 
+    @property
+    def balance_view(self):
+        """ Return the balances of the channel, these are computed once and
+        reused until the channel is changed.
+        """
+        if self._balance_view is None:
+            our_state = self.our_state
+            partner_state = self.partner_state
+
+            self._balance_view = ChannelBalanceView(
+                balance=our_state.balance(partner_state),
+                distributable=our_state.distributable(partner_state),
+                locked=our_state.amount_locked,
+                outstanding=partner_state.amount_locked,
+            )
+
+        return self._balance_view
+
     @property
     def balance(self):
         """ Return our current balance.
@@ -244,18 +321,14 @@ class Channel(object):
         Balance is equal to `initial_deposit + received_amount - sent_amount`,
         were both `receive_amount` and `sent_amount` are unlocked.
         """
-        return (
-            self.our_state.contract_balance -
-            self.our_state.transferred_amount +
-            self.partner_state.transferred_amount
-        )
+        return self.balance_view.balance
 
     @property
     def distributable(self):
         """ Return the available amount of the token that our end of the
         channel can transfer to the partner.
         """
-        return self.our_state.distributable(self.partner_state)
+        return self.balance_view.distributable
 
     @property
     def locked(self):
@@ -265,11 +338,18 @@ class Channel(object):
         The locked value is equal to locked transfers that have been
         initialized but their secret has not being revealed.
         """
-        return self.our_state.amount_locked
+        return self.balance_view.locked
 
     @property
     def outstanding(self):
-        return self.partner_state.amount_locked
+        return self.balance_view.outstanding
+
+    def changed(self):
+        """ Must be called after either end state is changed, it increments
+        the version and drops the cached balances.
+        """
+        self.version += 1
+        self._balance_view = None
 
     def get_settle_expiration(self, block_number):
         closed_block = self.external_state.closed_block
@@ -306,6 +386,17 @@ class Channel(object):
 
         raise Exception('Unknown address {}'.format(encode_hex(node_address_bin)))
 
+    def update_contract_balance(self, participant_address, contract_balance):
+        """ Update the on-chain balance of the participant `participant_address`.
+
+        Raises:
+            ValueError: If the `contract_balance` is smaller than the current
+            balance.
+        """
+        channel_state = self.get_state_for(participant_address)
+        channel_state.update_contract_balance(contract_balance)
+        self.changed()
+
     def register_secret(self, secret):
         """ Register a secret.
 
@@ -377,6 +468,8 @@ class Channel(object):
 
             self.partner_state.register_secret(secret)
 
+        self.changed()
+
     def register_transfer(self, block_number, transfer):
         """ Register a signed transfer, updating the channel's state accordingly. """
 
@@ -389,6 +482,7 @@ class Channel(object):
             )
 
             self.sent_transfers.append(transfer)
+            self.changed()
 
         elif transfer.sender == self.partner_state.address:
             self.register_transfer_from_to(
@@ -398,6 +492,7 @@ class Channel(object):
                 to_state=self.our_state,
             )
             self.received_transfers.append(transfer)
+            self.changed()
 
         else:
             if log.isEnabledFor(logging.WARN):
@@ -409,6 +504,9 @@ class Channel(object):
                 )
             raise UnknownAddress(transfer)
 
+        if self.external_state.log_transfer is not None:
+            self.external_state.log_transfer(self, block_number, transfer)
+
     def register_transfer_from_to(
             self,
             block_number,
@@ -797,6 +895,7 @@ class Channel(object):
         elif isinstance(state_change, ContractReceiveClosed):
             if state_change.channel_address == self.channel_address:
                 if self.external_state.set_closed(state_change.block_number):
+                    self.changed()
                     self.handle_closed(
                         state_change.block_number,
                         state_change.closing_address,
@@ -812,6 +911,7 @@ class Channel(object):
         elif isinstance(state_change, ContractReceiveSettled):
             if state_change.channel_address == self.channel_address:
                 if self.external_state.set_settled(state_change.block_number):
+                    self.changed()
                     self.handle_settled(state_change.block_number)
                 else:
                     log.warn(
@@ -828,7 +928,7 @@ class Channel(object):
             block_number = state_change.block_number
 
             if channel_state.contract_balance != balance:
-                channel_state.update_contract_balance(balance)
+                self.update_contract_balance(participant_address, balance)
 
             if self.external_state.opened_block == 0:
                 self.external_state.set_opened(block_number)
@@ -857,7 +957,14 @@ class ChannelSerialization(object):
         self.our_balance_proof = channel_instance.our_state.balance_proof
         self.partner_balance_proof = channel_instance.partner_state.balance_proof
         self.our_leaves = channel_instance.our_state.merkletree.layers[LEAVES]
-        self.partner_leaves = channel_instance.our_state.merkletree.layers[LEAVES]
+        self.partner_leaves = channel_instance.partner_state.merkletree.layers[LEAVES]
+
+        # used to restore the channel without querying the blockchain
+        self.our_balance = channel_instance.our_state.contract_balance
+        self.partner_balance = channel_instance.partner_state.contract_balance
+        self.settle_timeout = channel_instance.settle_timeout
+        self.opened_block = channel_instance.external_state.opened_block
+        self.closed_block = channel_instance.external_state.closed_block
 
     def __eq__(self, other):
         if isinstance(other, ChannelSerialization):
@@ -1,36 +1,94 @@
 # -*- coding: utf-8 -*-
 from collections import namedtuple
-from itertools import chain
 
 from ethereum import slogging
 
 from raiden.exceptions import InvalidLocksRoot
+from raiden.messages import Lock
 from raiden.transfer.merkle_tree import (
-    EMPTY_MERKLE_TREE,
-    EMPTY_MERKLE_ROOT,
-    LEAVES,
-    compute_layers,
     compute_merkleproof_for,
+    compute_merkleproofs_for,
     merkleroot,
+    merkletree_insert,
+    merkletree_remove,
 )
-from raiden.transfer.state import BalanceProofState, MerkleTreeState
-from raiden.utils import sha3
+from raiden.transfer.state import BalanceProofState
+from raiden.utils import pex, sha3
 
 log = slogging.getLogger(__name__)  # pylint: disable=invalid-name
 
-# A lock and its computed hash, this namedtuple is used to keep the
-# `sha3(lock.as_bytes)` cached since this value is used to construct the
-# merkletree
-PendingLock = namedtuple('PendingLock', ('lock', 'lockhashed'))
 
-# The lock and the secret to unlock it, this is all the data required to
-# construct an unlock proof. The proof is not calculated because we only need
-# it when the contract is closed.
-UnlockPartialProof = namedtuple('UnlockPartialProof', ('lock', 'lockhashed', 'secret'))
+class PendingLock(object):
+    """ A lock and its computed hash, the hash is kept cached since this value
+    is used to construct the merkletree.
+
+    Only the lock fields are stored, a channel may have thousands of pending
+    locks and a `Lock` instance carries an instance dictionary and its
+    serialized form.
+    """
+    __slots__ = ('amount', 'expiration', 'hashlock', 'lockhashed')
+
+    def __init__(self, lock, lockhashed):
+        self.amount = lock.amount
+        self.expiration = lock.expiration
+        self.hashlock = lock.hashlock
+        self.lockhashed = lockhashed
+
+    @property
+    def lock(self):
+        return Lock(self.amount, self.expiration, self.hashlock)
+
+    def __reduce__(self):
+        return (self.__class__, (self.lock, self.lockhashed))
+
+    def __repr__(self):
+        return '<{} amount:{} expiration:{} lockhashed:{}>'.format(
+            self.__class__.__name__,
+            self.amount,
+            self.expiration,
+            pex(self.lockhashed),
+        )
+
+    def __eq__(self, other):
+        if isinstance(other, PendingLock):
+            return (
+                self.__class__ is other.__class__ and
+                self.lockhashed == other.lockhashed
+            )
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+class UnlockPartialProof(PendingLock):
+    """ The lock and the secret to unlock it, this is all the data required to
+    construct an unlock proof. The proof is not calculated because we only need
+    it when the contract is closed.
+    """
+    __slots__ = ('secret',)
+
+    def __init__(self, lock, lockhashed, secret):
+        super(UnlockPartialProof, self).__init__(lock, lockhashed)
+        self.secret = secret
+
+    def __reduce__(self):
+        return (self.__class__, (self.lock, self.lockhashed, self.secret))
+
+    def __eq__(self, other):
+        return (
+            super(UnlockPartialProof, self).__eq__(other) and
+            self.secret == other.secret
+        )
+
 
 # The proof that can be used to unlock a secret with a smart contract
 UnlockProof = namedtuple('UnlockProof', ('merkle_proof', 'lock_encoded', 'secret'))
 
+# Number of candidate merkletrees kept by a ChannelEndState, a lock is usually
+# validated and then registered, only a few trees are needed at a time
+CANDIDATE_MERKLETREES_SIZE = 16
+
 
 class ChannelEndState(object):
     """ Tracks the state of one of the participants in a channel. """
@@ -54,9 +112,19 @@ class ChannelEndState(object):
         # is no balance proof unlocking it.
         self.hashlocks_to_unclaimedlocks = dict()
 
+        # The sum of the amounts of the pending and unclaimed locks, updated
+        # when a lock is registered or removed.
+        self._amount_locked = 0
+
         # A merkletree of the keccak hash of the locks.
         self.merkletree = merkletree
 
+        # The trees computed to validate or create a transfer, keyed by
+        # (merkleroot, lockhash), these are reused once the lock is registered
+        # or removed. A lockhash is either in the tree or not, so the key
+        # identifies the operation.
+        self.candidate_merkletrees = dict()
+
         # The latest known balance proof that can be used on-chain, may be None.
         self.balance_proof = balance_proof
 
@@ -68,15 +136,7 @@ class ChannelEndState(object):
 
     @property
     def amount_locked(self):
-        alllocks = chain(
-            self.hashlocks_to_pendinglocks.values(),
-            self.hashlocks_to_unclaimedlocks.values(),
-        )
-
-        return sum(
-            lock.lock.amount
-            for lock in alllocks
-        )
+        return self._amount_locked
 
     @property
     def nonce(self):
@@ -115,22 +175,40 @@ class ChannelEndState(object):
         self.contract_balance = contract_balance
 
     def get_lock_by_hashlock(self, hashlock):
-        lock = self.hashlocks_to_pendinglocks.get(hashlock)
+        pendinglock = self.hashlocks_to_pendinglocks.get(hashlock)
+
+        if pendinglock is None:
+            pendinglock = self.hashlocks_to_unclaimedlocks.get(hashlock)
 
-        if lock is None:
-            lock = self.hashlocks_to_unclaimedlocks.get(hashlock)
+        return pendinglock.lock
 
-        return lock.lock
+    def candidate_merkletree(self, lockhashed, operation):
+        """ Return the merkletree resulting of `operation`, either
+        `merkletree_insert` or `merkletree_remove`, with `lockhashed`.
+        """
+        key = (merkleroot(self.merkletree), lockhashed)
+        tree = self.candidate_merkletrees.get(key)
+
+        if tree is None:
+            tree = operation(self.merkletree, lockhashed)
+
+            if len(self.candidate_merkletrees) >= CANDIDATE_MERKLETREES_SIZE:
+                self.candidate_merkletrees.clear()
+            self.candidate_merkletrees[key] = tree
+
+        return tree
+
+    def set_merkletree(self, merkletree):
+        # the candidates were computed from the previous tree
+        self.candidate_merkletrees.clear()
+        self.merkletree = merkletree
 
     def compute_merkleroot_with(self, include):
         """ Compute the resulting merkle root if the lock `include` is added in
         the tree.
         """
         if not self.is_known(include.hashlock):
-            leaves = list(self.merkletree.layers[LEAVES])
-            leaves.append(sha3(include.as_bytes))
-
-            tree_with = MerkleTreeState(compute_layers(leaves))
+            tree_with = self.candidate_merkletree(sha3(include.as_bytes), merkletree_insert)
             locksroot = merkleroot(tree_with)
         else:
             locksroot = merkleroot(self.merkletree)
@@ -144,16 +222,8 @@ class ChannelEndState(object):
         if not self.is_known(without.hashlock):
             raise ValueError('unknown lock', lock=without)
 
-        leaves = list(self.merkletree.layers[LEAVES])
-        leaves.remove(sha3(without.as_bytes))
-
-        if leaves:
-            tree_without = MerkleTreeState(compute_layers(leaves))
-            locksroot = merkleroot(tree_without)
-        else:
-            locksroot = EMPTY_MERKLE_ROOT
-
-        return locksroot
+        tree_without = self.candidate_merkletree(sha3(without.as_bytes), merkletree_remove)
+        return merkleroot(tree_without)
 
     # Api design: using specialized methods to force the user to register the
     # transfer and the lock in a single step
@@ -189,18 +259,16 @@ class ChannelEndState(object):
         if self.is_known(lock.hashlock):
             raise ValueError('hashlock is already registered')
 
-        leaves = list(self.merkletree.layers[LEAVES])
-        leaves.append(lockhashed)
-
-        newtree = MerkleTreeState(compute_layers(leaves))
+        newtree = self.candidate_merkletree(lockhashed, merkletree_insert)
         locksroot = merkleroot(newtree)
 
         if balance_proof.locksroot != locksroot:
             raise InvalidLocksRoot(locksroot, balance_proof.locksroot)
 
         self.hashlocks_to_pendinglocks[lock.hashlock] = PendingLock(lock, lockhashed)
+        self._amount_locked += lock.amount
         self.balance_proof = balance_proof
-        self.merkletree = newtree
+        self.set_merkletree(newtree)
 
     def register_direct_transfer(self, direct_transfer):
         """ Register a direct_transfer.
@@ -224,35 +292,25 @@ class ChannelEndState(object):
         if not pendinglock:
             pendinglock = self.hashlocks_to_unclaimedlocks[hashlock]
 
-        lock = pendinglock.lock
-        lockhashed = sha3(lock.as_bytes)
+        lockhashed = pendinglock.lockhashed
 
         if not isinstance(balance_proof, BalanceProofState):
             raise ValueError('balance_proof must be a BalanceProof instance')
 
-        if not self.is_known(lock.hashlock):
-            raise ValueError('hashlock is not registered')
-
-        leaves = list(self.merkletree.layers[LEAVES])
-        leaves.remove(lockhashed)
-
-        if leaves:
-            layers = compute_layers(leaves)
-            new_merkletree = MerkleTreeState(layers)
-            new_locksroot = merkleroot(new_merkletree)
-        else:
-            new_merkletree = EMPTY_MERKLE_TREE
-            new_locksroot = EMPTY_MERKLE_ROOT
+        new_merkletree = self.candidate_merkletree(lockhashed, merkletree_remove)
+        new_locksroot = merkleroot(new_merkletree)
 
         if balance_proof.locksroot != new_locksroot:
             raise InvalidLocksRoot(new_locksroot, balance_proof.locksroot)
 
-        if lock.hashlock in self.hashlocks_to_pendinglocks:
-            del self.hashlocks_to_pendinglocks[lock.hashlock]
+        if hashlock in self.hashlocks_to_pendinglocks:
+            del self.hashlocks_to_pendinglocks[hashlock]
         else:
-            del self.hashlocks_to_unclaimedlocks[lock.hashlock]
+            del self.hashlocks_to_unclaimedlocks[hashlock]
 
-        self.merkletree = new_merkletree
+        self._amount_locked -= pendinglock.amount
+
+        self.set_merkletree(new_merkletree)
         self.balance_proof = balance_proof
 
     def register_secret(self, secret):
@@ -271,9 +329,10 @@ class ChannelEndState(object):
             raise ValueError('secret does not correspond to any hashlock')
 
         if self.is_locked(hashlock):
-            pendinglock = self.hashlocks_to_pendinglocks[hashlock]
-            del self.hashlocks_to_pendinglocks[hashlock]
+            pendinglock = self.hashlocks_to_pendinglocks.pop(hashlock)
 
+            # the amount stays locked until a balance proof unlocking it is
+            # registered, `_amount_locked` is not changed
             self.hashlocks_to_unclaimedlocks[hashlock] = UnlockPartialProof(
                 pendinglock.lock,
                 pendinglock.lockhashed,
@@ -282,16 +341,21 @@ class ChannelEndState(object):
 
     def get_known_unlocks(self):
         """ Generate unlocking proofs for the known secrets. """
+        partialproofs = self.hashlocks_to_unclaimedlocks.values()
 
-        tree = self.merkletree
+        merkle_proofs = compute_merkleproofs_for(
+            self.merkletree,
+            [partialproof.lockhashed for partialproof in partialproofs],
+        )
 
         return [
-            self.compute_proof_for_lock(
+            UnlockProof(
+                merkle_proof,
+                # forcing bytes because ethereum.abi doesn't work with bytearray
+                bytes(partialproof.lock.as_bytes),
                 partialproof.secret,
-                partialproof.lock,
-                tree,
             )
-            for partialproof in self.hashlocks_to_unclaimedlocks.itervalues()
+            for partialproof, merkle_proof in zip(partialproofs, merkle_proofs)
         ]
 
     def compute_proof_for_lock(self, secret, lock, tree=None):
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
-import codecs
 import sys
+from binascii import hexlify
 
 from rlp.utils import int_to_big_endian
 
@@ -35,7 +35,7 @@ class integer(object):  # pylint: disable=invalid-name
 
         @staticmethod
         def decode(value):
-            return int(codecs.encode(value, 'hex'), 16)
+            return int(hexlify(value), 16)
     else:
         @staticmethod
         def encode(value, length):
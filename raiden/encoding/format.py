@@ -1,8 +1,19 @@
 # -*- coding: utf-8 -*-
+import struct
 from collections import namedtuple, Counter
 
+from raiden.encoding.encoders import integer
+
 __all__ = ('Field', 'namedbuffer', 'buffer_for',)
 
+# struct codes that decode a big endian integer field without an encoder call
+INTEGER_FORMATS = {
+    1: 'B',
+    2: 'H',
+    4: 'I',
+    8: 'Q',
+}
+
 
 Field = namedtuple(
     'Field',
@@ -54,6 +65,93 @@ def compute_slices(fields_spec):
     return name_to_slice
 
 
+def compile_fields(fields_spec):
+    """ Returns a precompiled `struct.Struct` that reads all the fields in
+    `fields_spec` at once, and the list of `(position, decode)` for the values
+    that still need to go through their encoder.
+
+    The values are the same as the ones returned by the attribute access of a
+    namedbuffer, the fields are read as bytes, unless they are integers with a
+    native struct code.
+    """
+    formats = ['>']
+    decoders = list()
+    position = 0
+
+    for field in fields_spec:
+        if isinstance(field, Pad):
+            formats.append(field.format_string)
+            continue
+
+        encoder = field.encoder
+        if isinstance(encoder, integer) and field.size_bytes in INTEGER_FORMATS:
+            formats.append(INTEGER_FORMATS[field.size_bytes])
+        else:
+            formats.append('{}s'.format(field.size_bytes))
+
+            if encoder:
+                decoders.append((position, encoder.decode))
+
+        position += 1
+
+    return struct.Struct(''.join(formats)), decoders
+
+
+def compile_encoders(fields_spec):
+    """ Returns the list of `(name, default, prepare)` for the values that are
+    given to the struct returned by `compile_fields`.
+
+    `prepare` validates and encodes a value the same way the attribute
+    assignment of a namedbuffer does, values shorter than the field are
+    padded with zeros on the left.
+    """
+    encoders = list()
+
+    for field in fields_spec:
+        if isinstance(field, Pad):
+            continue
+
+        encoder = field.encoder
+        if isinstance(encoder, integer) and field.size_bytes in INTEGER_FORMATS:
+            encoders.append((field.name, 0, make_integer_encoder(encoder)))
+        else:
+            prepare = make_bytes_encoder(field)
+            encoders.append((field.name, b'\x00' * field.size_bytes, prepare))
+
+    return encoders
+
+
+def make_integer_encoder(encoder):
+    def prepare(value):
+        encoder.validate(value)
+        return value
+
+    return prepare
+
+
+def make_bytes_encoder(field):
+    name = field.name
+    size_bytes = field.size_bytes
+    encoder = field.encoder
+
+    def prepare(value):
+        if encoder:
+            encoder.validate(value)
+            value = encoder.encode(value, size_bytes)
+
+        length = len(value)
+        if length > size_bytes:
+            msg = 'value with length {length} for {attr} is too big'.format(
+                length=length,
+                attr=name,
+            )
+            raise ValueError(msg)
+
+        return bytes(value).rjust(size_bytes, b'\x00')
+
+    return prepare
+
+
 def namedbuffer(buffer_name, fields_spec):  # noqa (ignore ciclomatic complexity)
     """ Class factory, returns a class to wrap a buffer instance and expose the
     data as fields.
@@ -98,11 +196,49 @@ def namedbuffer(buffer_name, fields_spec):  # noqa (ignore ciclomatic complexity
     names_slices = compute_slices(fields_spec)
     sorted_names = sorted(names_fields.keys())
 
+    fields_struct, fields_decoders = compile_fields(fields_spec)
+    fields_tuple = namedtuple(buffer_name, [field.name for field in fields])
+    fields_encoders = compile_encoders(fields_spec)
+
     @staticmethod
     def get_bytes_from(buffer_, name):
         slice_ = names_slices[name]
         return buffer_[slice_]
 
+    @staticmethod
+    def unpack_from(buffer_, offset=0):
+        """ Decode all the fields from `buffer_` with a single struct call,
+        the result is a namedtuple with the same attributes as the
+        namedbuffer.
+        """
+        values = fields_struct.unpack_from(buffer_, offset)
+
+        if fields_decoders:
+            values = list(values)
+            for position, decode in fields_decoders:
+                values[position] = decode(values[position])
+
+        return fields_tuple._make(values)
+
+    @staticmethod
+    def pack_into(buffer_, offset, values):
+        """ Encode the fields from the `values` mapping into `buffer_` with a
+        single struct call, the fields missing from `values` are zeroed.
+        """
+        arguments = list()
+
+        for name, default, prepare in fields_encoders:
+            value = values.get(name)
+
+            if value is None:
+                value = default
+            else:
+                value = prepare(value)
+
+            arguments.append(value)
+
+        fields_struct.pack_into(buffer_, offset, *arguments)
+
     def __init__(self, data):
         if len(data) != size:
             raise ValueError('data buffer has the wrong size, expected {}'.format(size))
@@ -179,6 +315,8 @@ def namedbuffer(buffer_name, fields_spec):  # noqa (ignore ciclomatic complexity
         'format': fields_format,
         'size': size,
         'get_bytes_from': get_bytes_from,
+        'unpack_from': unpack_from,
+        'pack_into': pack_into,
     }
 
     return type(buffer_name, (), attributes)
@@ -44,6 +44,8 @@ DIRECTTRANSFER_CMDID = 5
 MEDIATEDTRANSFER_CMDID = 7
 REFUNDTRANSFER_CMDID = 8
 REVEALSECRET_CMDID = 11
+MULTIACK_CMDID = 12
+ENVELOPE_CMDID = 13
 
 ACK = to_bigendian(ACK_CMDID)
 PING = to_bigendian(PING_CMDID)
@@ -53,6 +55,12 @@ REVEALSECRET = to_bigendian(REVEALSECRET_CMDID)
 DIRECTTRANSFER = to_bigendian(DIRECTTRANSFER_CMDID)
 MEDIATEDTRANSFER = to_bigendian(MEDIATEDTRANSFER_CMDID)
 REFUNDTRANSFER = to_bigendian(REFUNDTRANSFER_CMDID)
+MULTIACK = to_bigendian(MULTIACK_CMDID)
+ENVELOPE = to_bigendian(ENVELOPE_CMDID)
+
+# Ack flags, nodes that predate a flag ignore it since it was padding
+ACK_FLAG_MULTIACK = 1
+ACK_FLAG_ENVELOPE = 2
 
 
 # pylint: disable=invalid-name
@@ -74,6 +82,8 @@ locksroot = make_field('locksroot', 32, '32s')
 hashlock = make_field('hashlock', 32, '32s')
 secret = make_field('secret', 32, '32s')
 echo = make_field('echo', 32, '32s')
+flags = make_field('flags', 1, 'B', integer(0, 255))
+count = make_field('count', 2, '2s', integer(0, 65535))
 transferred_amount = make_field('transferred_amount', 32, '32s', integer(0, UINT256_MAX))
 amount = make_field('amount', 32, '32s', integer(0, UINT256_MAX))
 fee = make_field('fee', 32, '32s', integer(0, UINT256_MAX))
@@ -86,12 +96,39 @@ Ack = namedbuffer(
     'ack',
     [
         cmdid(ACK),  # [0:1]
-        pad(3),      # [1:4]
+        flags,       # [1:2]
+        pad(2),      # [2:4]
         sender,
         echo,
     ]
 )
 
+# The header of a MultiAck, it is followed by `count` echo hashes
+MultiAck = namedbuffer(
+    'multi_ack',
+    [
+        cmdid(MULTIACK),  # [0:1]
+        pad(1),           # [1:2]
+        count,            # [2:4]
+        sender,           # [4:24]
+    ]
+)
+
+ECHO_SIZE = echo.size_bytes
+
+# The header of a datagram carrying several messages, it is followed by
+# `count` messages, each one prefixed with its length
+Envelope = namedbuffer(
+    'envelope',
+    [
+        cmdid(ENVELOPE),  # [0:1]
+        pad(1),           # [1:2]
+        count,            # [2:4]
+    ]
+)
+
+message_length = struct.Struct('>H')
+
 Ping = namedbuffer(
     'ping',
     [
@@ -218,6 +255,7 @@ CMDID_MESSAGE = {
     DIRECTTRANSFER: DirectTransfer,
     MEDIATEDTRANSFER: MediatedTransfer,
     REFUNDTRANSFER: RefundTransfer,
+    MULTIACK: MultiAck,
 }
 
 
@@ -242,3 +280,131 @@ def wrap(data):
         return
 
     return message
+
+
+def unpack(data):
+    ''' Try to decode the fields of the message in `data`, might return None
+    if the data is invalid.
+
+    Contrary to `wrap` all the fields are decoded at once, the result is a
+    namedtuple that does not reference `data`.
+    '''
+    try:
+        first_byte = data[0]
+    except IndexError:
+        log.warn('data is empty')
+        return
+
+    try:
+        message_type = CMDID_MESSAGE[first_byte]
+    except KeyError:
+        log.error('unknown cmdid %s', first_byte)
+        return
+
+    if len(data) != message_type.size:
+        log.error('trying to decode invalid message')
+        return
+
+    return message_type.unpack_from(data)
+
+
+def unpack_multiack(data):
+    ''' Try to decode a MultiAck, returns the namedtuple of its header and the
+    list of echo hashes, None if the data is invalid.
+    '''
+    header_size = MultiAck.size
+    echoes_size = len(data) - header_size
+
+    if echoes_size < 0 or echoes_size % ECHO_SIZE:
+        log.error('trying to decode invalid message')
+        return
+
+    header = MultiAck.unpack_from(data)
+    echoes = [
+        bytes(data[start:start + ECHO_SIZE])
+        for start in range(header_size, len(data), ECHO_SIZE)
+    ]
+
+    if header.count != len(echoes):
+        log.error('trying to decode invalid message')
+        return
+
+    return header, echoes
+
+
+def pack_envelope(messages_data):
+    ''' Returns a datagram with the encoded messages from `messages_data`, a
+    single message is returned as is.
+    '''
+    if len(messages_data) == 1:
+        return messages_data[0]
+
+    header = buffer_for(Envelope)
+    Envelope.pack_into(header, 0, {'count': len(messages_data)})
+    header[0] = ENVELOPE
+
+    parts = [bytes(header)]
+    for data in messages_data:
+        parts.append(message_length.pack(len(data)))
+        parts.append(data)
+
+    return b''.join(parts)
+
+
+def pack_envelopes(messages_data, max_size):
+    ''' Pack the encoded messages from `messages_data` in order into as few
+    datagrams of at most `max_size` bytes as possible.
+    '''
+    datagrams = list()
+    batch = list()
+    batch_size = Envelope.size
+
+    for data in messages_data:
+        item_size = message_length.size + len(data)
+
+        if batch and batch_size + item_size > max_size:
+            datagrams.append(pack_envelope(batch))
+            batch = list()
+            batch_size = Envelope.size
+
+        batch.append(data)
+        batch_size += item_size
+
+    if batch:
+        datagrams.append(pack_envelope(batch))
+
+    return datagrams
+
+
+def unpack_envelope(data):
+    ''' Try to split an envelope into the encoded messages it carries, returns
+    None if the data is invalid.
+    '''
+    if len(data) < Envelope.size:
+        log.error('trying to decode invalid envelope')
+        return
+
+    header = Envelope.unpack_from(data)
+
+    messages_data = list()
+    start = Envelope.size
+    for _ in range(header.count):
+        if start + message_length.size > len(data):
+            log.error('trying to decode invalid envelope')
+            return
+
+        length, = message_length.unpack_from(data, start)
+        start += message_length.size
+
+        if start + length > len(data):
+            log.error('trying to decode invalid envelope')
+            return
+
+        messages_data.append(bytes(data[start:start + length]))
+        start += length
+
+    if start != len(data):
+        log.error('trying to decode invalid envelope')
+        return
+
+    return messages_data
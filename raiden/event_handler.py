@@ -6,16 +6,37 @@ import gevent
 from ethereum import slogging
 
 from raiden.messages import (
+    decode,
     RevealSecret,
     SecretRequest,
 )
+from raiden.transfer.architecture import StateManager
+from raiden.transfer.mediated_transfer import (
+    initiator,
+    mediator,
+)
+from raiden.transfer.mediated_transfer import target as target_task
 from raiden.transfer.mediated_transfer.state_change import (
+    ActionCancelRoute,
+    ActionInitInitiator,
+    ActionInitMediator,
+    ActionInitTarget,
     ContractReceiveBalance,
     ContractReceiveClosed,
     ContractReceiveNewChannel,
     ContractReceiveSettled,
     ContractReceiveTokenAdded,
     ContractReceiveWithdraw,
+    ReceiveBalanceProof,
+    ReceiveSecretRequest,
+    ReceiveSecretReveal,
+    ReceiveTransferRefund,
+)
+from raiden.transfer.state_change import (
+    ActionCancelTransfer,
+    ActionRegisterTransfer,
+    ActionRouteChange,
+    Block,
 )
 from raiden.transfer.events import (
     EventTransferSentSuccess,
@@ -49,6 +70,15 @@ UNEVENTFUL_EVENTS = (
     ContractSendWithdraw,
 )
 
+# State changes that are dispatched to the state managers of a single transfer
+REPLAY_BY_IDENTIFIER = (
+    ActionCancelRoute,
+    ActionCancelTransfer,
+    ActionRouteChange,
+    ReceiveBalanceProof,
+    ReceiveSecretRequest,
+)
+
 
 class StateMachineEventHandler(object):
     def __init__(self, raiden):
@@ -56,40 +86,112 @@ class StateMachineEventHandler(object):
 
     def log_and_dispatch_to_all_tasks(self, state_change):
         """Log a state change, dispatch it to all state managers and log generated events"""
-        state_change_id = self.raiden.transaction_log.log(state_change)
         manager_lists = self.raiden.identifier_to_statemanagers.itervalues()
-
-        for manager in itertools.chain(*manager_lists):
-            events = self.dispatch(manager, state_change)
-            self.raiden.transaction_log.log_events(
-                state_change_id,
-                events,
-                self.raiden.get_block_number()
-            )
+        self.log_and_dispatch_to_managers(itertools.chain(*manager_lists), state_change)
 
     def log_and_dispatch_by_identifier(self, identifier, state_change):
         """Log a state change, dispatch it to the state manager corresponding to `idenfitier`
         and log generated events"""
-        state_change_id = self.raiden.transaction_log.log(state_change)
         manager_list = self.raiden.identifier_to_statemanagers[identifier]
+        self.log_and_dispatch_to_managers(manager_list, state_change)
 
-        for manager in manager_list:
-            events = self.dispatch(manager, state_change)
-            self.raiden.transaction_log.log_events(
+    def log_and_dispatch(self, state_manager, state_change):
+        """Log a state change, dispatch it to the given state manager and log generated events"""
+        self.log_and_dispatch_to_managers([state_manager], state_change)
+
+    def log_and_dispatch_to_managers(self, state_managers, state_change):
+        """ Log a state change, dispatch it to `state_managers` and log all
+        the generated events.
+
+        The events of all the state managers are accumulated and written at
+        once, the state change and its events are committed together instead
+        of once per state manager.
+
+        The events are executed only after they are written, no message is
+        sent for a state change that is not logged yet.
+        """
+        transaction_log = self.raiden.transaction_log
+        state_change_id = transaction_log.log(state_change, events_pending=True)
+
+        all_events = list()
+        try:
+            for manager in state_managers:
+                all_events.extend(manager.dispatch(state_change))
+        finally:
+            transaction_log.log_events(
                 state_change_id,
-                events,
+                all_events,
                 self.raiden.get_block_number()
             )
 
-    def log_and_dispatch(self, state_manager, state_change):
-        """Log a state change, dispatch it to the given state manager and log generated events"""
-        state_change_id = self.raiden.transaction_log.log(state_change)
-        events = self.dispatch(state_manager, state_change)
-        self.raiden.transaction_log.log_events(
-            state_change_id,
-            events,
-            self.raiden.get_block_number()
-        )
+        for event in all_events:
+            self.on_event(event)
+
+    def replay(self, state_change):
+        """ Apply a state change that was logged after the last snapshot.
+
+        The state change is routed to the same state managers it was
+        dispatched to originally, the resulting events were handled before the
+        snapshot was restored and are not executed nor logged again. The
+        logged transfers are registered again in their channels and the ones
+        sent by this node are queued to be sent again.
+        """
+        identifier_to_statemanagers = self.raiden.identifier_to_statemanagers
+
+        if isinstance(state_change, ActionRegisterTransfer):
+            try:
+                channel = self.raiden.find_channel_by_address(state_change.channel_address)
+            except ValueError:
+                # the channel was settled and is not restored
+                return
+
+            transfer = decode(state_change.transfer_data)
+            channel.register_transfer(state_change.block_number, transfer)
+
+            # The restored send queues only have the messages that were not
+            # acknowledged when the snapshot was taken, the transfers sent
+            # after it are queued again. The partner replays the Ack of the
+            # ones it already received.
+            if transfer.sender == self.raiden.address:
+                self.raiden.send_async(channel.partner_address, transfer)
+
+        elif isinstance(state_change, ActionInitInitiator):
+            state_manager = StateManager(initiator.state_transition, None)
+            state_manager.dispatch(state_change)
+            identifier = state_change.transfer.identifier
+            identifier_to_statemanagers[identifier].append(state_manager)
+
+        elif isinstance(state_change, ActionInitMediator):
+            state_manager = StateManager(mediator.state_transition, None)
+            state_manager.dispatch(state_change)
+            identifier = state_change.from_transfer.identifier
+            identifier_to_statemanagers[identifier].append(state_manager)
+
+        elif isinstance(state_change, ActionInitTarget):
+            state_manager = StateManager(target_task.state_transition, None)
+            state_manager.dispatch(state_change)
+            identifier = state_change.from_transfer.identifier
+            identifier_to_statemanagers[identifier].append(state_manager)
+
+        # A secret reveal is dispatched either to all state managers or by
+        # identifier, the state managers ignore secrets for other hashlocks
+        elif isinstance(state_change, (Block, ReceiveSecretReveal)):
+            manager_lists = identifier_to_statemanagers.itervalues()
+            for manager in itertools.chain(*manager_lists):
+                manager.dispatch(state_change)
+
+        elif isinstance(state_change, ReceiveTransferRefund):
+            identifier = state_change.transfer.identifier
+            for manager in identifier_to_statemanagers.get(identifier, list()):
+                manager.dispatch(state_change)
+
+        elif isinstance(state_change, REPLAY_BY_IDENTIFIER):
+            identifier = state_change.identifier
+            for manager in identifier_to_statemanagers.get(identifier, list()):
+                manager.dispatch(state_change)
+
+        # The direct transfers and blockchain state changes are only logged,
+        # they are not dispatched to a state manager
 
     def dispatch(self, state_manager, state_change):
         all_events = state_manager.dispatch(state_change)
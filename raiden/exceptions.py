@@ -168,3 +168,8 @@ class TransactionThrew(RaidenError):
         super(TransactionThrew, self).__init__(
             '{} transaction threw. Receipt={}'.format(txname, receipt)
         )
+
+
+class CorruptedTransactionLog(RaidenError):
+    """Raised when a record of the transaction log fails its checksum and
+    cannot be explained by an interrupted write."""
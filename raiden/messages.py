@@ -2,6 +2,7 @@
 from ethereum.slogging import getLogger
 from ethereum.utils import big_endian_to_int
 
+from raiden.constants import UDP_MAX_MESSAGE_SIZE
 from raiden.encoding import messages, signing
 from raiden.encoding.format import buffer_for
 from raiden.encoding.signing import recover_publickey
@@ -10,6 +11,7 @@ from raiden.transfer.state import BalanceProofState
 
 __all__ = (
     'Ack',
+    'MultiAck',
     'Ping',
     'SecretRequest',
     'Secret',
@@ -59,7 +61,12 @@ def assert_transfer_values(identifier, token, recipient):
 
 
 def decode(data):
-    klass = CMDID_TO_CLASS[data[0]]
+    try:
+        klass = CMDID_TO_CLASS[data[0]]
+    except (IndexError, KeyError):
+        log.error('unknown cmdid')
+        return
+
     return klass.decode(data)
 
 
@@ -70,10 +77,14 @@ class MessageHashable(object):
 class Message(MessageHashable):
     # pylint: disable=no-member
 
+    def __setattr__(self, name, value):
+        # any change to the message invalidates its serialized form
+        self.__dict__['_encoded'] = None
+        super(Message, self).__setattr__(name, value)
+
     @property
     def hash(self):
-        packed = self.packed()
-        return sha3(packed.data)
+        return sha3(self.encode())
 
     def __eq__(self, other):
         return isinstance(other, self.__class__) and self.hash == other.hash
@@ -85,30 +96,36 @@ class Message(MessageHashable):
         return not self.__eq__(other)
 
     def __repr__(self):
-        packed = self.packed()
-
         return '<{klass} [msghash={msghash}]>'.format(
             klass=self.__class__.__name__,
-            msghash=pex(sha3(packed.data)),
+            msghash=pex(self.hash),
         )
 
     @classmethod
-    def decode(cls, packed):
-        packed = messages.wrap(packed)
+    def decode(cls, data):
+        packed = messages.unpack(data)
         return cls.unpack(packed)
 
     def encode(self):
-        packed = self.packed()
-        return bytes(packed.data)
+        encoded = self.__dict__.get('_encoded')
+
+        if encoded is None:
+            klass = messages.CMDID_MESSAGE[self.cmdid]
+            values = dict()
+            self.pack(values)
+
+            data = buffer_for(klass)
+            klass.pack_into(data, 0, values)
+            data[0] = self.cmdid
+
+            encoded = bytes(data)
+            self.__dict__['_encoded'] = encoded
+
+        return encoded
 
     def packed(self):
         klass = messages.CMDID_MESSAGE[self.cmdid]
-        data = buffer_for(klass)
-        data[0] = self.cmdid
-        packed = klass(data)
-        self.pack(packed)
-
-        return packed
+        return klass(bytearray(self.encode()))
 
 
 class SignedMessage(Message):
@@ -122,29 +139,27 @@ class SignedMessage(Message):
 
     def sign(self, private_key, node_address):
         """ Sign message using `private_key`. """
-        packed = self.packed()
+        klass = messages.CMDID_MESSAGE[self.cmdid]
 
-        field = type(packed).fields_spec[-1]
+        field = klass.fields_spec[-1]
         assert field.name == 'signature', 'signature is not the last field'
 
         # this slice must be from the end of the buffer
-        message_data = packed.data[:-field.size_bytes]
+        message_data = self.encode()[:-field.size_bytes]
         signature = signing.sign(message_data, private_key)
 
-        packed.signature = signature
-
         self.sender = node_address
         self.signature = signature
 
     @classmethod
     def decode(cls, data):
-        packed = messages.wrap(data)
+        packed = messages.unpack(data)
 
         if packed is None:
             return
 
         # signature must be at the end
-        message_type = type(packed)
+        message_type = messages.CMDID_MESSAGE[data[0]]
         signature = message_type.fields_spec[-1]
         assert signature.name == 'signature', 'signature is not the last field'
 
@@ -168,6 +183,7 @@ class SignedMessage(Message):
 
         message = cls.unpack(packed)  # pylint: disable=no-member
         message.sender = publickey_to_address(publickey)
+        message.__dict__['_encoded'] = bytes(data)
         return message
 
 
@@ -181,26 +197,24 @@ class EnvelopeMessage(SignedMessage):
 
     @property
     def message_hash(self):
-        packed = self.packed()
-        klass = type(packed)
+        klass = messages.CMDID_MESSAGE[self.cmdid]
 
         field = klass.fields_spec[-1]
         assert field.name == 'signature', 'signature is not the last field'
 
-        data = packed.data
+        data = self.encode()
         message_data = data[:-field.size_bytes]
         message_hash = sha3(message_data)
 
         return message_hash
 
     def sign(self, private_key, node_address):
-        packed = self.packed()
-        klass = type(packed)
+        klass = messages.CMDID_MESSAGE[self.cmdid]
 
         field = klass.fields_spec[-1]
         assert field.name == 'signature', 'signature is not the last field'
 
-        data = packed.data
+        data = self.encode()
         nonce = klass.get_bytes_from(data, 'nonce')
         transferred_amount = klass.get_bytes_from(data, 'transferred_amount')
         locksroot = klass.get_bytes_from(data, 'locksroot')
@@ -210,20 +224,18 @@ class EnvelopeMessage(SignedMessage):
         data_to_sign = nonce + transferred_amount + locksroot + channel_address + message_hash
         signature = signing.sign(data_to_sign, private_key)
 
-        packed.signature = signature
-
         self.sender = node_address
         self.signature = signature
 
     @classmethod
     def decode(cls, data):
-        packed = messages.wrap(data)
+        packed = messages.unpack(data)
 
         if packed is None:
             return
 
         # signature must be at the end
-        message_type = type(packed)
+        message_type = messages.CMDID_MESSAGE[data[0]]
         signature = message_type.fields_spec[-1]
         assert signature.name == 'signature', 'signature is not the last field'
 
@@ -257,6 +269,7 @@ class EnvelopeMessage(SignedMessage):
 
         message = cls.unpack(packed)  # pylint: disable=no-member
         message.sender = publickey_to_address(publickey)
+        message.__dict__['_encoded'] = bytes(data)
         return message
 
     def to_balanceproof(self):
@@ -276,24 +289,30 @@ class Ack(Message):
 
     We don't sign Acks because attack vector can be mitigated and to speed up
     things.
+
+    `flags` advertises the optional features of the sender, e.g.
+    `ACK_FLAG_MULTIACK` if it understands `MultiAck`.
     """
     cmdid = messages.ACK
 
-    def __init__(self, sender, echo):
+    def __init__(self, sender, echo, flags=0):
         super(Ack, self).__init__()
         self.sender = sender
         self.echo = echo
+        self.flags = flags
 
     @staticmethod
     def unpack(packed):
         return Ack(
             packed.sender,
             packed.echo,
+            packed.flags,
         )
 
-    def pack(self, packed):
-        packed.echo = self.echo
-        packed.sender = self.sender
+    def pack(self, values):
+        values['flags'] = self.flags
+        values['echo'] = self.echo
+        values['sender'] = self.sender
 
     def __repr__(self):
         return '<{} [echohash:{}]>'.format(
@@ -302,6 +321,57 @@ class Ack(Message):
         )
 
 
+class MultiAck(Message):
+    """ Confirms several messages at once, it is only sent to nodes that
+    advertised `ACK_FLAG_MULTIACK` in their Acks.
+    """
+    cmdid = messages.MULTIACK
+
+    # the echo hashes that fit in a single packet
+    max_echoes = (UDP_MAX_MESSAGE_SIZE - messages.MultiAck.size) // messages.ECHO_SIZE
+
+    def __init__(self, sender, echoes):
+        super(MultiAck, self).__init__()
+        self.sender = sender
+        self.echoes = echoes
+
+    @classmethod
+    def decode(cls, data):
+        unpacked = messages.unpack_multiack(data)
+
+        if unpacked is None:
+            return
+
+        header, echoes = unpacked
+        return MultiAck(header.sender, echoes)
+
+    def pack(self, values):
+        values['count'] = len(self.echoes)
+        values['sender'] = self.sender
+
+    def encode(self):
+        encoded = self.__dict__.get('_encoded')
+
+        if encoded is None:
+            values = dict()
+            self.pack(values)
+
+            header = buffer_for(messages.MultiAck)
+            messages.MultiAck.pack_into(header, 0, values)
+            header[0] = self.cmdid
+
+            encoded = bytes(header) + b''.join(self.echoes)
+            self.__dict__['_encoded'] = encoded
+
+        return encoded
+
+    def __repr__(self):
+        return '<{} [echohashes:{}]>'.format(
+            self.__class__.__name__,
+            ','.join(pex(echo) for echo in self.echoes),
+        )
+
+
 class Ping(SignedMessage):
     """ Ping, should be responded by an Ack message. """
     cmdid = messages.PING
@@ -316,9 +386,9 @@ class Ping(SignedMessage):
         ping.signature = packed.signature
         return ping
 
-    def pack(self, packed):
-        packed.nonce = self.nonce
-        packed.signature = self.signature
+    def pack(self, values):
+        values['nonce'] = self.nonce
+        values['signature'] = self.signature
 
 
 class SecretRequest(SignedMessage):
@@ -345,11 +415,11 @@ class SecretRequest(SignedMessage):
         secret_request.signature = packed.signature
         return secret_request
 
-    def pack(self, packed):
-        packed.identifier = self.identifier
-        packed.hashlock = self.hashlock
-        packed.amount = self.amount
-        packed.signature = self.signature
+    def pack(self, values):
+        values['identifier'] = self.identifier
+        values['hashlock'] = self.hashlock
+        values['amount'] = self.amount
+        values['signature'] = self.signature
 
 
 class Secret(EnvelopeMessage):
@@ -428,14 +498,14 @@ class Secret(EnvelopeMessage):
         secret.signature = packed.signature
         return secret
 
-    def pack(self, packed):
-        packed.identifier = self.identifier
-        packed.nonce = self.nonce
-        packed.channel = self.channel
-        packed.transferred_amount = self.transferred_amount
-        packed.locksroot = self.locksroot
-        packed.secret = self.secret
-        packed.signature = self.signature
+    def pack(self, values):
+        values['identifier'] = self.identifier
+        values['nonce'] = self.nonce
+        values['channel'] = self.channel
+        values['transferred_amount'] = self.transferred_amount
+        values['locksroot'] = self.locksroot
+        values['secret'] = self.secret
+        values['signature'] = self.signature
 
 
 class RevealSecret(SignedMessage):
@@ -472,9 +542,9 @@ class RevealSecret(SignedMessage):
         reveal_secret.signature = packed.signature
         return reveal_secret
 
-    def pack(self, packed):
-        packed.secret = self.secret
-        packed.signature = self.signature
+    def pack(self, values):
+        values['secret'] = self.secret
+        values['signature'] = self.signature
 
 
 class DirectTransfer(EnvelopeMessage):
@@ -546,15 +616,15 @@ class DirectTransfer(EnvelopeMessage):
 
         return transfer
 
-    def pack(self, packed):
-        packed.identifier = self.identifier
-        packed.nonce = self.nonce
-        packed.token = self.token
-        packed.channel = self.channel
-        packed.transferred_amount = self.transferred_amount
-        packed.recipient = self.recipient
-        packed.locksroot = self.locksroot
-        packed.signature = self.signature
+    def pack(self, values):
+        values['identifier'] = self.identifier
+        values['nonce'] = self.nonce
+        values['token'] = self.token
+        values['channel'] = self.channel
+        values['transferred_amount'] = self.transferred_amount
+        values['recipient'] = self.recipient
+        values['locksroot'] = self.locksroot
+        values['signature'] = self.signature
 
     def __repr__(self):
         representation = (
@@ -604,20 +674,30 @@ class Lock(MessageHashable):
         self.amount = amount
         self.expiration = expiration
         self.hashlock = hashlock
-        self._asbytes = None
+
+    def __setattr__(self, name, value):
+        # any change to the lock invalidates its serialized form, the
+        # transfers that carry the lock check it in `LockedTransfer.encode`
+        self.__dict__['_asbytes'] = None
+        super(Lock, self).__setattr__(name, value)
 
     @property
     def as_bytes(self):
+        """ The serialized lock, the same object is returned until the lock
+        is changed.
+        """
         if self._asbytes is None:
-            packed = messages.Lock(buffer_for(messages.Lock))
-            packed.amount = self.amount
-            packed.expiration = self.expiration
-            packed.hashlock = self.hashlock
+            data = buffer_for(messages.Lock)
+            messages.Lock.pack_into(data, 0, {
+                'amount': self.amount,
+                'expiration': self.expiration,
+                'hashlock': self.hashlock,
+            })
 
-            self._asbytes = packed.data
+            # convert bytearray to bytes
+            self.__dict__['_asbytes'] = bytes(data)
 
-        # convert bytearray to bytes
-        return bytes(self._asbytes)
+        return self._asbytes
 
     @classmethod
     def from_bytes(cls, serialized):
@@ -683,6 +763,26 @@ class LockedTransfer(EnvelopeMessage):
         self.locksroot = locksroot
         self.lock = lock
 
+    @classmethod
+    def decode(cls, data):
+        message = super(LockedTransfer, cls).decode(data)
+
+        if message is not None:
+            message.__dict__['_encoded_lock'] = message.lock.as_bytes
+
+        return message
+
+    def encode(self):
+        # The lock is mutable and may be shared with other transfers, the
+        # cached encoding is only valid for the lock it was made with
+        lock_bytes = self.lock.as_bytes
+
+        if self.__dict__.get('_encoded_lock') is not lock_bytes:
+            self.__dict__['_encoded'] = None
+            self.__dict__['_encoded_lock'] = lock_bytes
+
+        return super(LockedTransfer, self).encode()
+
     def to_mediatedtransfer(self, target, initiator='', fee=0):
         return MediatedTransfer(
             self.identifier,
@@ -734,21 +834,21 @@ class LockedTransfer(EnvelopeMessage):
         locked_transfer.signature = packed.signature
         return locked_transfer
 
-    def pack(self, packed):
-        packed.identifier = self.identifier
-        packed.nonce = self.nonce
-        packed.token = self.token
-        packed.channel = self.channel
-        packed.transferred_amount = self.transferred_amount
-        packed.recipient = self.recipient
-        packed.locksroot = self.locksroot
+    def pack(self, values):
+        values['identifier'] = self.identifier
+        values['nonce'] = self.nonce
+        values['token'] = self.token
+        values['channel'] = self.channel
+        values['transferred_amount'] = self.transferred_amount
+        values['recipient'] = self.recipient
+        values['locksroot'] = self.locksroot
 
         lock = self.lock
-        packed.amount = lock.amount
-        packed.expiration = lock.expiration
-        packed.hashlock = lock.hashlock
+        values['amount'] = lock.amount
+        values['expiration'] = lock.expiration
+        values['hashlock'] = lock.hashlock
 
-        packed.signature = self.signature
+        values['signature'] = self.signature
 
 
 class MediatedTransfer(LockedTransfer):
@@ -855,24 +955,24 @@ class MediatedTransfer(LockedTransfer):
         mediated_transfer.signature = packed.signature
         return mediated_transfer
 
-    def pack(self, packed):
-        packed.identifier = self.identifier
-        packed.nonce = self.nonce
-        packed.token = self.token
-        packed.channel = self.channel
-        packed.transferred_amount = self.transferred_amount
-        packed.recipient = self.recipient
-        packed.locksroot = self.locksroot
-        packed.target = self.target
-        packed.initiator = self.initiator
-        packed.fee = self.fee
+    def pack(self, values):
+        values['identifier'] = self.identifier
+        values['nonce'] = self.nonce
+        values['token'] = self.token
+        values['channel'] = self.channel
+        values['transferred_amount'] = self.transferred_amount
+        values['recipient'] = self.recipient
+        values['locksroot'] = self.locksroot
+        values['target'] = self.target
+        values['initiator'] = self.initiator
+        values['fee'] = self.fee
 
         lock = self.lock
-        packed.amount = lock.amount
-        packed.expiration = lock.expiration
-        packed.hashlock = lock.hashlock
+        values['amount'] = lock.amount
+        values['expiration'] = lock.expiration
+        values['hashlock'] = lock.hashlock
 
-        packed.signature = self.signature
+        values['signature'] = self.signature
 
 
 class RefundTransfer(MediatedTransfer):
@@ -909,6 +1009,7 @@ class RefundTransfer(MediatedTransfer):
 
 CMDID_TO_CLASS = {
     messages.ACK: Ack,
+    messages.MULTIACK: MultiAck,
     messages.PING: Ping,
     messages.SECRETREQUEST: SecretRequest,
     messages.SECRET: Secret,
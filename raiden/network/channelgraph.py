@@ -262,6 +262,19 @@ class ChannelGraph(object):
             self.partneraddress_to_channel[partner_state.address] = channel
             self.address_to_channel[channel_address] = channel
 
+    def remove_channel(self, channel):
+        """ Remove a channel this node participates in, e.g. a channel
+        restored from a snapshot that does not match the blockchain.
+        """
+        del self.address_to_channel[channel.channel_address]
+
+        partner_address = channel.partner_address
+        if self.partneraddress_to_channel.get(partner_address) is channel:
+            del self.partneraddress_to_channel[partner_address]
+
+            if self.has_channel(self.our_address, partner_address):
+                self.remove_path(self.our_address, partner_address)
+
     def get_channel_by_contract_address(self, netting_channel_address):
         """ Return the channel with `netting_channel_address`.
 
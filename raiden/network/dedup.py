@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+import struct
+from collections import MutableMapping, OrderedDict
+from time import time
+
+# With 10 bits per hash and 7 positions a hash that was never added is
+# reported as present about 1% of the time
+FILTER_BITS_PER_HASH = 10
+FILTER_POSITIONS = struct.Struct('>7I')
+
+
+class HashFilter(object):
+    """ Bloom filter of keccak hashes.
+
+    The hashes are uniformly distributed, their first bytes are used as the
+    bit positions instead of hashing them again. A hash that was added is
+    always reported as present, a hash that was not is reported as present
+    with a small probability.
+
+    Args:
+        capacity (int): Number of hashes the filter is sized for.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.size = max(capacity, 1) * FILTER_BITS_PER_HASH
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, echohash):
+        size = self.size
+        for value in FILTER_POSITIONS.unpack_from(echohash):
+            yield value % size
+
+    def add(self, echohash):
+        bits = self.bits
+        for position in self._positions(echohash):
+            bits[position >> 3] |= 1 << (position & 7)
+
+        self.count += 1
+
+    def __contains__(self, echohash):
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(echohash)
+        )
+
+
+class AckCache(MutableMapping):
+    """ Bounded mapping of the echohash of the received messages to the
+    `(receiver_address, messagedata)` of their Ack.
+
+    The entries are kept in memory in least recently used order, an entry is
+    evicted once `maxsize` entries are held or if it was not used for `ttl`
+    seconds. Evicted entries are spilled to `storage`, so the Ack of an old
+    message can still be replayed, lookups that miss the memory fall back to
+    it.
+
+    Most lookups are for new messages, which are in neither. The echohashes
+    in the storage are tracked by a HashFilter, so the storage is only
+    queried for the hashes that were likely spilled.
+
+    Iteration and `len` only cover the entries held in memory, these are the
+    ones saved in the snapshots.
+
+    Args:
+        maxsize (int): Maximum number of entries held in memory.
+        ttl (float): Seconds an unused entry is held in memory, None to
+            evict only on size.
+        storage: Object with `write_acks(acks)`, `get_ack(echohash)` and
+            `get_ack_hashes()`, usually the StateChangeLog, None to discard
+            the evicted entries.
+        time_function (callable): Returns the current time in seconds.
+    """
+
+    def __init__(self, maxsize, ttl=None, storage=None, time_function=None):
+        if maxsize < 1:
+            raise ValueError('maxsize must be a positive integer')
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.storage = storage
+        self._time = time_function or time
+
+        # echohash -> (last use, ack), the first entry is the least recently
+        # used
+        self.entries = OrderedDict()
+
+        self.spilled = None
+        if storage is not None:
+            self.rebuild_filter()
+
+    def rebuild_filter(self):
+        """ Track the echohashes in the storage with a new filter, sized
+        for twice as many hashes so that it is not rebuilt too often.
+        """
+        echohashes = self.storage.get_ack_hashes()
+        spilled = HashFilter(max(2 * len(echohashes), self.maxsize))
+
+        for echohash in echohashes:
+            spilled.add(echohash)
+
+        self.spilled = spilled
+
+    def __getitem__(self, echohash):
+        entry = self.entries.pop(echohash, None)
+
+        if entry is not None:
+            ack = entry[1]
+            self.entries[echohash] = (self._time(), ack)
+            return ack
+
+        ack = None
+        if self.storage is not None and echohash in self.spilled:
+            ack = self.storage.get_ack(echohash)
+
+        if ack is None:
+            raise KeyError(echohash)
+
+        return ack
+
+    def __setitem__(self, echohash, ack):
+        self.entries.pop(echohash, None)
+        self.entries[echohash] = (self._time(), ack)
+        self.evict()
+
+    def __delitem__(self, echohash):
+        del self.entries[echohash]
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, echohash):
+        try:
+            self[echohash]
+        except KeyError:
+            return False
+        return True
+
+    # Reading all the entries, e.g. for a snapshot, must not change their
+    # order of use
+    def iteritems(self):
+        for echohash, (_, ack) in self.entries.iteritems():
+            yield echohash, ack
+
+    def items(self):
+        return list(self.iteritems())
+
+    def itervalues(self):
+        for _, ack in self.entries.itervalues():
+            yield ack
+
+    def values(self):
+        return list(self.itervalues())
+
+    def evict(self):
+        """ Spill the entries over `maxsize` and the expired ones. """
+        evicted = list()
+
+        while len(self.entries) > self.maxsize:
+            evicted.append(self.entries.popitem(last=False))
+
+        if self.ttl is not None:
+            expired_before = self._time() - self.ttl
+
+            # the entries are sorted by last use, the expired ones are first
+            expired = list()
+            for echohash, entry in self.entries.iteritems():
+                if entry[0] >= expired_before:
+                    break
+                expired.append((echohash, entry))
+
+            for echohash, _ in expired:
+                del self.entries[echohash]
+
+            evicted.extend(expired)
+
+        if evicted and self.storage is not None:
+            self.storage.write_acks([
+                (echohash, last_use, receiver_address, messagedata)
+                for echohash, (last_use, (receiver_address, messagedata)) in evicted
+            ])
+
+            # the hashes of the pruned acks are dropped by the rebuild
+            if self.spilled.count + len(evicted) > self.spilled.capacity:
+                self.rebuild_filter()
+            else:
+                for echohash, _ in evicted:
+                    self.spilled.add(echohash)
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import logging
 import random
+import time
 from collections import (
+    deque,
     namedtuple,
     defaultdict,
 )
@@ -30,8 +32,26 @@ from raiden.constants import (
 )
 from raiden.settings import (
     CACHE_TTL,
+    DEFAULT_PROTOCOL_ACK_CACHE_SIZE,
+    DEFAULT_PROTOCOL_ACK_CACHE_TTL,
+    DEFAULT_PROTOCOL_ACK_DELAY,
+    DEFAULT_PROTOCOL_BATCH_MESSAGES,
+    DEFAULT_PROTOCOL_DECODE_CACHE_SIZE,
+    DEFAULT_PROTOCOL_SCHEDULER_RESOLUTION,
+    DEFAULT_PROTOCOL_SCHEDULER_WORKERS,
+    DEFAULT_PROTOCOL_SEND_WINDOW,
 )
-from raiden.messages import decode, Ack, Ping, SignedMessage
+from raiden.encoding.messages import (
+    ACK_FLAG_ENVELOPE,
+    ACK_FLAG_MULTIACK,
+    ENVELOPE,
+    pack_envelopes,
+    unpack_envelope,
+)
+from raiden.messages import decode, Ack, MultiAck, Ping, SignedMessage
+from raiden.network.dedup import AckCache
+from raiden.network.scheduler import ScheduledTask, Scheduler
+from raiden.network.verification import VerificationPool
 from raiden.utils import isaddress, sha3, pex
 from raiden.utils.notifying_queue import NotifyingQueue
 
@@ -45,6 +65,9 @@ SentMessageState = namedtuple('SentMessageState', (
     'async_result',
     'receiver_address',
 ))
+# The optional features this node advertises in its Acks
+ACK_FLAGS = ACK_FLAG_MULTIACK | ACK_FLAG_ENVELOPE
+
 HealthEvents = namedtuple('HealthEvents', (
     'event_healthy',
     'event_unhealthy',
@@ -54,6 +77,13 @@ NODE_NETWORK_UNKNOWN = 'unknown'
 NODE_NETWORK_UNREACHABLE = 'unreachable'
 NODE_NETWORK_REACHABLE = 'reachable'
 
+# States of the scheduled HealthCheck
+HEALTHCHECK_START = 'start'
+HEALTHCHECK_ENDPOINT = 'endpoint'
+HEALTHCHECK_IDLE = 'idle'
+HEALTHCHECK_PINGING = 'pinging'
+HEALTHCHECK_UNREACHABLE = 'unreachable'
+
 # GOALS:
 # - Each netting channel must have the messages processed in-order, the
 # protocol must detect unacknowledged messages and retry them.
@@ -153,63 +183,118 @@ def wait_recovery(event_stop, event_healthy):
     gevent.sleep(random.random())
 
 
-def retry_with_recovery(
-        protocol,
-        data,
-        receiver_address,
-        event_stop,
-        event_healthy,
-        event_unhealthy,
-        backoff):
-    """ Send data while the node is healthy until it's acknowledged.
-
-    Note:
-        backoff must be an infinite iterator, otherwise this task will
-        become a hot loop.
-    """
+class InflightMessage(object):
+    """ A message from the send window waiting for its Ack. """
 
-    # The underlying unhealthy will be cleared, care must be taken to properly
-    # clear stop_or_unhealthy too.
-    stop_or_unhealthy = event_first_of(
-        event_stop,
-        event_unhealthy,
+    __slots__ = (
+        'async_result',
+        'backoff',
+        'deadline',
     )
 
-    acknowledged = False
-    while not event_stop.is_set() and not acknowledged:
+    def __init__(self, async_result, backoff, deadline):
+        self.async_result = async_result
+        self.backoff = backoff
+        self.deadline = deadline
 
-        # Packets must not be sent to an unhealthy node, nor should the task
-        # wait for it to become available if the message has been acknowledged.
-        if event_unhealthy.is_set():
-            wait_recovery(
-                event_stop,
-                event_healthy,
-            )
 
-            # Assume wait_recovery returned because unhealthy was cleared and
-            # continue execution, this is safe to do because event_stop is
-            # checked below.
-            stop_or_unhealthy.clear()
+class SendWindow(object):
+    """ The messages from the head of `queue` that are in flight.
 
-            if event_stop.is_set():
-                return
+    Up to `window_size` messages from the head of the queue are in flight,
+    each one is retransmitted with its own backoff until it's acknowledged.
+    A message is removed from the queue only once it and all the messages
+    before it are acknowledged. The messages are sent in queue order and the
+    receiver handles the messages of a sender in the order they arrive, only
+    a message reordered by the network is dropped by the receiver's nonce
+    check and retransmitted after its predecessor.
 
-        acknowledged = retry(
+    `wakeup` is linked to the result of every message in flight.
+    """
+
+    def __init__(
+            self,
             protocol,
-            data,
             receiver_address,
+            queue,
+            window_size,
+            message_retries,
+            message_retry_timeout,
+            message_retry_max_timeout,
+            wakeup):
+
+        if window_size < 1:
+            raise ValueError('window_size must be a positive integer')
+
+        self.protocol = protocol
+        self.receiver_address = receiver_address
+        self.queue = queue
+        self.window_size = window_size
+        self.message_retries = message_retries
+        self.message_retry_timeout = message_retry_timeout
+        self.message_retry_max_timeout = message_retry_max_timeout
+        self.wakeup = wakeup
+
+        self.inflight = dict()
+
+    def retransmit_all(self):
+        """ Retransmit the whole window with the next call to `send`. """
+        for message in self.inflight.itervalues():
+            message.deadline = 0
+
+    def send(self, now):
+        """ Drop the acknowledged messages, send the new messages and the ones
+        that timed out, returns the next deadline or None.
+        """
+        queue = self.queue
+        inflight = self.inflight
 
-            # retry will stop when this event is set, allowing this task to
-            # wait for recovery when the node becomes unhealthy or to quit if
-            # the stop event is set.
-            stop_or_unhealthy,
+        # Checking the queue does not trigger a context-switch, the head
+        # won't change under our feet
+        while queue:
+            data = queue.peek(block=False)
+            message = inflight.get(data)
 
-            # Intentionally reusing backoff to restart from the last
-            # timeout/number of iterations.
-            backoff,
-        )
+            if message is None or not message.async_result.ready():
+                break
+
+            queue.get()
+            del inflight[data]
+            message.async_result.unlink(self.wakeup)
+
+        next_deadline = None
+        for data in queue.peek_many(self.window_size):
+            message = inflight.get(data)
+
+            if message is None:
+                backoff = timeout_exponential_backoff(
+                    self.message_retries,
+                    self.message_retry_timeout,
+                    self.message_retry_max_timeout,
+                )
+                async_result = self.protocol.send_raw_with_result(
+                    data,
+                    self.receiver_address,
+                )
+                async_result.rawlink(self.wakeup)
+
+                message = InflightMessage(async_result, backoff, now + next(backoff))
+                inflight[data] = message
+
+            elif message.async_result.ready():
+                continue
+
+            elif message.deadline <= now:
+                self.protocol.send_raw_with_result(
+                    data,
+                    self.receiver_address,
+                )
+                message.deadline = now + next(message.backoff)
 
-    return acknowledged
+            if next_deadline is None or message.deadline < next_deadline:
+                next_deadline = message.deadline
+
+        return next_deadline
 
 
 def single_queue_send(
@@ -221,9 +306,11 @@ def single_queue_send(
         event_unhealthy,
         message_retries,
         message_retry_timeout,
-        message_retry_max_timeout):
+        message_retry_max_timeout,
+        window_size=1):
 
-    """ Handles a single message queue for `receiver_address`.
+    """ Handles a single message queue for `receiver_address`, see
+    `SendWindow`.
 
     Notes:
     - This task must be the only consumer of queue.
@@ -242,10 +329,24 @@ def single_queue_send(
     if not isinstance(queue, NotifyingQueue):
         raise ValueError('queue must be a NotifyingQueue.')
 
-    # Reusing the event, clear must be carefully done
-    data_or_stop = event_first_of(
+    # Set when a message is queued or acknowledged, when the node becomes
+    # unhealthy or when the task must stop. Reusing the event, clear must be
+    # carefully done
+    wakeup = event_first_of(
         queue,
         event_stop,
+        event_unhealthy,
+    )
+
+    window = SendWindow(
+        protocol,
+        receiver_address,
+        queue,
+        window_size,
+        message_retries,
+        message_retry_timeout,
+        message_retry_max_timeout,
+        lambda _: wakeup.set(),
     )
 
     # Wait for the endpoint registration or to quit
@@ -255,43 +356,111 @@ def single_queue_send(
     ).wait()
 
     while True:
-        data_or_stop.wait()
+        # Cleared before the state is inspected, anything that happens while
+        # this task is switched out sets it again
+        wakeup.clear()
 
         if event_stop.is_set():
             return
 
-        # The queue is not empty at this point, so this won't raise Empty.
-        # This task being the only consumer is a requirement.
-        data = queue.peek(block=False)
+        # Packets must not be sent to an unhealthy node
+        if event_unhealthy.is_set():
+            wait_recovery(
+                event_stop,
+                event_healthy,
+            )
 
-        backoff = timeout_exponential_backoff(
-            message_retries,
-            message_retry_timeout,
-            message_retry_max_timeout,
-        )
+            # Retransmit the whole window as soon as the node is back
+            window.retransmit_all()
+            continue
 
-        acknowledged = retry_with_recovery(
+        now = time.time()
+        next_deadline = window.send(now)
+
+        timeout = None
+        if next_deadline is not None:
+            timeout = max(next_deadline - now, 0)
+
+        wakeup.wait(timeout)
+
+
+class QueueSender(ScheduledTask):
+    """ The scheduled version of `single_queue_send`, it runs every time a
+    message is queued or acknowledged, a retransmission is due or the health
+    of the node changes.
+    """
+
+    def __init__(
+            self,
+            scheduler,
             protocol,
-            data,
             receiver_address,
+            queue,
             event_stop,
             event_healthy,
             event_unhealthy,
-            backoff,
+            message_retries,
+            message_retry_timeout,
+            message_retry_max_timeout,
+            window_size):
+
+        if not isinstance(queue, NotifyingQueue):
+            raise ValueError('queue must be a NotifyingQueue.')
+
+        super(QueueSender, self).__init__(scheduler)
+
+        self.event_stop = event_stop
+        self.event_healthy = event_healthy
+        self.event_unhealthy = event_unhealthy
+        self.window = SendWindow(
+            protocol,
+            receiver_address,
+            queue,
+            window_size,
+            message_retries,
+            message_retry_timeout,
+            message_retry_max_timeout,
+            self.wakeup,
         )
 
-        if acknowledged:
-            queue.get()
+        # Set while the node is unhealthy, once it recovers the task waits
+        # until `resume_at` to avoid a flood of retransmissions. A task that
+        # did not start yet is waiting for the endpoint registration instead
+        self.started = False
+        self.recovering = False
+        self.resume_at = 0
+
+        queue.rawlink(self.wakeup)
+        event_healthy.rawlink(self.wakeup)
+        event_unhealthy.rawlink(self.wakeup)
+
+    def run(self):
+        if self.event_stop.is_set():
+            return
+
+        # Packets must not be sent to an unhealthy node, nor before the
+        # endpoint is known
+        if self.event_unhealthy.is_set() or not self.event_healthy.is_set():
+            if self.started:
+                self.recovering = True
+            return
 
-            # Checking the length of the queue does not trigger a
-            # context-switch, so it's safe to assume the length of the queue
-            # won't change under our feet and when a new item will be added the
-            # event will be set again.
-            if not queue:
-                data_or_stop.clear()
+        self.started = True
+        now = time.time()
 
-                if event_stop.is_set():
-                    return
+        if self.recovering:
+            self.recovering = False
+            self.resume_at = now + random.random()
+            self.window.retransmit_all()
+
+        if now < self.resume_at:
+            self.wakeup_at(self.resume_at)
+            return
+
+        next_deadline = self.window.send(now)
+
+        if next_deadline is not None:
+            self.wakeup_at(next_deadline)
 
 
 def healthcheck(
@@ -395,6 +564,160 @@ def healthcheck(
             )
 
 
+class HealthCheck(ScheduledTask):
+    """ The scheduled version of `healthcheck`, it runs when the Ping is
+    acknowledged or a timeout is due.
+    """
+
+    def __init__(
+            self,
+            scheduler,
+            protocol,
+            receiver_address,
+            event_stop,
+            event_healthy,
+            event_unhealthy,
+            nat_keepalive_retries,
+            nat_keepalive_timeout,
+            nat_invitation_timeout,
+            ping_nonce):
+
+        super(HealthCheck, self).__init__(scheduler)
+
+        self.protocol = protocol
+        self.receiver_address = receiver_address
+        self.event_stop = event_stop
+        self.event_healthy = event_healthy
+        self.event_unhealthy = event_unhealthy
+        self.nat_keepalive_retries = nat_keepalive_retries
+        self.nat_keepalive_timeout = nat_keepalive_timeout
+        self.nat_invitation_timeout = nat_invitation_timeout
+        self.ping_nonce = ping_nonce
+
+        self.state = HEALTHCHECK_START
+        self.deadline = 0
+        self.backoff = None
+        self.ping_data = None
+        self.ping_result = None
+        self.retries_left = 0
+
+    def run(self):
+        if self.event_stop.is_set():
+            return
+
+        now = time.time()
+        state = self.state
+
+        if state == HEALTHCHECK_START:
+            self.check_endpoint(now)
+
+        elif state in (HEALTHCHECK_PINGING, HEALTHCHECK_UNREACHABLE) and self.ping_result.ready():
+            self.acknowledged(now)
+
+        elif now < self.deadline:
+            self.wakeup_at(self.deadline)
+
+        elif state == HEALTHCHECK_ENDPOINT:
+            self.check_endpoint(now)
+
+        elif state == HEALTHCHECK_IDLE:
+            self.send_ping(now)
+
+        elif state == HEALTHCHECK_PINGING:
+            self.protocol.send_raw_with_result(self.ping_data, self.receiver_address)
+            self.retries_left -= 1
+
+            if self.retries_left > 0:
+                self.wait(HEALTHCHECK_PINGING, now + self.nat_keepalive_timeout)
+            else:
+                self.unreachable(now)
+
+        elif state == HEALTHCHECK_UNREACHABLE:
+            # Retry until recovery, used for:
+            # - Checking node status.
+            # - Nat punching.
+            self.protocol.send_raw_with_result(self.ping_data, self.receiver_address)
+            self.wait(HEALTHCHECK_UNREACHABLE, now + self.nat_invitation_timeout)
+
+    def wait(self, state, deadline):
+        self.state = state
+        self.deadline = deadline
+        self.wakeup_at(deadline)
+
+    def check_endpoint(self, now):
+        """ Wait for the endpoint registration, the Pings and the queues
+        start right away if the endpoint is known.
+        """
+        if self.state == HEALTHCHECK_START:
+            self.protocol.set_node_network_state(
+                self.receiver_address,
+                NODE_NETWORK_UNKNOWN,
+            )
+
+        try:
+            self.protocol.get_host_port(self.receiver_address)
+        except UnknownAddress:
+            if self.state == HEALTHCHECK_START:
+                self.event_healthy.clear()
+                self.event_unhealthy.set()
+
+                self.backoff = timeout_exponential_backoff(
+                    self.nat_keepalive_retries,
+                    self.nat_keepalive_timeout,
+                    self.nat_invitation_timeout,
+                )
+
+            self.wait(HEALTHCHECK_ENDPOINT, now + next(self.backoff))
+            return
+
+        self.event_unhealthy.clear()
+        self.event_healthy.set()
+        self.send_ping(now)
+
+    def send_ping(self, now):
+        if self.ping_result is not None:
+            self.ping_result.unlink(self.wakeup)
+
+        self.ping_nonce['nonce'] += 1
+        self.ping_data = self.protocol.get_ping(
+            self.ping_nonce['nonce'],
+        )
+
+        self.ping_result = self.protocol.send_raw_with_result(
+            self.ping_data,
+            self.receiver_address,
+        )
+        self.ping_result.rawlink(self.wakeup)
+
+        # Send Ping a few times before setting the node as unreachable
+        self.retries_left = self.nat_keepalive_retries
+        if self.retries_left > 0:
+            self.wait(HEALTHCHECK_PINGING, now + self.nat_keepalive_timeout)
+        else:
+            self.unreachable(now)
+
+    def unreachable(self, now):
+        # The node is not healthy, clear the event to stop all queue tasks
+        self.protocol.set_node_network_state(
+            self.receiver_address,
+            NODE_NETWORK_UNREACHABLE,
+        )
+        self.event_healthy.clear()
+        self.event_unhealthy.set()
+
+        self.wait(HEALTHCHECK_UNREACHABLE, now + self.nat_invitation_timeout)
+
+    def acknowledged(self, now):
+        self.event_unhealthy.clear()
+        self.event_healthy.set()
+        self.protocol.set_node_network_state(
+            self.receiver_address,
+            NODE_NETWORK_REACHABLE,
+        )
+
+        self.wait(HEALTHCHECK_IDLE, now + self.nat_keepalive_timeout)
+
+
 class RaidenProtocol(object):
     """ Encode the message into a packet and send it.
 
@@ -414,7 +737,15 @@ class RaidenProtocol(object):
             retries_before_backoff,
             nat_keepalive_retries,
             nat_keepalive_timeout,
-            nat_invitation_timeout):
+            nat_invitation_timeout,
+            verify_workers=0,
+            ack_cache_size=DEFAULT_PROTOCOL_ACK_CACHE_SIZE,
+            ack_cache_ttl=DEFAULT_PROTOCOL_ACK_CACHE_TTL,
+            ack_storage=None,
+            send_window=DEFAULT_PROTOCOL_SEND_WINDOW,
+            ack_delay=DEFAULT_PROTOCOL_ACK_DELAY,
+            batch_messages=DEFAULT_PROTOCOL_BATCH_MESSAGES,
+            scheduler_workers=DEFAULT_PROTOCOL_SCHEDULER_WORKERS):
 
         self.transport = transport
         self.discovery = discovery
@@ -422,6 +753,9 @@ class RaidenProtocol(object):
 
         self.retry_interval = retry_interval
         self.retries_before_backoff = retries_before_backoff
+        self.send_window = send_window
+        self.ack_delay = ack_delay
+        self.batch_messages = batch_messages
 
         self.nat_keepalive_retries = nat_keepalive_retries
         self.nat_keepalive_timeout = nat_keepalive_timeout
@@ -435,16 +769,40 @@ class RaidenProtocol(object):
         self.nodeaddresses_networkstatuses = defaultdict(lambda: NODE_NETWORK_UNKNOWN)
 
         # Maps the echohash of received and *sucessfully* processed messages to
-        # its Ack, used to ignored duplicate messages and resend the Ack.
-        self.receivedhashes_to_acks = dict()
+        # its Ack, used to ignored duplicate messages and resend the Ack. Only
+        # the recently used Acks are held in memory, the others are spilled to
+        # `ack_storage`.
+        self.receivedhashes_to_acks = AckCache(
+            ack_cache_size,
+            ack_cache_ttl,
+            ack_storage,
+        )
+
+        # Maps the echohash of received packets to the decoded message, used
+        # to skip the decoding and the sender recovery of retransmissions that
+        # could not be processed yet.
+        self.receivedhashes_to_messages = cachetools.LRUCache(
+            maxsize=DEFAULT_PROTOCOL_DECODE_CACHE_SIZE,
+        )
 
-        # Maps the echohash to a SentMessageState
+        # Maps the echohash to a SentMessageState, the entries are moved to
+        # `ackedhashes_to_states` once the message is acknowledged
         self.senthashes_to_states = dict()
 
+        # The SentMessageState of the recently acknowledged messages, sending
+        # one of them again returns its AsyncResult instead of a retry
+        self.ackedhashes_to_states = cachetools.LRUCache(
+            maxsize=ack_cache_size,
+        )
+
         # Maps the addresses to a dict with the latest nonce (using a dict
         # because python integers are immutable)
         self.nodeaddresses_to_nonces = dict()
 
+        # Maps the addresses of the nodes whose messages are being handled to
+        # the messages received meanwhile, see `receive_signed_message`
+        self.nodeaddresses_to_inbound = dict()
+
         cache = cachetools.TTLCache(
             maxsize=50,
             ttl=CACHE_TTL,
@@ -452,7 +810,47 @@ class RaidenProtocol(object):
         cache_wrapper = cachetools.cached(cache=cache)
         self.get_host_port = cache_wrapper(discovery.get)
 
+        # With workers the received packets are decoded and their senders
+        # recovered outside of the hub, otherwise it is done inline
+        if verify_workers:
+            self.verification_pool = VerificationPool(
+                verify_workers,
+                self.receive_decoded,
+            )
+        else:
+            self.verification_pool = None
+
+        # With workers the retransmissions and the health checks of all the
+        # nodes share a timer wheel and a few greenlets, otherwise every queue
+        # and every health check has its own greenlet
+        if scheduler_workers:
+            self.scheduler = Scheduler(
+                scheduler_workers,
+                DEFAULT_PROTOCOL_SCHEDULER_RESOLUTION,
+            )
+        else:
+            self.scheduler = None
+
+        # Maps the address of a node to the Ack flags it advertised, only the
+        # nodes with ACK_FLAG_MULTIACK get their Acks coalesced and only the
+        # ones with ACK_FLAG_ENVELOPE get their messages batched
+        self.nodeaddresses_to_flags = dict()
+
+        # Maps the address of a node to the list of (echohash, messagedata) of
+        # the Acks waiting `ack_delay` to be sent together
+        self.pending_acks = dict()
+
+        # Maps the address of a node to the list of encoded messages sent to
+        # it in the current iteration of the event loop
+        self.pending_messages = dict()
+
     def start(self):
+        if self.verification_pool is not None:
+            self.verification_pool.start()
+
+        if self.scheduler is not None:
+            self.scheduler.start()
+
         self.transport.start()
 
     def stop_and_wait(self):
@@ -464,6 +862,12 @@ class RaidenProtocol(object):
         self.event_stop.set()
         gevent.wait(self.greenlets)
 
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+        if self.verification_pool is not None:
+            self.verification_pool.stop()
+
         # All outgoing tasks are stopped. Now it's safe to close the socket. At
         # this point there might be some incoming message being processed,
         # keeping the socket open is not useful for these.
@@ -499,18 +903,32 @@ class RaidenProtocol(object):
 
             self.addresses_events[receiver_address] = events
 
-            self.greenlets.append(gevent.spawn(
-                healthcheck,
-                self,
-                receiver_address,
-                self.event_stop,
-                events.event_healthy,
-                events.event_unhealthy,
-                self.nat_keepalive_retries,
-                self.nat_keepalive_timeout,
-                self.nat_invitation_timeout,
-                ping_nonce,
-            ))
+            if self.scheduler is not None:
+                HealthCheck(
+                    self.scheduler,
+                    self,
+                    receiver_address,
+                    self.event_stop,
+                    events.event_healthy,
+                    events.event_unhealthy,
+                    self.nat_keepalive_retries,
+                    self.nat_keepalive_timeout,
+                    self.nat_invitation_timeout,
+                    ping_nonce,
+                ).wakeup()
+            else:
+                self.greenlets.append(gevent.spawn(
+                    healthcheck,
+                    self,
+                    receiver_address,
+                    self.event_stop,
+                    events.event_healthy,
+                    events.event_unhealthy,
+                    self.nat_keepalive_retries,
+                    self.nat_keepalive_timeout,
+                    self.nat_invitation_timeout,
+                    ping_nonce,
+                ))
 
     def get_channel_queue(self, receiver_address, token_address):
         key = (
@@ -526,18 +944,34 @@ class RaidenProtocol(object):
 
         events = self.get_health_events(receiver_address)
 
-        self.greenlets.append(gevent.spawn(
-            single_queue_send,
-            self,
-            receiver_address,
-            queue,
-            self.event_stop,
-            events.event_healthy,
-            events.event_unhealthy,
-            self.retries_before_backoff,
-            self.retry_interval,
-            self.retry_interval * 10,
-        ))
+        if self.scheduler is not None:
+            QueueSender(
+                self.scheduler,
+                self,
+                receiver_address,
+                queue,
+                self.event_stop,
+                events.event_healthy,
+                events.event_unhealthy,
+                self.retries_before_backoff,
+                self.retry_interval,
+                self.retry_interval * 10,
+                self.send_window,
+            ).wakeup()
+        else:
+            self.greenlets.append(gevent.spawn(
+                single_queue_send,
+                self,
+                receiver_address,
+                queue,
+                self.event_stop,
+                events.event_healthy,
+                events.event_unhealthy,
+                self.retries_before_backoff,
+                self.retry_interval,
+                self.retry_interval * 10,
+                self.send_window,
+            ))
 
         if log.isEnabledFor(logging.DEBUG):
             log.debug(
@@ -573,7 +1007,8 @@ class RaidenProtocol(object):
         token_address = getattr(message, 'token', '')
 
         # Ignore duplicated messages
-        if echohash not in self.senthashes_to_states:
+        waitack = self.get_sent_state(echohash)
+        if waitack is None:
             async_result = AsyncResult()
             self.senthashes_to_states[echohash] = SentMessageState(
                 async_result,
@@ -596,11 +1031,21 @@ class RaidenProtocol(object):
 
             queue.put(messagedata)
         else:
-            waitack = self.senthashes_to_states[echohash]
             async_result = waitack.async_result
 
         return async_result
 
+    def get_sent_state(self, echohash):
+        """ Return the SentMessageState of a message that is being sent or
+        was recently acknowledged, None if it is unknown.
+        """
+        waitack = self.senthashes_to_states.get(echohash)
+
+        if waitack is None:
+            waitack = self.ackedhashes_to_states.get(echohash)
+
+        return waitack
+
     def send_and_wait(self, receiver_address, message, timeout=None):
         """Sends a message and wait for the response ack."""
         async_result = self.send_async(receiver_address, message)
@@ -616,7 +1061,46 @@ class RaidenProtocol(object):
 
         messagedata = ack_message.encode()
         self.receivedhashes_to_acks[ack_message.echo] = (receiver_address, messagedata)
-        self._maybe_send_ack(*self.receivedhashes_to_acks[ack_message.echo])
+
+        flags = self.nodeaddresses_to_flags.get(receiver_address, 0)
+        if self.ack_delay and flags & ACK_FLAG_MULTIACK:
+            self.coalesce_ack(receiver_address, ack_message.echo, messagedata)
+        else:
+            self._maybe_send_ack(receiver_address, messagedata)
+
+    def coalesce_ack(self, receiver_address, echohash, messagedata):
+        """ Delay the Ack for `ack_delay` seconds, the Acks for the same node
+        within that time are sent in a single MultiAck.
+        """
+        pending = self.pending_acks.get(receiver_address)
+
+        if pending is None:
+            pending = list()
+            self.pending_acks[receiver_address] = pending
+            gevent.spawn_later(self.ack_delay, self.flush_acks, receiver_address)
+
+        pending.append((echohash, messagedata))
+
+        if len(pending) >= MultiAck.max_echoes:
+            self.flush_acks(receiver_address)
+
+    def flush_acks(self, receiver_address):
+        """ Send the Acks waiting for `receiver_address`. """
+        pending = self.pending_acks.pop(receiver_address, None)
+
+        if not pending:
+            return
+
+        if len(pending) == 1:
+            messagedata = pending[0][1]
+        else:
+            multiack = MultiAck(
+                self.raiden.address,
+                [echohash for echohash, _ in pending],
+            )
+            messagedata = multiack.encode()
+
+        self._maybe_send_ack(receiver_address, messagedata)
 
     def _maybe_send_ack(self, receiver_address, messagedata):
         """ ACK must not go into the queue, otherwise nodes will deadlock
@@ -657,26 +1141,65 @@ class RaidenProtocol(object):
 
         Always returns same AsyncResult instance for equal input.
         """
-        host_port = self.get_host_port(receiver_address)
         echohash = sha3(data + receiver_address)
 
-        if echohash not in self.senthashes_to_states:
+        waitack = self.get_sent_state(echohash)
+        if waitack is None:
             async_result = AsyncResult()
             self.senthashes_to_states[echohash] = SentMessageState(
                 async_result,
                 receiver_address,
             )
         else:
-            async_result = self.senthashes_to_states[echohash].async_result
+            async_result = waitack.async_result
 
         if not async_result.ready():
+            self.send_raw(receiver_address, data)
+
+        return async_result
+
+    def send_raw(self, receiver_address, data):
+        """ Send `data` to `receiver_address`.
+
+        If batching is enabled and the node advertised ACK_FLAG_ENVELOPE the
+        messages sent to it in the same iteration of the event loop are
+        packed together into as few datagrams as possible.
+        """
+        host_port = self.get_host_port(receiver_address)
+        flags = self.nodeaddresses_to_flags.get(receiver_address, 0)
+
+        if self.batch_messages and flags & ACK_FLAG_ENVELOPE:
+            pending = self.pending_messages.get(receiver_address)
+
+            if pending is None:
+                pending = list()
+                self.pending_messages[receiver_address] = pending
+                gevent.spawn(self.flush_messages, receiver_address)
+
+            pending.append(data)
+
+        else:
             self.transport.send(
                 self.raiden,
                 host_port,
                 data,
             )
 
-        return async_result
+    def flush_messages(self, receiver_address):
+        """ Send the messages batched for `receiver_address`. """
+        pending = self.pending_messages.pop(receiver_address, None)
+
+        # The messages are retransmitted if the transport was stopped
+        if not pending or not self.transport.server.started:
+            return
+
+        host_port = self.get_host_port(receiver_address)
+        for datagram in pack_envelopes(pending, UDP_MAX_MESSAGE_SIZE):
+            self.transport.send(
+                self.raiden,
+                host_port,
+                datagram,
+            )
 
     def set_node_network_state(self, node_address, node_state):
         self.nodeaddresses_networkstatuses[node_address] = node_state
@@ -686,34 +1209,83 @@ class RaidenProtocol(object):
             log.error('receive packet larger than maximum size', length=len(data))
             return
 
+        # The messages of an envelope are handled in order, as if they were
+        # received one after the other
+        if data[:1] == ENVELOPE:
+            messages_data = unpack_envelope(data)
+
+            if messages_data is not None:
+                for message_data in messages_data:
+                    if message_data[:1] != ENVELOPE:
+                        self.receive(message_data)
+
+            return
+
         # Repeat the ACK if the message has been handled before
         echohash = sha3(data + self.raiden.address)
-        if echohash in self.receivedhashes_to_acks:
-            return self._maybe_send_ack(*self.receivedhashes_to_acks[echohash])
+        ack = self.receivedhashes_to_acks.get(echohash)
+        if ack is not None:
+            return self._maybe_send_ack(*ack)
 
-        message = decode(data)
+        message = self.receivedhashes_to_messages.get(echohash)
 
-        if isinstance(message, Ack):
-            waitack = self.senthashes_to_states.get(message.echo)
+        if message is not None:
+            self.receive_message(data, echohash, message)
 
-            if waitack is None:
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug(
-                        'ACK FOR UNKNOWN ECHO',
-                        node=pex(self.raiden.address),
-                        echohash=pex(message.echo),
-                    )
+        elif self.verification_pool is not None:
+            self.verification_pool.put(data, echohash)
 
-            else:
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug(
-                        'ACK RECEIVED',
-                        node=pex(self.raiden.address),
-                        receiver=pex(waitack.receiver_address),
-                        echohash=pex(message.echo),
-                    )
+        else:
+            self.receive_decoded(data, echohash, decode(data))
+
+    def receive_decoded(self, data, echohash, message):
+        # A retransmission may have been queued for verification before the
+        # first packet was handled
+        ack = self.receivedhashes_to_acks.get(echohash)
+        if ack is not None:
+            return self._maybe_send_ack(*ack)
+
+        if message is not None:
+            self.receivedhashes_to_messages[echohash] = message
+
+        self.receive_message(data, echohash, message)
+
+    def receive_ack(self, echohash):
+        """ Set the result of the message acknowledged by `echohash`. """
+        waitack = self.senthashes_to_states.pop(echohash, None)
+
+        if waitack is None:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(
+                    'ACK FOR UNKNOWN ECHO',
+                    node=pex(self.raiden.address),
+                    echohash=pex(echohash),
+                )
+
+        else:
+            self.ackedhashes_to_states[echohash] = waitack
+
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(
+                    'ACK RECEIVED',
+                    node=pex(self.raiden.address),
+                    receiver=pex(waitack.receiver_address),
+                    echohash=pex(echohash),
+                )
+
+            waitack.async_result.set(True)
+
+    def receive_message(self, data, echohash, message):
+        if isinstance(message, Ack):
+            self.nodeaddresses_to_flags[message.sender] = message.flags
+            self.receive_ack(message.echo)
 
-                waitack.async_result.set(True)
+        elif isinstance(message, MultiAck):
+            flags = self.nodeaddresses_to_flags.get(message.sender, 0)
+            self.nodeaddresses_to_flags[message.sender] = flags | ACK_FLAG_MULTIACK
+
+            for echo in message.echoes:
+                self.receive_ack(echo)
 
         elif isinstance(message, Ping):
             if ping_log.isEnabledFor(logging.DEBUG):
@@ -728,6 +1300,7 @@ class RaidenProtocol(object):
             ack = Ack(
                 self.raiden.address,
                 echohash,
+                ACK_FLAGS,
             )
 
             self.maybe_send_ack(
@@ -736,49 +1309,96 @@ class RaidenProtocol(object):
             )
 
         elif isinstance(message, SignedMessage):
-            if log.isEnabledFor(logging.INFO):
-                log.info(
-                    'MESSAGE RECEIVED',
-                    node=pex(self.raiden.address),
-                    echohash=pex(echohash),
-                    message=message,
-                    message_sender=pex(message.sender)
-                )
+            self.receive_signed_message(echohash, message)
 
-            try:
-                self.raiden.on_message(message, echohash)
+        elif log.isEnabledFor(logging.ERROR):
+            log.error(
+                'Invalid message',
+                message=data.encode('hex'),
+            )
 
-                # only send the Ack if the message was handled without exceptions
-                ack = Ack(
-                    self.raiden.address,
-                    echohash,
-                )
+    def receive_signed_message(self, echohash, message):
+        """ Handle the messages of each sender one at a time, in the order
+        they were received.
 
-                try:
-                    if log.isEnabledFor(logging.DEBUG):
-                        log.debug(
-                            'SENDING ACK',
-                            node=pex(self.raiden.address),
-                            to=pex(message.sender),
-                            echohash=pex(echohash),
-                        )
-
-                    self.maybe_send_ack(
-                        message.sender,
-                        ack,
-                    )
-                except (InvalidAddress, UnknownAddress) as e:
-                    log.debug("Couldn't send the ACK", e=e)
+        Handling a message may switch context, e.g. to wait for the commit of
+        its state changes. The messages received from the same sender in the
+        meantime are queued instead of being handled concurrently, otherwise
+        a message could be rejected because the one before it, sent in the
+        same window, is not handled yet.
+        """
+        sender = message.sender
+        inbound = self.nodeaddresses_to_inbound.get(sender)
 
-            except (UnknownAddress, InvalidNonce, TransferWhenClosed, TransferUnwanted) as e:
-                log.DEV('maybe unwanted transfer', e=e)
+        if inbound is not None:
+            inbound.append((echohash, message))
+            return
 
-            except (UnknownTokenAddress, InvalidLocksRoot) as e:
-                if log.isEnabledFor(logging.WARN):
-                    log.warn(str(e))
+        inbound = deque([(echohash, message)])
+        self.nodeaddresses_to_inbound[sender] = inbound
 
-        elif log.isEnabledFor(logging.ERROR):
-            log.error(
-                'Invalid message',
-                message=data.encode('hex'),
+        # The verification pool gives the messages of all the senders from a
+        # single greenlet, a message waiting for its commit must not delay the
+        # messages of the other senders nor the acks received with it
+        if self.verification_pool is not None:
+            gevent.spawn(self.handle_inbound, sender, inbound)
+        else:
+            self.handle_inbound(sender, inbound)
+
+    def handle_inbound(self, sender, inbound):
+        """ Handle the queued messages of `sender` until there are none left. """
+        try:
+            while inbound:
+                echohash, message = inbound.popleft()
+                self.handle_signed_message(echohash, message)
+        finally:
+            # the messages left by an unexpected error are retransmitted
+            del self.nodeaddresses_to_inbound[sender]
+
+    def handle_signed_message(self, echohash, message):
+        if log.isEnabledFor(logging.INFO):
+            log.info(
+                'MESSAGE RECEIVED',
+                node=pex(self.raiden.address),
+                echohash=pex(echohash),
+                message=message,
+                message_sender=pex(message.sender)
+            )
+
+        try:
+            self.raiden.on_message(message, echohash)
+
+            # The Ack allows the sender to forget about the message, so
+            # the state changes must be durable before it is sent, this
+            # blocks only if group commits are enabled.
+            self.raiden.transaction_log.get_commit_result().wait()
+
+            # only send the Ack if the message was handled without exceptions
+            ack = Ack(
+                self.raiden.address,
+                echohash,
+                ACK_FLAGS,
             )
+
+            try:
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug(
+                        'SENDING ACK',
+                        node=pex(self.raiden.address),
+                        to=pex(message.sender),
+                        echohash=pex(echohash),
+                    )
+
+                self.maybe_send_ack(
+                    message.sender,
+                    ack,
+                )
+            except (InvalidAddress, UnknownAddress) as e:
+                log.debug("Couldn't send the ACK", e=e)
+
+        except (UnknownAddress, InvalidNonce, TransferWhenClosed, TransferUnwanted) as e:
+            log.DEV('maybe unwanted transfer', e=e)
+
+        except (UnknownTokenAddress, InvalidLocksRoot) as e:
+            if log.isEnabledFor(logging.WARN):
+                log.warn(str(e))
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+""" A shared scheduler for the periodic work of the protocol.
+
+Instead of a greenlet and a gevent timer per retransmission loop and per
+health check, the tasks register their deadlines in a hierarchical timer
+wheel. A single greenlet advances the wheel and a fixed number of worker
+greenlets run the tasks that are due, so the number of greenlets does not
+grow with the number of peers.
+"""
+from abc import ABCMeta, abstractmethod
+from time import time
+
+import gevent
+from gevent.event import Event
+from gevent.queue import Queue
+from ethereum import slogging
+
+log = slogging.get_logger(__name__)  # pylint: disable=invalid-name
+
+
+class Timer(object):
+    """ A callback registered in a TimerWheel, see `TimerWheel.schedule`. """
+
+    __slots__ = (
+        'deadline',
+        'tick',
+        'callback',
+        'args',
+        'cancelled',
+        'expired',
+    )
+
+    def __init__(self, deadline, tick, callback, args):
+        self.deadline = deadline
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.expired = False
+
+    @property
+    def active(self):
+        return not self.cancelled and not self.expired
+
+    def cancel(self):
+        """ The timer is left in the wheel and dropped when it is due. """
+        self.cancelled = True
+
+
+class TimerWheel(object):
+    """ Hierarchical timing wheel.
+
+    Time is divided in ticks of `resolution` seconds. The first level has a
+    slot per tick, every next level has a slot per turn of the previous
+    level. A timer is added to the lowest level that can hold its deadline
+    and moves down one level each time the slot it is in is reached, so
+    adding, cancelling and expiring a timer are O(1).
+
+    Args:
+        resolution (float): Seconds per tick, timers expire at most one tick
+            late.
+        slots (int): Number of slots per level.
+        levels (int): Number of levels, the deadlines beyond
+            `resolution * slots ** levels` seconds are kept aside until the
+            wheel gets closer to them.
+        time_function (callable): Returns the current time in seconds.
+    """
+
+    def __init__(self, resolution, slots=64, levels=4, time_function=None):
+        if resolution <= 0:
+            raise ValueError('resolution must be positive')
+
+        if slots < 2 or levels < 1:
+            raise ValueError('the wheel needs at least two slots and one level')
+
+        self.resolution = resolution
+        self.slots = slots
+        self._time = time_function or time
+
+        self.start = self._time()
+        self.current_tick = 0
+        self.wheels = [
+            [list() for _ in range(slots)]
+            for _ in range(levels)
+        ]
+        self.overflow = list()
+
+    def tick_for(self, timestamp):
+        return int((timestamp - self.start) / self.resolution)
+
+    def schedule(self, delay, callback, *args):
+        """ Call `callback(*args)` once `delay` seconds elapsed, returns the
+        Timer that can be used to cancel it.
+        """
+        deadline = self._time() + delay
+
+        # rounded up, the timer must not expire before its deadline
+        tick = max(self.tick_for(deadline) + 1, self.current_tick + 1)
+
+        timer = Timer(deadline, tick, callback, args)
+        self._add(timer)
+        return timer
+
+    def _add(self, timer):
+        delta = timer.tick - self.current_tick
+        span = self.slots
+
+        for wheel in self.wheels:
+            if delta < span:
+                position = (timer.tick * self.slots // span) % self.slots
+                wheel[position].append(timer)
+                return
+
+            span *= self.slots
+
+        self.overflow.append(timer)
+
+    def advance(self, now=None):
+        """ Move the wheel to `now` and return the timers that expired, in
+        order of their deadlines.
+        """
+        if now is None:
+            now = self._time()
+
+        target_tick = self.tick_for(now)
+        expired = list()
+
+        while self.current_tick < target_tick:
+            self.current_tick += 1
+            self._cascade()
+
+            slot = self.wheels[0][self.current_tick % self.slots]
+            if slot:
+                self.wheels[0][self.current_tick % self.slots] = list()
+                expired.extend(timer for timer in slot if not timer.cancelled)
+
+        for timer in expired:
+            timer.expired = True
+
+        expired.sort(key=lambda timer: timer.deadline)
+        return expired
+
+    def _cascade(self):
+        """ Move the timers of the upper levels that are now in range of a
+        lower level, done every time a level completes a turn.
+        """
+        tick = self.current_tick
+        span = 1
+
+        for wheel in self.wheels[1:]:
+            span *= self.slots
+
+            if tick % span:
+                return
+
+            position = (tick // span) % self.slots
+            timers = wheel[position]
+            wheel[position] = list()
+
+            for timer in timers:
+                if not timer.cancelled:
+                    self._add(timer)
+
+        if tick % (span * self.slots) == 0 and self.overflow:
+            timers = self.overflow
+            self.overflow = list()
+
+            for timer in timers:
+                if not timer.cancelled:
+                    self._add(timer)
+
+
+class Scheduler(object):
+    """ Runs the protocol tasks on a fixed number of greenlets.
+
+    Timer callbacks run in the greenlet that advances the wheel and must not
+    block, the work itself is queued with `call_soon` and runs in one of the
+    `workers` greenlets.
+    """
+
+    def __init__(self, workers, resolution):
+        if workers < 1:
+            raise ValueError('workers must be a positive integer')
+
+        self.workers = workers
+        self.wheel = TimerWheel(resolution)
+        self.ready = Queue()
+        self.event_stop = Event()
+        self.greenlets = list()
+
+    def start(self):
+        self.greenlets.append(gevent.spawn(self._tick))
+
+        for _ in range(self.workers):
+            self.greenlets.append(gevent.spawn(self._work))
+
+    def stop(self):
+        self.event_stop.set()
+
+        for _ in range(self.workers):
+            self.ready.put(None)
+
+        gevent.wait(self.greenlets)
+
+    def call_later(self, delay, callback, *args):
+        return self.wheel.schedule(delay, callback, *args)
+
+    def call_soon(self, callback, *args):
+        self.ready.put((callback, args))
+
+    def _tick(self):
+        while not self.event_stop.wait(self.wheel.resolution):
+            for timer in self.wheel.advance():
+                try:
+                    timer.callback(*timer.args)
+                except Exception:  # pylint: disable=broad-except
+                    log.exception('timer callback failed')
+
+    def _work(self):
+        while True:
+            work = self.ready.get()
+
+            if work is None:
+                return
+
+            callback, args = work
+            try:
+                callback(*args)
+            except Exception:  # pylint: disable=broad-except
+                log.exception('scheduled task failed')
+
+
+class ScheduledTask(object):
+    """ Work that runs on the greenlets of a Scheduler.
+
+    `run` is called every time the task is woken up, by `wakeup` or by the
+    deadline given to `wakeup_at`. The task never runs concurrently with
+    itself, a wakeup while it is running makes it run once more.
+    """
+    __metaclass__ = ABCMeta
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.timer = None
+        self.queued = False
+        self.running = False
+        self.rerun = False
+
+    def wakeup(self, _=None):
+        """ Run the task soon, usable as a `rawlink` callback. """
+        if self.running:
+            self.rerun = True
+
+        elif not self.queued:
+            self.queued = True
+            self.scheduler.call_soon(self._run)
+
+    def wakeup_at(self, deadline):
+        """ Run the task once `deadline` is reached, an earlier pending
+        deadline is kept.
+        """
+        timer = self.timer
+
+        if timer is not None and timer.active:
+            if timer.deadline <= deadline:
+                return
+
+            timer.cancel()
+
+        self.timer = self.scheduler.call_later(
+            max(deadline - time(), 0),
+            self.wakeup,
+        )
+
+    def _run(self):
+        self.queued = False
+        self.running = True
+
+        try:
+            self.rerun = True
+            while self.rerun:
+                self.rerun = False
+                self.run()
+        finally:
+            self.running = False
+
+    @abstractmethod
+    def run(self):
+        pass
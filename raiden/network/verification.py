@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import gevent
+from gevent.event import Event
+from gevent.threadpool import ThreadPool
+from ethereum import slogging
+
+from raiden.messages import decode
+from raiden.settings import DEFAULT_PROTOCOL_VERIFY_MAX_PENDING
+
+log = slogging.get_logger(__name__)  # pylint: disable=invalid-name
+
+
+def decode_batch(packets):
+    """ Decode the `packets` in order, the signature recovery of each message
+    is done by coincurve which runs without the GIL.
+
+    A packet that cannot be decoded is None, it must not discard the other
+    packets of the batch.
+    """
+    messages = list()
+
+    for data, _ in packets:
+        try:
+            message = decode(data)
+        except Exception as e:  # pylint: disable=broad-except
+            log.error('could not decode a received packet', error=str(e))
+            message = None
+
+        messages.append(message)
+
+    return messages
+
+
+def split_batch(packets, parts):
+    """ Split `packets` in at most `parts` consecutive chunks of similar size. """
+    size, remainder = divmod(len(packets), parts)
+
+    chunks = list()
+    start = 0
+    for part in range(parts):
+        end = start + size + (1 if part < remainder else 0)
+
+        if start < end:
+            chunks.append(packets[start:end])
+
+        start = end
+
+    return chunks
+
+
+class VerificationPool(object):
+    """ Decodes the received packets and recovers their senders in a pool of
+    worker threads, so that a burst of signed messages does not stall the
+    hub.
+
+    Packets are decoded in batches, each batch is split among the workers
+    and the decoded messages are given to `callback` from a single greenlet
+    in the order the packets were received, this keeps the order of the
+    messages of each sender.
+
+    Args:
+        workers (int): Number of threads used for the decoding.
+        callback (callable): Called with `(data, echohash, message)` for each
+            packet, `message` is None if the packet could not be decoded.
+        max_pending (int): Number of packets waiting to be decoded, the
+            packets received while the queue is full are dropped.
+    """
+
+    def __init__(self, workers, callback, max_pending=DEFAULT_PROTOCOL_VERIFY_MAX_PENDING):
+        if workers < 1:
+            raise ValueError('workers must be a positive integer')
+
+        if max_pending < 1:
+            raise ValueError('max_pending must be a positive integer')
+
+        self.workers = workers
+        self.callback = callback
+        self.max_pending = max_pending
+        self.threadpool = ThreadPool(workers)
+
+        self.pending = list()
+        self.dropped = 0
+        self.event_pending = Event()
+        self.greenlet = None
+
+    def start(self):
+        if self.greenlet is None:
+            self.greenlet = gevent.spawn(self._run)
+
+    def stop(self):
+        if self.greenlet is not None:
+            self.greenlet.kill()
+            self.greenlet = None
+
+        self.threadpool.kill()
+
+    def put(self, data, echohash):
+        """ Queue the packet `data` for decoding, it is dropped if the queue
+        is full, as the transport would do.
+        """
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+
+        self.pending.append((data, echohash))
+        self.event_pending.set()
+
+    def _run(self):
+        while True:
+            self.event_pending.wait()
+            self.event_pending.clear()
+
+            packets = self.pending
+            self.pending = list()
+
+            if self.dropped:
+                log.warning(
+                    'verification queue full, packets dropped',
+                    dropped=self.dropped,
+                )
+                self.dropped = 0
+
+            if packets:
+                # the greenlet must survive any error, otherwise the packets
+                # would pile up without being handled
+                try:
+                    self.verify(packets)
+                except Exception:  # pylint: disable=broad-except
+                    log.exception('unexpected exception verifying received packets')
+
+    def verify(self, packets):
+        chunks = split_batch(packets, self.workers)
+
+        # all the chunks are decoded concurrently, the results are consumed
+        # in order
+        results = [
+            self.threadpool.spawn(decode_batch, chunk)
+            for chunk in chunks
+        ]
+
+        for chunk, async_result in zip(chunks, results):
+            messages = async_result.get()
+
+            for (data, echohash), message in zip(chunk, messages):
+                # an error handling one message must not stop the pool
+                try:
+                    self.callback(data, echohash, message)
+                except Exception:  # pylint: disable=broad-except
+                    log.exception('unexpected exception handling a received message')
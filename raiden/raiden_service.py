@@ -3,13 +3,14 @@
 import os
 import sys
 import itertools
-import cPickle as pickle
 import random
+import time
 from collections import defaultdict
 
 import filelock
 import gevent
 from gevent.event import AsyncResult
+from gevent.pool import Pool
 from coincurve import PrivateKey
 from ethereum import slogging
 from ethereum.utils import encode_hex
@@ -27,6 +28,11 @@ from raiden.event_handler import StateMachineEventHandler
 from raiden.message_handler import RaidenMessageHandler
 from raiden.tasks import (
     AlarmTask,
+    SnapshotTask,
+)
+from raiden.snapshot import (
+    load_snapshot,
+    SnapshotWriter,
 )
 from raiden.token_swap import GreenletTasksDispatcher
 from raiden.transfer.architecture import StateManager
@@ -45,6 +51,7 @@ from raiden.transfer.mediated_transfer.state import (
     LockedTransferState,
 )
 from raiden.transfer.state_change import (
+    ActionRegisterTransfer,
     ActionTransferDirect,
 )
 from raiden.transfer.mediated_transfer.state_change import (
@@ -56,16 +63,19 @@ from raiden.transfer.events import (
     EventTransferSentSuccess,
 )
 from raiden.transfer.log import (
+    PickleTransactionSerializer,
     StateChangeLog,
+    StateChangeLogArchive,
     StateChangeLogSQLiteBackend,
+    StateChangeLogWALSQLiteBackend,
 )
+from raiden.transfer.segment_log import StateChangeLogSegmentBackend
+from raiden.transfer.serialization import CompactTransactionSerializer
 from raiden.channel import (
     ChannelEndState,
     ChannelExternalState,
 )
-from raiden.channel.netting_channel import (
-    ChannelSerialization,
-)
+from raiden.channel.netting_channel import LazyNettingChannel
 from raiden.exceptions import InvalidAddress, AddressWithoutCode
 from raiden.network.channelgraph import (
     get_best_routes,
@@ -83,8 +93,13 @@ from raiden.transfer.merkle_tree import (
     compute_layers,
 )
 from raiden.network.protocol import (
+    timeout_exponential_backoff,
     RaidenProtocol,
 )
+from raiden.settings import (
+    DEFAULT_RESTORE_RETRY_TIMEOUT,
+    DEFAULT_RESTORE_RETRY_TIMEOUT_MAX,
+)
 from raiden.constants import ROPSTEN_REGISTRY_ADDRESS
 from raiden.connection_manager import ConnectionManager
 from raiden.utils import (
@@ -104,45 +119,81 @@ def create_default_identifier():
     return random.randint(0, UINT64_MAX)
 
 
-def load_snapshot(serialization_file):
-    if os.path.exists(serialization_file):
-        with open(serialization_file, 'rb') as handler:
-            return pickle.load(handler)
+def can_restore_lazily(serialized_channel):
+    """ Snapshots saved by older versions don't have the on-chain details
+    required to restore a channel without querying the blockchain.
+    """
+    return hasattr(serialized_channel, 'settle_timeout')
 
 
-def save_snapshot(serialization_file, raiden):
-    all_channels = [
-        ChannelSerialization(channel)
-        for network in raiden.token_to_channelgraph.values()
-        for channel in network.address_to_channel.values()
-    ]
+def merkletree_from_leaves(leaves):
+    if leaves:
+        return MerkleTreeState(compute_layers(leaves))
+    return EMPTY_MERKLE_TREE
 
-    all_queues = list()
-    for key, queue in raiden.protocol.channel_queue.iteritems():
-        queue_data = {
-            'receiver_address': key[0],
-            'token_address': key[1],
-            'messages': queue.copy(),
-        }
-        all_queues.append(queue_data)
-
-    data = {
-        'channels': all_channels,
-        'queues': all_queues,
-        'receivedhashes_to_acks': raiden.protocol.receivedhashes_to_acks,
-        'nodeaddresses_to_nonces': raiden.protocol.nodeaddresses_to_nonces,
-        'transfers': raiden.identifier_to_statemanagers,
-        'registry_address': ROPSTEN_REGISTRY_ADDRESS,
-    }
-
-    with open(serialization_file, 'wb') as handler:
-        # __slots__ without __getstate__ require `-1`
-        pickle.dump(
-            data,
-            handler,
-            protocol=-1,
+
+def create_storage_backend(config):
+    """ Instantiate the transaction log storage backend selected by
+    `config['database_backend']`.
+    """
+    backend = config['database_backend']
+
+    if backend == 'sqlite':
+        return StateChangeLogSQLiteBackend(
+            database_path=config['database_path'],
+            group_commit_size=config['database_group_commit_size'],
+            group_commit_timeout=config['database_group_commit_timeout'],
         )
 
+    if backend == 'sqlite_wal':
+        return StateChangeLogWALSQLiteBackend(
+            database_path=config['database_path'],
+            synchronous=config['database_synchronous'],
+            group_commit_size=config['database_group_commit_size'],
+            group_commit_timeout=config['database_group_commit_timeout'],
+        )
+
+    if backend == 'segment':
+        if config['database_path'] == ':memory:':
+            raise ValueError('the segment backend cannot be used with an in memory database')
+
+        # the segments are kept in a directory next to where the SQLite
+        # database would be
+        return StateChangeLogSegmentBackend(
+            log_dir=config['database_path'] + '.segments',
+            segment_size=config['database_segment_size'],
+            group_commit_size=config['database_group_commit_size'],
+            group_commit_timeout=config['database_group_commit_timeout'],
+        )
+
+    raise ValueError('unknown database backend {}'.format(backend))
+
+
+def create_archive(config):
+    """ Instantiate the archive of the pruned events, None if archiving is
+    disabled or the database is in memory.
+    """
+    if config['database_path'] == ':memory:' or not config['database_archive']:
+        return None
+
+    archive_dir = os.path.join(os.path.dirname(config['database_path']), 'archive')
+    return StateChangeLogArchive(archive_dir)
+
+
+def create_serializer(config):
+    """ Instantiate the transaction log serializer selected by
+    `config['database_serializer']`.
+    """
+    serializer = config['database_serializer']
+
+    if serializer == 'pickle':
+        return PickleTransactionSerializer()
+
+    if serializer == 'compact':
+        return CompactTransactionSerializer()
+
+    raise ValueError('unknown database serializer {}'.format(serializer))
+
 
 def endpoint_registry_exception_handler(greenlet):
     try:
@@ -195,6 +246,9 @@ class RaidenService(object):
         self.swapkey_to_greenlettask = dict()
 
         self.identifier_to_statemanagers = defaultdict(list)
+
+        # Verifies the channels restored lazily against the blockchain
+        self.channel_verification_pool = Pool(config['restore_concurrency'])
         self.identifier_to_results = defaultdict(list)
 
         # This is a map from a hashlock to a list of channels, the same
@@ -219,6 +273,13 @@ class RaidenService(object):
 
         self.private_key = PrivateKey(private_key_bin)
         self.pubkey = self.private_key.public_key.format(compressed=False)
+
+        self.transaction_log = StateChangeLog(
+            storage_instance=create_storage_backend(config),
+            serializer_instance=create_serializer(config),
+            archive_instance=create_archive(config),
+        )
+
         self.protocol = RaidenProtocol(
             transport,
             discovery,
@@ -228,6 +289,14 @@ class RaidenService(object):
             config['protocol']['nat_keepalive_retries'],
             config['protocol']['nat_keepalive_timeout'],
             config['protocol']['nat_invitation_timeout'],
+            config['protocol']['verify_workers'],
+            config['protocol']['ack_cache_size'],
+            config['protocol']['ack_cache_ttl'],
+            self.transaction_log,
+            config['protocol']['send_window'],
+            config['protocol']['ack_delay'],
+            config['protocol']['batch_messages'],
+            config['protocol']['scheduler_workers'],
         )
 
         # TODO: remove this cyclic dependency
@@ -241,12 +310,6 @@ class RaidenService(object):
         self.alarm = AlarmTask(chain)
         self._blocknumber = None
 
-        self.transaction_log = StateChangeLog(
-            storage_instance=StateChangeLogSQLiteBackend(
-                database_path=config['database_path']
-            )
-        )
-
         if config['database_path'] != ':memory:':
             self.database_dir = os.path.dirname(config['database_path'])
             self.lock_file = os.path.join(self.database_dir, '.lock')
@@ -258,12 +321,30 @@ class RaidenService(object):
 
             # Prevent concurrent acces to the same db
             self.db_lock = filelock.FileLock(self.lock_file)
+
+            self.snapshot_writer = SnapshotWriter(
+                self.serialization_file,
+                config['snapshot_deltas_per_base'],
+            )
+            self.snapshot_task = SnapshotTask(
+                self,
+                config['snapshot_state_changes'],
+                config['snapshot_interval'],
+            )
         else:
             self.database_dir = None
             self.lock_file = None
             self.snapshot_dir = None
             self.serialization_file = None
             self.db_lock = None
+            self.snapshot_writer = None
+            self.snapshot_task = None
+
+        # The last state change included in the snapshot
+        self.snapshot_state_change_id = self.transaction_log.last_state_change_id
+
+        # The transfers registered while replaying are already logged
+        self.replaying_state_changes = False
 
         # If the endpoint registration fails the node will quit, this must
         # finish before starting the protocol
@@ -280,17 +361,37 @@ class RaidenService(object):
         self.alarm.register_callback(self.poll_blockchain_events)
         self.alarm.register_callback(self.set_block_number)
 
+        snapshot_data = None
+        if self.database_dir is not None:
+            self.db_lock.acquire(timeout=0)
+            assert self.db_lock.is_locked
+            snapshot_data = self.load_snapshot_data()
+
+        # The channels restored lazily are not queried while the registry is
+        # registered, they are verified in the background instead
+        lazy_channels = set()
+        if snapshot_data is not None and self.config['lazy_restore']:
+            lazy_channels = {
+                serialized_channel.channel_address
+                for serialized_channel in snapshot_data['channels']
+                if can_restore_lazily(serialized_channel)
+            }
+
         # Registry registration must start *after* the alarm task, this avoid
         # corner cases were the registry is queried in block A, a new block B
         # is mined, and the alarm starts polling at block C.
-        self.register_registry(self.default_registry.address)
+        self.register_registry(
+            self.default_registry.address,
+            skip_channels=lazy_channels,
+        )
 
         # Restore from snapshot must come after registering the registry as we
         # need to know the registered tokens to populate `token_to_channelgraph`
-        if self.database_dir is not None:
-            self.db_lock.acquire(timeout=0)
-            assert self.db_lock.is_locked
-            self.restore_from_snapshots()
+        if snapshot_data is not None:
+            self.restore_from_snapshots(snapshot_data, lazy_channels)
+
+        if self.snapshot_task is not None:
+            self.snapshot_task.start()
 
         # Start the protocol after the registry is queried to avoid warning
         # about unknown channels.
@@ -309,8 +410,12 @@ class RaidenService(object):
         """ Stop the node. """
         self.alarm.stop_async()
         self.protocol.stop_and_wait()
+        self.channel_verification_pool.kill()
 
         wait_for = [self.alarm]
+        if self.snapshot_task is not None:
+            self.snapshot_task.stop_async()
+            wait_for.append(self.snapshot_task)
         wait_for.extend(self.protocol.greenlets)
         wait_for.extend(self.greenlet_task_dispatcher.stop())
         gevent.wait(wait_for)
@@ -321,9 +426,13 @@ class RaidenService(object):
         # `poll_blockchain_events` will fail.
         self.blockchain_events.uninstall_all_event_listeners()
 
-        # save the state after all tasks are done
+        # commit the state changes pending in a group commit
+        self.transaction_log.flush()
+
+        # save the state after all tasks are done, the log is compacted by
+        # the periodic snapshots only to keep the shutdown fast
         if self.serialization_file:
-            save_snapshot(self.serialization_file, self)
+            self.snapshot(compact=False)
 
         if self.db_lock is not None:
             self.db_lock.release()
@@ -331,7 +440,59 @@ class RaidenService(object):
     def __repr__(self):
         return '<{} {}>'.format(self.__class__.__name__, pex(self.address))
 
-    def restore_from_snapshots(self):
+    def snapshot(self, compact=False):
+        """ Save a snapshot of the node state.
+
+        Args:
+            compact (bool): Discard the logged state changes which are part of
+                the snapshot and don't need to be replayed anymore.
+        """
+        # With group commits the last state changes may not be durable yet,
+        # after a crash SQLite would reuse their ids and the replay would
+        # skip them as part of the snapshot
+        self.transaction_log.flush()
+        state_change_id = self.transaction_log.last_state_change_id
+        self.snapshot_writer.save(self, state_change_id)
+        self.snapshot_state_change_id = state_change_id
+
+        if compact:
+            self.transaction_log.compact(state_change_id)
+
+            if self.config['database_retention_blocks'] is not None:
+                self.prune_transaction_log()
+
+            if self.config['database_ack_retention'] is not None:
+                self.transaction_log.prune_acks(
+                    time.time() - self.config['database_ack_retention'],
+                )
+
+        log.debug('snapshot saved', state_change_id=state_change_id)
+
+    def prune_transaction_log(self):
+        """ Remove from the transaction log the events of the finalized
+        transfers that are older than the retention period, together with the
+        state changes that are part of the snapshot.
+        """
+        before_block = self.get_block_number() - self.config['database_retention_blocks']
+
+        live_identifiers = {
+            identifier
+            for identifier, manager_list in self.identifier_to_statemanagers.iteritems()
+            if any(manager.current_state is not None for manager in manager_list)
+        }
+
+        pruned = self.transaction_log.prune(
+            before_block,
+            self.snapshot_state_change_id,
+            live_identifiers,
+        )
+
+        log.debug('transaction log pruned', before_block=before_block, events=pruned)
+
+    def load_snapshot_data(self):
+        """ Return the snapshot data if it was saved for the current
+        registry, None otherwise.
+        """
         data = load_snapshot(self.serialization_file)
         data_exists_and_is_recent = (
             data is not None and
@@ -340,35 +501,119 @@ class RaidenService(object):
         )
 
         if data_exists_and_is_recent:
-            first_channel = True
-            for channel in data['channels']:
-                try:
-                    self.restore_channel(channel)
-                    first_channel = False
-                except AddressWithoutCode as e:
+            return data
+
+        return None
+
+    def restore_from_snapshots(self, data, lazy_channels=()):
+        """ Restore the node state from the snapshot `data`.
+
+        Args:
+            data (dict): The snapshot returned by `load_snapshot_data`.
+            lazy_channels (set): Addresses of the channels restored from the
+                snapshot alone, these are verified against the blockchain in the
+                background.
+        """
+        unverified_channels = list()
+        first_channel = True
+        for channel in data['channels']:
+            if channel.channel_address in lazy_channels:
+                unverified_channels.append(self.restore_channel_lazily(channel))
+                continue
+
+            try:
+                self.restore_channel(channel)
+                first_channel = False
+            except AddressWithoutCode as e:
+                log.warn(
+                    'Channel without code while restoring. Must have been '
+                    'already settled while we were offline.',
+                    error=str(e)
+                )
+            except AttributeError as e:
+                if first_channel:
                     log.warn(
-                        'Channel without code while restoring. Must have been '
-                        'already settled while we were offline.',
+                        'AttributeError during channel restoring. If code has changed'
+                        ' then this is fine. If not then please report a bug.',
                         error=str(e)
                     )
-                except AttributeError as e:
-                    if first_channel:
-                        log.warn(
-                            'AttributeError during channel restoring. If code has changed'
-                            ' then this is fine. If not then please report a bug.',
-                            error=str(e)
-                        )
-                        break
-                    else:
-                        raise
+                    break
+                else:
+                    raise
+
+        for restored_queue in data['queues']:
+            self.restore_queue(restored_queue)
 
-            for restored_queue in data['queues']:
-                self.restore_queue(restored_queue)
+        self.protocol.receivedhashes_to_acks.update(data['receivedhashes_to_acks'])
+        self.protocol.nodeaddresses_to_nonces = data['nodeaddresses_to_nonces']
 
-            self.protocol.receivedhashes_to_acks = data['receivedhashes_to_acks']
-            self.protocol.nodeaddresses_to_nonces = data['nodeaddresses_to_nonces']
+        self.restore_transfer_states(data['transfers'])
+        self.snapshot_writer.start_from(data.get('sequence', 0))
 
-            self.restore_transfer_states(data['transfers'])
+        # Snapshots saved by older versions don't have the state change id
+        # and are only written on a clean shutdown, there is nothing to
+        # replay
+        state_change_id = data.get('state_change_id')
+        if state_change_id is not None:
+            self.snapshot_state_change_id = state_change_id
+            self.replay_state_changes(state_change_id)
+
+        for channel in unverified_channels:
+            self.channel_verification_pool.spawn(self.verify_channel, channel)
+
+    def replay_state_changes(self, state_change_id):
+        """ Apply the state changes logged after the snapshot taken at
+        `state_change_id` to the restored state managers and channels.
+
+        The replay stops at the first state change that cannot be applied,
+        e.g. a transfer that unlocks a lock the snapshot does not have, so
+        the transfers are never restored ahead of their channels.
+
+        Note:
+            Issue #489, a replayed `ActionInitInitiator` generates a new
+            secret, the events of the replayed state changes are not executed
+            again to avoid sending conflicting messages.
+        """
+        pending_state_changes = self.transaction_log.get_state_changes_after(state_change_id)
+
+        replayed = 0
+        self.replaying_state_changes = True
+        try:
+            for pending_state_change_id, state_change in pending_state_changes:
+                try:
+                    self.state_machine_event_handler.replay(state_change)
+                except Exception:  # pylint: disable=broad-except
+                    # The later state changes depend on this one, the
+                    # transfers must not be restored ahead of the channels
+                    log.exception(
+                        'state change could not be replayed, the later state changes are ignored',
+                        state_change_id=pending_state_change_id,
+                    )
+                    break
+
+                replayed += 1
+        finally:
+            self.replaying_state_changes = False
+
+        log.debug(
+            'replayed state changes',
+            snapshot_state_change_id=state_change_id,
+            count=replayed,
+        )
+
+    def log_channel_transfer(self, channel, block_number, transfer):
+        """ Log a transfer registered in `channel`, the replay registers it
+        again in the channel restored from the snapshot.
+        """
+        if self.replaying_state_changes:
+            return
+
+        state_change = ActionRegisterTransfer(
+            block_number,
+            channel.channel_address,
+            transfer.encode(),
+        )
+        self.transaction_log.log(state_change)
 
     def set_block_number(self, blocknumber):
         state_change = Block(blocknumber)
@@ -615,6 +860,7 @@ class RaidenService(object):
         external_state = ChannelExternalState(
             register_channel_for_hashlock,
             netting_channel,
+            self.log_channel_transfer,
         )
 
         channel_detail = ChannelDetails(
@@ -642,30 +888,18 @@ class RaidenService(object):
         # our_address is checked by detail
         assert channel_details['partner_address'] == serialized_channel.partner_address
 
-        if serialized_channel.our_leaves:
-            our_layers = compute_layers(serialized_channel.our_leaves)
-            our_tree = MerkleTreeState(our_layers)
-        else:
-            our_tree = EMPTY_MERKLE_TREE
-
         our_state = ChannelEndState(
             channel_details['our_address'],
             channel_details['our_balance'],
             serialized_channel.our_balance_proof,
-            our_tree,
+            merkletree_from_leaves(serialized_channel.our_leaves),
         )
 
-        if serialized_channel.partner_leaves:
-            partner_layers = compute_layers(serialized_channel.partner_leaves)
-            partner_tree = MerkleTreeState(partner_layers)
-        else:
-            partner_tree = EMPTY_MERKLE_TREE
-
         partner_state = ChannelEndState(
             channel_details['partner_address'],
             channel_details['partner_balance'],
             serialized_channel.partner_balance_proof,
-            partner_tree,
+            merkletree_from_leaves(serialized_channel.partner_leaves),
         )
 
         def register_channel_for_hashlock(channel, hashlock):
@@ -678,6 +912,7 @@ class RaidenService(object):
         external_state = ChannelExternalState(
             register_channel_for_hashlock,
             netting_channel,
+            self.log_channel_transfer,
         )
         details = ChannelDetails(
             serialized_channel.channel_address,
@@ -694,8 +929,180 @@ class RaidenService(object):
             serialized_channel.channel_address,
         )
 
+        # the channel may already exist, the version must move for its
+        # balances to be recomputed and the channel to be in the next delta
         channel.our_state.balance_proof = serialized_channel.our_balance_proof
         channel.partner_state.balance_proof = serialized_channel.partner_balance_proof
+        channel.changed()
+
+    def restore_channel_lazily(self, serialized_channel):
+        """ Restore a channel from the snapshot without querying the
+        blockchain, the channel is usable for receiving until it is verified
+        by `verify_channel`.
+        """
+        token_address = serialized_channel.token_address
+
+        our_state = ChannelEndState(
+            serialized_channel.our_address,
+            serialized_channel.our_balance,
+            serialized_channel.our_balance_proof,
+            merkletree_from_leaves(serialized_channel.our_leaves),
+        )
+        partner_state = ChannelEndState(
+            serialized_channel.partner_address,
+            serialized_channel.partner_balance,
+            serialized_channel.partner_balance_proof,
+            merkletree_from_leaves(serialized_channel.partner_leaves),
+        )
+
+        def register_channel_for_hashlock(channel, hashlock):
+            self.register_channel_for_hashlock(
+                token_address,
+                channel,
+                hashlock,
+            )
+
+        netting_channel = LazyNettingChannel(
+            self.chain,
+            serialized_channel.channel_address,
+            serialized_channel.opened_block,
+            serialized_channel.closed_block,
+        )
+        external_state = ChannelExternalState(
+            register_channel_for_hashlock,
+            netting_channel,
+            self.log_channel_transfer,
+        )
+        details = ChannelDetails(
+            serialized_channel.channel_address,
+            our_state,
+            partner_state,
+            external_state,
+            serialized_channel.reveal_timeout,
+            serialized_channel.settle_timeout,
+        )
+
+        graph = self.token_to_channelgraph[token_address]
+        graph.add_channel(details)
+        channel = graph.address_to_channel[serialized_channel.channel_address]
+        channel.verified = False
+
+        return channel
+
+    def verify_channel(self, channel):
+        """ Check a channel restored lazily against the blockchain, retrying
+        until the blockchain can be queried.
+        """
+        timeouts = timeout_exponential_backoff(
+            1,
+            DEFAULT_RESTORE_RETRY_TIMEOUT,
+            DEFAULT_RESTORE_RETRY_TIMEOUT_MAX,
+        )
+
+        # the event listener is installed once, before the on-chain state is
+        # read so that no event is missed
+        netting_channel = None
+        while True:
+            try:
+                if netting_channel is None:
+                    netting_channel = self.listen_to_restored_channel(channel)
+
+                    if netting_channel is None:
+                        return
+
+                self.update_restored_channel(channel, netting_channel)
+                return
+
+            except Exception as e:  # pylint: disable=broad-except
+                # the channel cannot send until it is verified
+                timeout = next(timeouts)
+                log.error(
+                    'Channel verification failed, retrying',
+                    channel_address=pex(channel.channel_address),
+                    error=str(e),
+                    retry_in=timeout,
+                )
+                gevent.sleep(timeout)
+
+    def listen_to_restored_channel(self, channel):
+        """ Install the event listener of a channel restored lazily and return
+        its netting channel proxy.
+
+        Returns None if the channel was settled or does not match the
+        blockchain, the latter is removed.
+        """
+        try:
+            netting_channel = self.chain.netting_channel(channel.channel_address)
+            channel_details = netting_channel.detail()
+        except AddressWithoutCode as e:
+            log.warn(
+                'Channel without code while verifying. Must have been '
+                'already settled while we were offline.',
+                error=str(e)
+            )
+            if channel.external_state.set_settled(self.get_block_number()):
+                channel.changed()
+            return None
+
+        if channel_details['partner_address'] != channel.partner_address:
+            log.error(
+                'Restored channel does not match the blockchain, removing it',
+                channel_address=pex(channel.channel_address),
+                partner_address=pex(channel.partner_address),
+            )
+            self.remove_channel(channel)
+            return None
+
+        self.blockchain_events.add_netting_channel_listener(netting_channel)
+        return netting_channel
+
+    def update_restored_channel(self, channel, netting_channel):
+        """ Update a channel restored lazily with its on-chain state and mark
+        it as verified.
+        """
+        channel_details = netting_channel.detail()
+
+        external_state = channel.external_state
+        external_state.netting_channel = netting_channel
+
+        # the balances may have increased while we were offline
+        if channel_details['our_balance'] != channel.our_state.contract_balance:
+            channel.update_contract_balance(
+                channel.our_address,
+                channel_details['our_balance'],
+            )
+
+        if channel_details['partner_balance'] != channel.partner_state.contract_balance:
+            channel.update_contract_balance(
+                channel.partner_address,
+                channel_details['partner_balance'],
+            )
+
+        if external_state.opened_block == 0:
+            opened_block = netting_channel.opened()
+            if opened_block != 0:
+                external_state.set_opened(opened_block)
+                channel.changed()
+
+        # the version must move for the new blocks to be in the next delta
+        # snapshot
+        closed_block = netting_channel.closed()
+        if closed_block != 0 and external_state.set_closed(closed_block):
+            channel.changed()
+
+        channel.verified = True
+
+    def remove_channel(self, channel):
+        """ Forget a channel, its transfers are not usable anymore. """
+        graph = self.token_to_channelgraph[channel.token_address]
+        graph.remove_channel(channel)
+
+        for channels in self.token_to_hashlock_to_channels[channel.token_address].itervalues():
+            channels[:] = [
+                registered_channel
+                for registered_channel in channels
+                if registered_channel is not channel
+            ]
 
     def restore_queue(self, serialized_queue):
         receiver_address = serialized_queue['receiver_address']
@@ -712,11 +1119,12 @@ class RaidenService(object):
     def restore_transfer_states(self, transfer_states):
         self.identifier_to_statemanagers = transfer_states
 
-    def register_registry(self, registry_address):
+    def register_registry(self, registry_address, skip_channels=()):
         proxies = get_relevant_proxies(
             self.chain,
             self.address,
             registry_address,
+            skip_channels,
         )
 
         # Install the filters first to avoid missing changes, as a consequence
@@ -954,7 +1362,10 @@ class RaidenService(object):
                 direct_channel.partner_state.address,
             )
             # TODO: add the transfer sent event
-            state_change_id = self.transaction_log.log(direct_transfer_state_change)
+            state_change_id = self.transaction_log.log(
+                direct_transfer_state_change,
+                events_pending=True,
+            )
 
             # TODO: This should be set once the direct transfer is acknowledged
             transfer_success = EventTransferSentSuccess(
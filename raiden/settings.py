@@ -13,6 +13,32 @@ DEFAULT_PROTOCOL_RETRIES_BEFORE_BACKOFF = 5
 DEFAULT_PROTOCOL_THROTTLE_CAPACITY = 10.
 DEFAULT_PROTOCOL_THROTTLE_FILL_RATE = 10.
 DEFAULT_PROTOCOL_RETRY_INTERVAL = 1.
+DEFAULT_PROTOCOL_DECODE_CACHE_SIZE = 1024
+# Acknowledgments of the received messages held in memory, the least recently
+# used ones and the ones unused for the TTL in seconds are spilled to the
+# database
+DEFAULT_PROTOCOL_ACK_CACHE_SIZE = 10000
+DEFAULT_PROTOCOL_ACK_CACHE_TTL = 60 * 60
+# Number of threads recovering the senders of the received messages, zero
+# does it inline in the hub
+DEFAULT_PROTOCOL_VERIFY_WORKERS = 0
+# Packets waiting for the verification workers, the packets received while
+# the queue is full are dropped and retransmitted by their senders
+DEFAULT_PROTOCOL_VERIFY_MAX_PENDING = 4096
+# Number of unacknowledged messages in flight per channel queue, one is
+# stop-and-wait
+DEFAULT_PROTOCOL_SEND_WINDOW = 1
+# Seconds an Ack waits to be sent together with other Acks to the same node,
+# zero sends every Ack right away
+DEFAULT_PROTOCOL_ACK_DELAY = 0
+# Pack the messages sent to the same node in one iteration of the event loop
+# into a single datagram, only done for nodes that advertised support for it
+DEFAULT_PROTOCOL_BATCH_MESSAGES = False
+# Number of greenlets running the retransmissions and the health checks of all
+# the nodes from a shared timer wheel, zero uses a greenlet per queue and per
+# health check
+DEFAULT_PROTOCOL_SCHEDULER_WORKERS = 0
+DEFAULT_PROTOCOL_SCHEDULER_RESOLUTION = 0.05
 
 DEFAULT_REVEAL_TIMEOUT = 10
 DEFAULT_SETTLE_TIMEOUT = DEFAULT_REVEAL_TIMEOUT * 9
@@ -22,6 +48,30 @@ DEFAULT_JOINABLE_FUNDS_TARGET = 0.4
 DEFAULT_INITIAL_CHANNEL_TARGET = 3
 DEFAULT_WAIT_FOR_SETTLE = True
 
+DEFAULT_DATABASE_BACKEND = 'sqlite'
+DEFAULT_DATABASE_SYNCHRONOUS = 'NORMAL'
+DEFAULT_DATABASE_SERIALIZER = 'pickle'
+DEFAULT_DATABASE_GROUP_COMMIT_SIZE = 1
+DEFAULT_DATABASE_GROUP_COMMIT_TIMEOUT = 0.05
+DEFAULT_DATABASE_SEGMENT_SIZE = 64 * 1024 * 1024
+# Number of blocks the events of finalized transfers are kept in the
+# database, None keeps them forever
+DEFAULT_DATABASE_RETENTION_BLOCKS = None
+DEFAULT_DATABASE_ARCHIVE = True
+# Seconds the spilled acknowledgments are kept in the database, None keeps
+# them forever
+DEFAULT_DATABASE_ACK_RETENTION = 30 * 24 * 60 * 60
+
+DEFAULT_SNAPSHOT_STATE_CHANGES = 1000
+DEFAULT_SNAPSHOT_INTERVAL = 600
+DEFAULT_SNAPSHOT_DELTAS_PER_BASE = 16
+DEFAULT_LAZY_RESTORE = False
+DEFAULT_RESTORE_CONCURRENCY = 8
+# Seconds before retrying to verify a channel restored lazily, doubled after
+# every failure up to the maximum
+DEFAULT_RESTORE_RETRY_TIMEOUT = 5
+DEFAULT_RESTORE_RETRY_TIMEOUT_MAX = 300
+
 DEFAULT_NAT_KEEPALIVE_RETRIES = 2
 DEFAULT_NAT_KEEPALIVE_TIMEOUT = 10
 DEFAULT_NAT_INVITATION_TIMEOUT = 180
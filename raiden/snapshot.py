@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+""" Differential snapshots of the node state.
+
+A snapshot is made of a full *base* file and a sequence of *delta* files. The
+base has every channel, queue, acknowledgment and state manager of the node,
+a delta has only the channels and state managers that changed since the
+previous snapshot, the keys of the ones that were removed and the
+acknowledgments that were added since then. A new base is written once
+`deltas_per_base` deltas accumulated, this bounds the time to load the snapshot
+and the disk space used by stale data.
+
+Every snapshot file has a sequence number, a delta is applied on top of the
+base only if its sequence number is larger than the base's. Deltas left behind
+by a crash after a new base was written are ignored and removed with the next
+base.
+"""
+import glob
+import os
+import cPickle as pickle
+from collections import OrderedDict, defaultdict
+
+import gevent
+from ethereum import slogging
+
+from raiden.channel.netting_channel import ChannelSerialization
+from raiden.constants import ROPSTEN_REGISTRY_ADDRESS
+
+log = slogging.get_logger(__name__)  # pylint: disable=invalid-name
+
+
+def delta_file_pattern(serialization_file):
+    return serialization_file + '.delta.*'
+
+
+def delta_file_name(serialization_file, sequence):
+    return '{}.delta.{}'.format(serialization_file, sequence)
+
+
+def delta_file_sequence(delta_file):
+    return int(delta_file.rsplit('.', 1)[1])
+
+
+def read_snapshot_file(serialization_file):
+    with open(serialization_file, 'rb') as handler:
+        return pickle.load(handler)
+
+
+def write_snapshot_file(serialization_file, data):
+    """ Atomically replace `serialization_file` with `data`, a crash while
+    writing leaves the previous snapshot intact.
+    """
+    temporary_file = serialization_file + '.tmp'
+
+    with open(temporary_file, 'wb') as handler:
+        handler.write(data)
+        handler.flush()
+        os.fsync(handler.fileno())
+
+    os.rename(temporary_file, serialization_file)
+
+
+def apply_delta(data, delta):
+    """ Update the snapshot `data` with the changes from `delta`. """
+    channels = OrderedDict(
+        (channel.channel_address, channel)
+        for channel in data['channels']
+    )
+    for channel in delta['channels']:
+        channels[channel.channel_address] = channel
+
+    # deltas written by older versions do not have the removals
+    for channel_address in delta.get('removed_channels', ()):
+        channels.pop(channel_address, None)
+
+    data['channels'] = channels.values()
+    data['queues'] = delta['queues']
+    data['receivedhashes_to_acks'].update(delta['receivedhashes_to_acks'])
+    data['nodeaddresses_to_nonces'] = delta['nodeaddresses_to_nonces']
+    data['transfers'].update(delta['transfers'])
+    for identifier in delta.get('removed_transfers', ()):
+        data['transfers'].pop(identifier, None)
+
+    data['state_change_id'] = delta['state_change_id']
+    data['sequence'] = delta['sequence']
+
+
+def load_snapshot(serialization_file):
+    """ Load the base snapshot and apply its deltas, returns None if there is
+    no snapshot.
+    """
+    if not os.path.exists(serialization_file):
+        return None
+
+    data = read_snapshot_file(serialization_file)
+    base_sequence = data.get('sequence', 0)
+
+    delta_files = sorted(
+        glob.glob(delta_file_pattern(serialization_file)),
+        key=delta_file_sequence,
+    )
+    for delta_file in delta_files:
+        if delta_file_sequence(delta_file) > base_sequence:
+            apply_delta(data, read_snapshot_file(delta_file))
+
+    return data
+
+
+class SnapshotWriter(object):
+    """ Writes the node state as a base snapshot followed by deltas.
+
+    Args:
+        serialization_file (str): Path of the base snapshot, the deltas are
+            saved next to it.
+        deltas_per_base (int): Number of deltas written before a new base.
+    """
+
+    def __init__(self, serialization_file, deltas_per_base):
+        self.serialization_file = serialization_file
+        self.deltas_per_base = deltas_per_base
+
+        self.sequence = max([0] + [
+            delta_file_sequence(delta_file)
+            for delta_file in glob.glob(delta_file_pattern(serialization_file))
+        ])
+        self.deltas = None
+
+        # What was persisted, used to find the dirty state. The state objects
+        # of the state managers are kept alive to compare their identity, the
+        # StateManager replaces its `current_state` on every transition.
+        self.channel_versions = dict()
+        self.transfer_states = dict()
+        self.ack_hashes = set()
+
+    def start_from(self, sequence):
+        """ Continue the sequence of the snapshot that was restored, the next
+        snapshot is a base.
+        """
+        self.sequence = max(self.sequence, sequence)
+        self.deltas = None
+
+    def save(self, raiden, state_change_id):
+        """ Save the node state, either as a base or as a delta. """
+        is_base = self.deltas is None or self.deltas >= self.deltas_per_base
+
+        channel_versions = dict()
+        all_channels = list()
+        for network in raiden.token_to_channelgraph.values():
+            for channel in network.address_to_channel.values():
+                channel_versions[channel.channel_address] = channel.version
+
+                is_dirty = (
+                    is_base or
+                    self.channel_versions.get(channel.channel_address) != channel.version
+                )
+                if is_dirty:
+                    all_channels.append(ChannelSerialization(channel))
+
+        transfer_states = dict()
+        dirty_transfers = defaultdict(list)
+        for identifier, manager_list in raiden.identifier_to_statemanagers.iteritems():
+            states = [manager.current_state for manager in manager_list]
+            transfer_states[identifier] = states
+
+            persisted_states = self.transfer_states.get(identifier)
+            is_dirty = (
+                is_base or
+                persisted_states is None or
+                len(states) != len(persisted_states) or
+                any(
+                    state is not persisted_state
+                    for state, persisted_state in zip(states, persisted_states)
+                )
+            )
+            if is_dirty:
+                dirty_transfers[identifier] = manager_list
+
+        # Only the acknowledgments held in memory are saved, the evicted ones
+        # were spilled to the database
+        receivedhashes_to_acks = dict(raiden.protocol.receivedhashes_to_acks.items())
+        ack_hashes = set(receivedhashes_to_acks)
+        if is_base:
+            new_acks = receivedhashes_to_acks
+        else:
+            new_acks = {
+                echohash: receivedhashes_to_acks[echohash]
+                for echohash in ack_hashes - self.ack_hashes
+            }
+
+        all_queues = list()
+        for key, queue in raiden.protocol.channel_queue.iteritems():
+            queue_data = {
+                'receiver_address': key[0],
+                'token_address': key[1],
+                'messages': queue.copy(),
+            }
+            all_queues.append(queue_data)
+
+        # a base has only the current state, a delta must remove what is not
+        # there anymore from the previous snapshots
+        if is_base:
+            removed_channels = list()
+            removed_transfers = list()
+        else:
+            removed_channels = [
+                channel_address
+                for channel_address in self.channel_versions
+                if channel_address not in channel_versions
+            ]
+            removed_transfers = [
+                identifier
+                for identifier in self.transfer_states
+                if identifier not in transfer_states
+            ]
+
+        sequence = self.sequence + 1
+        data = {
+            'channels': all_channels,
+            'removed_channels': removed_channels,
+            'queues': all_queues,
+            'receivedhashes_to_acks': new_acks,
+            'nodeaddresses_to_nonces': raiden.protocol.nodeaddresses_to_nonces,
+            'transfers': dirty_transfers,
+            'removed_transfers': removed_transfers,
+            'registry_address': ROPSTEN_REGISTRY_ADDRESS,
+            'state_change_id': state_change_id,
+            'sequence': sequence,
+        }
+
+        # The state is serialized without switching greenlets, so the
+        # snapshot is consistent with `state_change_id`. __slots__ without
+        # __getstate__ require `-1`
+        serialized_data = pickle.dumps(data, protocol=-1)
+
+        if is_base:
+            snapshot_file = self.serialization_file
+        else:
+            snapshot_file = delta_file_name(self.serialization_file, sequence)
+
+        # Writing the file happens in the hub's threadpool, the other greenlets
+        # can run while it is flushed to disk
+        gevent.get_hub().threadpool.apply(
+            write_snapshot_file,
+            (snapshot_file, serialized_data),
+        )
+
+        self.sequence = sequence
+        self.channel_versions = channel_versions
+        self.transfer_states = transfer_states
+        self.ack_hashes = ack_hashes
+
+        if is_base:
+            self.deltas = 0
+            self.remove_deltas()
+        else:
+            self.deltas += 1
+
+        log.debug(
+            'snapshot written',
+            is_base=is_base,
+            sequence=sequence,
+            channels=len(all_channels),
+            transfers=len(dirty_transfers),
+            size=len(serialized_data),
+        )
+
+    def remove_deltas(self):
+        """ Remove the deltas that are older than the current base. """
+        for delta_file in glob.glob(delta_file_pattern(self.serialization_file)):
+            if delta_file_sequence(delta_file) <= self.sequence:
+                os.remove(delta_file)
@@ -124,3 +124,50 @@ class AlarmTask(Task):
 
     def stop_async(self):
         self.stop_event.set(True)
+
+
+class SnapshotTask(Task):
+    """ Task to periodically snapshot the node state.
+
+    A snapshot is taken once `state_changes_interval` state changes were logged
+    or `time_interval` seconds elapsed since the previous snapshot, whichever
+    comes first.
+    """
+
+    def __init__(self, raiden, state_changes_interval, time_interval, poll_interval=1):
+        super(SnapshotTask, self).__init__()
+
+        self.raiden = raiden
+        self.state_changes_interval = state_changes_interval
+        self.time_interval = time_interval
+        self.poll_interval = poll_interval
+        self.stop_event = AsyncResult()
+        self.last_snapshot = time.time()
+
+    def _run(self):  # pylint: disable=method-hidden
+        while self.stop_event.wait(self.poll_interval) is not True:
+            pending_state_changes = (
+                self.raiden.transaction_log.last_state_change_id -
+                self.raiden.snapshot_state_change_id
+            )
+            elapsed = time.time() - self.last_snapshot
+
+            should_snapshot = pending_state_changes > 0 and (
+                pending_state_changes >= self.state_changes_interval or
+                elapsed >= self.time_interval
+            )
+
+            if should_snapshot:
+                try:
+                    self.raiden.snapshot(compact=True)
+                except:  # pylint: disable=bare-except
+                    log.exception('unexpected exception on snapshot')
+
+                self.last_snapshot = time.time()
+
+    def stop_and_wait(self):
+        self.stop_event.set(True)
+        gevent.wait(self)
+
+    def stop_async(self):
+        self.stop_event.set(True)
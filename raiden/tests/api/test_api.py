@@ -167,7 +167,8 @@ def test_channel_to_api_dict():
         'settle_timeout': settle_timeout,
         'reveal_timeout': reveal_timeout,
         'balance': our_balance,
-        'state': CHANNEL_STATE_OPENED
+        'state': CHANNEL_STATE_OPENED,
+        'verified': True,
     }
     assert result == expected_result
 
@@ -296,6 +297,7 @@ def test_api_open_and_deposit_channel(
     expected_response = channel_data_obj
     expected_response['balance'] = 0
     expected_response['state'] = CHANNEL_STATE_OPENED
+    expected_response['verified'] = True
     # can't know the channel address beforehand but make sure we get one
     assert 'channel_address' in response
     first_channel_address = response['channel_address']
@@ -310,7 +312,8 @@ def test_api_open_and_deposit_channel(
         'token_address': token_address,
         'settle_timeout': settle_timeout,
         'reveal_timeout': reveal_timeout,
-        'balance': balance
+        'balance': balance,
+        'verified': True,
     }
     request = grequests.put(
         api_url_for(api_backend, 'channelsresource'),
@@ -323,6 +326,7 @@ def test_api_open_and_deposit_channel(
     expected_response = channel_data_obj
     expected_response['balance'] = balance
     expected_response['state'] = CHANNEL_STATE_OPENED
+    expected_response['verified'] = True
     # can't know the channel address beforehand but make sure we get one
     assert 'channel_address' in response
     expected_response['channel_address'] = response['channel_address']
@@ -348,7 +352,8 @@ def test_api_open_and_deposit_channel(
         'settle_timeout': settle_timeout,
         'reveal_timeout': reveal_timeout,
         'state': CHANNEL_STATE_OPENED,
-        'balance': balance
+        'balance': balance,
+        'verified': True,
     }
     assert response == expected_response
 
@@ -371,7 +376,8 @@ def test_api_open_and_deposit_channel(
         'settle_timeout': settle_timeout,
         'reveal_timeout': reveal_timeout,
         'state': CHANNEL_STATE_OPENED,
-        'balance': balance
+        'balance': balance,
+        'verified': True,
     }
     assert response == expected_response
 
@@ -402,6 +408,7 @@ def test_api_open_close_and_settle_channel(
     expected_response = channel_data_obj
     expected_response['balance'] = balance
     expected_response['state'] = CHANNEL_STATE_OPENED
+    expected_response['verified'] = True
     # reveal_timeout not specified, expect it to be the default
     expected_response['reveal_timeout'] = reveal_timeout
     # can't know the channel address beforehand but make sure we get one
@@ -428,7 +435,8 @@ def test_api_open_close_and_settle_channel(
         'settle_timeout': settle_timeout,
         'reveal_timeout': reveal_timeout,
         'state': CHANNEL_STATE_CLOSED,
-        'balance': balance
+        'balance': balance,
+        'verified': True,
     }
     assert response.json() == expected_response
 
@@ -450,7 +458,8 @@ def test_api_open_close_and_settle_channel(
         'settle_timeout': settle_timeout,
         'reveal_timeout': reveal_timeout,
         'state': CHANNEL_STATE_SETTLED,
-        'balance': balance
+        'balance': balance,
+        'verified': True,
     }
     assert response.json() == expected_response
 
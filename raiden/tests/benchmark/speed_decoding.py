@@ -6,6 +6,7 @@ import timeit
 
 import coincurve
 
+from raiden.encoding import messages
 from raiden.utils import sha3, privatekey_to_address
 from raiden.messages import decode
 from raiden.messages import (
@@ -16,12 +17,13 @@ from raiden.messages import (
 PRIVKEY_BIN = 'x' * 32
 PRIVKEY = coincurve.PrivateKey(PRIVKEY_BIN)
 ADDRESS = privatekey_to_address(PRIVKEY_BIN)
-HASH = sha3(PRIVKEY)
+HASH = sha3(PRIVKEY_BIN)
 ITERATIONS = 1000000  # timeit default
 
 
 def run_timeit(message_name, message, iterations=ITERATIONS):
     data = message.encode()
+    message_class = type(message)
 
     def test_encode():
         message.encode()
@@ -29,10 +31,42 @@ def run_timeit(message_name, message, iterations=ITERATIONS):
     def test_decode():
         decode(data)
 
+    # decoding without the signature recovery, reading the fields through the
+    # namedbuffer attributes or with the precompiled struct, and then
+    # instantiating the message
+    field_names = messages.unpack(data)._fields
+
+    def test_fields_wrap():
+        packed = messages.wrap(data)
+        return [getattr(packed, name) for name in field_names]
+
+    def test_fields_struct():
+        messages.unpack(data)
+
+    def test_unpack_wrap():
+        message_class.unpack(messages.wrap(data))
+
+    def test_unpack_struct():
+        message_class.unpack(messages.unpack(data))
+
     encode_time = timeit.timeit(test_encode, number=iterations)
     decode_time = timeit.timeit(test_decode, number=iterations)
-
-    print('{}: encode {} decode {}'.format(message_name, encode_time, decode_time))
+    fields_wrap_time = timeit.timeit(test_fields_wrap, number=iterations)
+    fields_struct_time = timeit.timeit(test_fields_struct, number=iterations)
+    unpack_wrap_time = timeit.timeit(test_unpack_wrap, number=iterations)
+    unpack_struct_time = timeit.timeit(test_unpack_struct, number=iterations)
+
+    print('{}: encode {:.4f} decode {:.4f}'.format(message_name, encode_time, decode_time))
+    print('    fields: wrap {:.4f} struct {:.4f} ({:.1f}x)'.format(
+        fields_wrap_time,
+        fields_struct_time,
+        fields_wrap_time / fields_struct_time,
+    ))
+    print('    unpack: wrap {:.4f} struct {:.4f} ({:.1f}x)'.format(
+        unpack_wrap_time,
+        unpack_struct_time,
+        unpack_wrap_time / unpack_struct_time,
+    ))
 
 
 def test_ack(iterations=ITERATIONS):
@@ -62,10 +96,10 @@ def test_secret_request(iterations=ITERATIONS):
 def test_secret(iterations=ITERATIONS):
     identifier = 1
     nonce = 1
-    channel = HASH
+    channel = ADDRESS
     transferred_amount = 1
     secret = HASH
-    locksroot = ''
+    locksroot = HASH
     msg = Secret(
         identifier,
         nonce,
@@ -82,6 +116,7 @@ def test_direct_transfer(iterations=ITERATIONS):
     identifier = 1
     nonce = 1
     token = ADDRESS
+    channel = ADDRESS
     balance = 1
     recipient = ADDRESS
     locksroot = HASH
@@ -90,6 +125,7 @@ def test_direct_transfer(iterations=ITERATIONS):
         identifier,
         nonce,
         token,
+        channel,
         balance,
         recipient,
         locksroot,
@@ -107,6 +143,7 @@ def test_mediated_transfer(iterations=ITERATIONS):
 
     nonce = 1
     token = ADDRESS
+    channel = ADDRESS
     balance = 1
     recipient = ADDRESS
     locksroot = sha3(ADDRESS)
@@ -116,6 +153,7 @@ def test_mediated_transfer(iterations=ITERATIONS):
         identifier,
         nonce,
         token,
+        channel,
         balance,
         recipient,
         locksroot,
@@ -138,17 +176,23 @@ def test_cancel_transfer(iterations=ITERATIONS):
     identifier = 1
     nonce = 1
     token = ADDRESS
+    channel = ADDRESS
     transferred_amount = 1
     recipient = ADDRESS
     locksroot = sha3(ADDRESS)
+    target = ADDRESS
+    initiator = ADDRESS
     msg = RefundTransfer(
         identifier,
         nonce,
         token,
+        channel,
         transferred_amount,
         recipient,
         locksroot,
         lock,
+        target,
+        initiator,
     )
     msg.sign(PRIVKEY, ADDRESS)
     run_timeit('RefundTransfer', msg, iterations=iterations)
@@ -159,6 +203,7 @@ def test_all(iterations=ITERATIONS):
     test_ack(iterations=iterations)
     test_ping(iterations=iterations)
     test_secret_request(iterations=iterations)
+    test_secret(iterations=iterations)
     test_direct_transfer(iterations=iterations)
     test_cancel_transfer(iterations=iterations)
 
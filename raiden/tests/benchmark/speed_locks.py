@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import time
+
+from raiden.channel import ChannelEndState
+from raiden.messages import Lock, LockedTransfer, Secret
+from raiden.tests.utils import factories
+from raiden.transfer.merkle_tree import EMPTY_MERKLE_TREE
+from raiden.utils import sha3
+
+ITERATIONS = 1000
+PENDING_LOCKS = (1, 10, 100, 1000)
+CHANNEL_ADDRESS = factories.make_address()
+TOKEN_ADDRESS = factories.make_address()
+PARTNER_ADDRESS = factories.make_address()
+OUR_ADDRESS = factories.make_address()
+
+
+def add_lock(end_state, secret, memoize):
+    """ Validate and register a new lock, the way a mediated transfer is
+    created and then registered.
+    """
+    lock = Lock(1, 100, sha3(secret))
+    locksroot = end_state.compute_merkleroot_with(lock)
+
+    if not memoize:
+        end_state.candidate_merkletrees.clear()
+
+    locked_transfer = LockedTransfer(
+        identifier=1,
+        nonce=1,
+        token=TOKEN_ADDRESS,
+        channel=CHANNEL_ADDRESS,
+        transferred_amount=0,
+        recipient=PARTNER_ADDRESS,
+        locksroot=locksroot,
+        lock=lock,
+    )
+    mediated_transfer = locked_transfer.to_mediatedtransfer(PARTNER_ADDRESS, OUR_ADDRESS, 0)
+    end_state.register_locked_transfer(mediated_transfer)
+
+
+def remove_lock(end_state, secret, memoize):
+    """ Validate and register the unlock of an existing lock, the way a
+    secret message is created and then registered.
+    """
+    end_state.register_secret(secret)
+    lock = end_state.get_lock_by_hashlock(sha3(secret))
+    locksroot = end_state.compute_merkleroot_without(lock)
+
+    if not memoize:
+        end_state.candidate_merkletrees.clear()
+
+    message = Secret(1, 1, CHANNEL_ADDRESS, 0, locksroot, secret)
+    end_state.register_secretmessage(message)
+
+
+def run_locks(pending_locks, iterations, memoize):
+    end_state = ChannelEndState(OUR_ADDRESS, 10 ** 18, None, EMPTY_MERKLE_TREE)
+    secrets = [sha3('secret:{}'.format(number)) for number in range(pending_locks + iterations)]
+
+    for secret in secrets[:pending_locks]:
+        add_lock(end_state, secret, memoize)
+
+    # Each iteration adds a new lock and unlocks the oldest, the number of
+    # pending locks is constant
+    start = time.time()
+    for position in range(iterations):
+        add_lock(end_state, secrets[pending_locks + position], memoize)
+        remove_lock(end_state, secrets[position], memoize)
+    elapsed = time.time() - start
+
+    print('{} pending locks, {}: {:.1f} locks/s'.format(
+        pending_locks,
+        'memoized' if memoize else 'not memoized',
+        iterations / elapsed,
+    ))
+
+
+def test_pending_locks(iterations=ITERATIONS):
+    for pending_locks in PENDING_LOCKS:
+        run_locks(pending_locks, iterations, memoize=False)
+        run_locks(pending_locks, iterations, memoize=True)
+
+
+def test_all(iterations=ITERATIONS):
+    test_pending_locks(iterations=iterations)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('name', default='test_all', nargs='?')
+    parser.add_argument('-i', '--iterations', default=ITERATIONS, type=int)
+
+    args = parser.parse_args()
+
+    test_name = args.name
+    if test_name not in globals():
+        raise ValueError('unknow test name: {}'.format(test_name))
+
+    globals()[test_name](iterations=args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+""" Time of the merkle tree construction compared to the time spent in
+keccak alone, the part that a faster layer loop cannot remove.
+"""
+from __future__ import print_function, division
+
+import timeit
+
+from raiden.transfer.merkle_tree import compute_layers
+from raiden.utils import sha3
+
+ITERATIONS = 100000
+LEAVES = (10, 1000, 100000)
+
+
+def hash_only(pairs):
+    """ The keccak calls of a tree, without sorting, pairing or layers. """
+    for pair in pairs:
+        sha3(pair)
+
+
+def test_merkleroot(iterations=ITERATIONS):
+    """ Time the layers of trees with `LEAVES` leaves, `iterations` is the
+    total number of leaves hashed for each size.
+    """
+    for number_of_leaves in LEAVES:
+        leaves = [sha3(str(value)) for value in range(number_of_leaves)]
+        number = max(iterations // number_of_leaves, 1)
+
+        # a tree of n leaves hashes n - 1 pairs of 64 bytes
+        pairs = [leaves[0] + leaves[-1]] * (number_of_leaves - 1)
+
+        layers_time = timeit.timeit(lambda: compute_layers(leaves), number=number)  # noqa
+        keccak_time = timeit.timeit(lambda: hash_only(pairs), number=number)  # noqa
+
+        print('{} leaves: layers {:.3f}ms keccak {:.3f}ms ({:.0%})'.format(
+            number_of_leaves,
+            layers_time / number * 1000,
+            keccak_time / number * 1000,
+            keccak_time / layers_time,
+        ))
+
+
+def test_all(iterations=ITERATIONS):
+    test_merkleroot(iterations=iterations)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('name', default='test_all', nargs='?')
+    parser.add_argument('-i', '--iterations', default=ITERATIONS, type=int)
+
+    args = parser.parse_args()
+
+    test_name = args.name
+    if test_name not in globals():
+        raise ValueError('unknow test name: {}'.format(test_name))
+
+    globals()[test_name](iterations=args.iterations)
+
+
+if __name__ == '__main__':
+    main()
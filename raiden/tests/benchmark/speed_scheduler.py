@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+""" CPU and memory used by the health checks and the idle channel queues of
+many peers, with a greenlet per task or with the shared scheduler.
+"""
+from __future__ import print_function, division
+
+import os
+import resource
+import time
+
+import gevent
+from gevent.event import AsyncResult, Event
+
+from raiden.network.protocol import (
+    healthcheck,
+    single_queue_send,
+    HealthCheck,
+    QueueSender,
+)
+from raiden.network.scheduler import Scheduler
+from raiden.settings import DEFAULT_PROTOCOL_SCHEDULER_RESOLUTION
+from raiden.utils.notifying_queue import NotifyingQueue
+
+PEERS = 10000
+DURATION = 10
+WORKERS = 4
+KEEPALIVE_TIMEOUT = 1
+RETRY_INTERVAL = 1
+
+
+class ProtocolMock(object):
+    """ Acknowledges every Ping right away. """
+
+    def get_host_port(self, address):  # pylint: disable=unused-argument,no-self-use
+        return ('127.0.0.1', 40001)
+
+    def get_ping(self, nonce):  # pylint: disable=no-self-use
+        return str(nonce)
+
+    def set_node_network_state(self, node_address, node_state):  # pylint: disable=unused-argument
+        pass
+
+    # pylint: disable=unused-argument,no-self-use
+    def send_raw_with_result(self, data, receiver_address):
+        async_result = AsyncResult()
+        async_result.set(True)
+        return async_result
+
+
+def resident_memory():
+    """ Current resident memory in MiB. """
+    with open('/proc/{}/statm'.format(os.getpid())) as handler:
+        pages = int(handler.read().split()[1])
+    return pages * resource.getpagesize() / 2 ** 20
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(name, start_peer, peers, duration):
+    memory_before = resident_memory()
+
+    for number in range(peers):
+        start_peer('{:020}'.format(number))
+
+    cpu_before = cpu_time()
+    gevent.sleep(duration)
+    cpu_used = cpu_time() - cpu_before
+
+    # measured once every task ran, the greenlets only get their stacks then
+    memory_after = resident_memory()
+
+    print('{}: {} peers, {:.1f} MiB, {:.2f}s of CPU in {}s'.format(
+        name,
+        peers,
+        memory_after - memory_before,
+        cpu_used,
+        duration,
+    ))
+
+
+def make_events():
+    event_healthy = Event()
+    event_unhealthy = Event()
+    return event_healthy, event_unhealthy
+
+
+def test_greenlets(iterations=PEERS, duration=DURATION):
+    protocol = ProtocolMock()
+    event_stop = Event()
+    greenlets = list()
+
+    def start_peer(address):
+        event_healthy, event_unhealthy = make_events()
+
+        greenlets.append(gevent.spawn(
+            healthcheck,
+            protocol,
+            address,
+            event_stop,
+            event_healthy,
+            event_unhealthy,
+            3,
+            KEEPALIVE_TIMEOUT,
+            KEEPALIVE_TIMEOUT * 10,
+            {'nonce': 0},
+        ))
+        greenlets.append(gevent.spawn(
+            single_queue_send,
+            protocol,
+            address,
+            NotifyingQueue(),
+            event_stop,
+            event_healthy,
+            event_unhealthy,
+            3,
+            RETRY_INTERVAL,
+            RETRY_INTERVAL * 10,
+        ))
+
+    run('greenlets', start_peer, iterations, duration)
+
+    event_stop.set()
+    gevent.wait(greenlets)
+
+
+def test_scheduler(iterations=PEERS, duration=DURATION, workers=WORKERS):
+    protocol = ProtocolMock()
+    event_stop = Event()
+    scheduler = Scheduler(workers, DEFAULT_PROTOCOL_SCHEDULER_RESOLUTION)
+    scheduler.start()
+
+    def start_peer(address):
+        event_healthy, event_unhealthy = make_events()
+
+        HealthCheck(
+            scheduler,
+            protocol,
+            address,
+            event_stop,
+            event_healthy,
+            event_unhealthy,
+            3,
+            KEEPALIVE_TIMEOUT,
+            KEEPALIVE_TIMEOUT * 10,
+            {'nonce': 0},
+        ).wakeup()
+        QueueSender(
+            scheduler,
+            protocol,
+            address,
+            NotifyingQueue(),
+            event_stop,
+            event_healthy,
+            event_unhealthy,
+            3,
+            RETRY_INTERVAL,
+            RETRY_INTERVAL * 10,
+            1,
+        ).wakeup()
+
+    run('scheduler', start_peer, iterations, duration)
+
+    event_stop.set()
+    scheduler.stop()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('name', choices=('test_greenlets', 'test_scheduler'))
+    parser.add_argument('-i', '--iterations', default=PEERS, type=int, help='number of peers')
+    parser.add_argument('-d', '--duration', default=DURATION, type=float)
+
+    args = parser.parse_args()
+
+    # each variant runs in its own process, otherwise the memory freed by the
+    # first one is reused by the second
+    start = time.time()
+    globals()[args.name](iterations=args.iterations, duration=args.duration)
+    print('total {:.1f}s'.format(time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import timeit
+
+from raiden.tests.utils import factories
+from raiden.transfer.events import EventTransferReceivedSuccess
+from raiden.transfer.log import PickleTransactionSerializer
+from raiden.transfer.mediated_transfer.events import SendMediatedTransfer
+from raiden.transfer.mediated_transfer.state_change import ActionInitMediator
+from raiden.transfer.serialization import CompactTransactionSerializer
+from raiden.transfer.state import RoutesState
+from raiden.transfer.state_change import Block
+
+ITERATIONS = 10000
+SERIALIZERS = (
+    ('pickle', PickleTransactionSerializer()),
+    ('compact', CompactTransactionSerializer()),
+)
+
+
+def run_timeit(name, transaction, iterations=ITERATIONS):
+    for serializer_name, serializer in SERIALIZERS:
+        data = serializer.serialize(transaction)
+
+        def test_serialize():
+            serializer.serialize(transaction)  # pylint: disable=cell-var-from-loop
+
+        def test_deserialize():
+            serializer.deserialize(data)  # pylint: disable=cell-var-from-loop
+
+        serialize_time = timeit.timeit(test_serialize, number=iterations)
+        deserialize_time = timeit.timeit(test_deserialize, number=iterations)
+
+        print('{} {}: size {} serialize {} deserialize {}'.format(
+            name,
+            serializer_name,
+            len(data),
+            serialize_time,
+            deserialize_time,
+        ))
+
+
+def test_block(iterations=ITERATIONS):
+    run_timeit('Block', Block(4123456), iterations=iterations)
+
+
+def test_transfer_received(iterations=ITERATIONS):
+    event = EventTransferReceivedSuccess(2 ** 63, 10 ** 18, factories.HOP1)
+    run_timeit('EventTransferReceivedSuccess', event, iterations=iterations)
+
+
+def test_send_mediated_transfer(iterations=ITERATIONS):
+    event = SendMediatedTransfer(
+        2 ** 63,
+        factories.UNIT_TOKEN_ADDRESS,
+        10 ** 18,
+        factories.UNIT_HASHLOCK,
+        factories.HOP1,
+        factories.HOP6,
+        4123456,
+        factories.HOP2,
+    )
+    run_timeit('SendMediatedTransfer', event, iterations=iterations)
+
+
+def test_init_mediator(iterations=ITERATIONS):
+    routes = RoutesState([
+        factories.make_route(factories.HOP2, 10 ** 18),
+        factories.make_route(factories.HOP3, 10 ** 18),
+        factories.make_route(factories.HOP4, 10 ** 18),
+    ])
+    from_transfer = factories.make_transfer(
+        10 ** 18,
+        factories.HOP6,
+        factories.HOP5,
+        4123456,
+        identifier=2 ** 63,
+    )
+    state_change = ActionInitMediator(
+        factories.HOP1,
+        from_transfer,
+        routes,
+        factories.make_route(factories.HOP6, 10 ** 18),
+        4123406,
+    )
+    run_timeit('ActionInitMediator', state_change, iterations=iterations)
+
+
+def test_all(iterations=ITERATIONS):
+    test_block(iterations=iterations)
+    test_transfer_received(iterations=iterations)
+    test_send_mediated_transfer(iterations=iterations)
+    test_init_mediator(iterations=iterations)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('name', default='test_all', nargs='?')
+    parser.add_argument('-i', '--iterations', default=ITERATIONS, type=int)
+
+    args = parser.parse_args()
+
+    test_name = args.name
+    if test_name not in globals():
+        raise ValueError('unknow test name: {}'.format(test_name))
+
+    globals()[test_name](iterations=args.iterations)
+
+
+if __name__ == '__main__':
+    main()
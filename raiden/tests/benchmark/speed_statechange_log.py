@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import time
+
+from raiden.tests.utils import factories
+from raiden.transfer.events import EventTransferReceivedSuccess
+from raiden.transfer.log import (
+    event_index,
+    StateChangeLog,
+    StateChangeLogSQLiteBackend,
+)
+from raiden.transfer.mediated_transfer.events import EventUnlockSuccess
+from raiden.transfer.segment_log import StateChangeLogSegmentBackend
+from raiden.transfer.state_change import Block, ReceiveTransferDirect
+
+ITERATIONS = 10000
+BACKENDS = ('sqlite', 'segment')
+
+
+def create_log(database_dir, backend='sqlite', **backend_kwargs):
+    """ Return a log which counts the commits done by its storage. """
+    if backend == 'segment':
+        storage = StateChangeLogSegmentBackend(
+            log_dir=os.path.join(database_dir, 'log.segments'),
+            **backend_kwargs
+        )
+    else:
+        storage = StateChangeLogSQLiteBackend(
+            database_path=os.path.join(database_dir, 'log.db'),
+            **backend_kwargs
+        )
+    log = StateChangeLog(storage_instance=storage)
+
+    commits = [0]
+    original_commit = storage._commit  # pylint: disable=protected-access
+
+    def counting_commit():
+        commits[0] += 1
+        original_commit()
+
+    storage._commit = counting_commit  # pylint: disable=protected-access
+
+    return log, commits
+
+
+def print_result(name, iterations, elapsed, commits):
+    print('{}: {} state changes in {:.3f}s, {:.1f} state changes/s, {} commits'.format(
+        name,
+        iterations,
+        elapsed,
+        iterations / elapsed,
+        commits,
+    ))
+
+
+def run_log(name, iterations, backend='sqlite', **backend_kwargs):
+    """ Log `iterations` state changes and its events, the way a received
+    direct transfer is logged, and print the throughput.
+    """
+    database_dir = tempfile.mkdtemp()
+    log, commits = create_log(database_dir, backend, **backend_kwargs)
+
+    try:
+        start = time.time()
+        for identifier in range(iterations):
+            state_change = ReceiveTransferDirect(identifier, 1, factories.ADDR, factories.HOP1)
+            state_change_id = log.log(state_change, events_pending=True)
+            log.log_events(
+                state_change_id,
+                [EventTransferReceivedSuccess(identifier, 1, factories.HOP1)],
+                identifier,
+            )
+        log.flush()
+        elapsed = time.time() - start
+    finally:
+        shutil.rmtree(database_dir)
+
+    print_result(name, iterations, elapsed, commits[0])
+
+
+def run_storage(name, iterations, backend, **backend_kwargs):
+    """ Write `iterations` serialized state changes, each with one event,
+    directly to the storage, so the serialization cost is not measured.
+    """
+    database_dir = tempfile.mkdtemp()
+    log, commits = create_log(database_dir, backend, **backend_kwargs)
+    storage = log.storage
+
+    state_change_data = log.serializer.serialize(
+        ReceiveTransferDirect(1, 1, factories.ADDR, factories.HOP1),
+    )
+    event = EventTransferReceivedSuccess(1, 1, factories.HOP1)
+    event_data = (None, None, None, log.serializer.serialize(event)) + event_index(event)
+
+    try:
+        start = time.time()
+        for block_number in range(iterations):
+            state_change_id = storage.write_state_change(state_change_data, True)
+            storage.write_state_events(
+                state_change_id,
+                [(None, state_change_id, block_number) + event_data[3:]],
+            )
+        storage.flush()
+        elapsed = time.time() - start
+    finally:
+        shutil.rmtree(database_dir)
+
+    print_result(name, iterations, elapsed, commits[0])
+
+
+def run_blocks(name, iterations, transfers, write_behind):
+    """ Log `iterations` blocks dispatched to `transfers` state managers
+    each generating one event, either writing the events once per state
+    manager or once per block.
+    """
+    database_dir = tempfile.mkdtemp()
+    log, commits = create_log(database_dir)
+    events = [
+        EventUnlockSuccess(identifier, factories.UNIT_HASHLOCK)
+        for identifier in range(transfers)
+    ]
+
+    try:
+        start = time.time()
+        for block_number in range(iterations):
+            if write_behind:
+                state_change_id = log.log(Block(block_number), events_pending=True)
+                log.log_events(state_change_id, events, block_number)
+            else:
+                state_change_id = log.log(Block(block_number))
+                for event in events:
+                    log.log_events(state_change_id, [event], block_number)
+        log.flush()
+        elapsed = time.time() - start
+    finally:
+        shutil.rmtree(database_dir)
+
+    print_result(name, iterations, elapsed, commits[0])
+
+
+def test_commit_per_write(iterations=ITERATIONS):
+    run_log('commit per write', iterations)
+
+
+def test_group_commit(iterations=ITERATIONS, group_commit_size=128):
+    run_log(
+        'group commit of {}'.format(group_commit_size),
+        iterations,
+        group_commit_size=group_commit_size,
+        group_commit_timeout=0.05,
+    )
+
+
+def test_block_events(iterations=ITERATIONS, transfers=100):
+    iterations = max(iterations // transfers, 1)
+    run_blocks(
+        'events per transfer, {} transfers'.format(transfers),
+        iterations,
+        transfers,
+        write_behind=False,
+    )
+    run_blocks(
+        'events per block, {} transfers'.format(transfers),
+        iterations,
+        transfers,
+        write_behind=True,
+    )
+
+
+def test_backends(iterations=ITERATIONS, group_commit_size=512):
+    """ Compare the storage backends, e.g. with `-i 1000000`. """
+    for backend in BACKENDS:
+        run_storage(
+            '{} backend, group commit of {}'.format(backend, group_commit_size),
+            iterations,
+            backend,
+            group_commit_size=group_commit_size,
+            group_commit_timeout=0.05,
+        )
+
+
+def test_all(iterations=ITERATIONS):
+    test_commit_per_write(iterations=iterations)
+    for group_commit_size in (8, 32, 128, 512):
+        test_group_commit(iterations=iterations, group_commit_size=group_commit_size)
+    for transfers in (10, 100, 1000):
+        test_block_events(iterations=iterations, transfers=transfers)
+    test_backends(iterations=iterations)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('name', default='test_all', nargs='?')
+    parser.add_argument('-i', '--iterations', default=ITERATIONS, type=int)
+
+    args = parser.parse_args()
+
+    test_name = args.name
+    if test_name not in globals():
+        raise ValueError('unknow test name: {}'.format(test_name))
+
+    globals()[test_name](iterations=args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import time
+
+from gevent.event import Event
+
+from raiden.messages import decode
+from raiden.network.verification import VerificationPool
+from raiden.tests.utils.factories import make_privkey_address
+from raiden.tests.utils.messages import make_mediated_transfer
+
+ITERATIONS = 10000
+SENDERS = 10
+WORKERS = (1, 2, 4, 8)
+
+
+def make_packets(iterations, senders=SENDERS):
+    """ Return `iterations` signed mediated transfers from `senders` nodes,
+    interleaved the way they would arrive from concurrent partners.
+    """
+    keys = [make_privkey_address() for _ in range(senders)]
+    packets = list()
+
+    for nonce in range(1, iterations // senders + 2):
+        for private_key, address in keys:
+            message = make_mediated_transfer(nonce=nonce, identifier=nonce)
+            message.sign(private_key, address)
+            packets.append((message.encode(), message.hash))
+
+    return packets[:iterations]
+
+
+def print_result(name, iterations, elapsed):
+    print('{}: {} messages in {:.3f}s, {:.1f} messages/s'.format(
+        name,
+        iterations,
+        elapsed,
+        iterations / elapsed,
+    ))
+
+
+def run_inline(packets):
+    start = time.time()
+    for data, _ in packets:
+        decode(data)
+    elapsed = time.time() - start
+
+    print_result('inline', len(packets), elapsed)
+
+
+def run_pool(packets, workers):
+    received = list()
+    done = Event()
+
+    def callback(data, echohash, message):  # pylint: disable=unused-argument
+        received.append(message)
+        if len(received) == len(packets):
+            done.set()
+
+    pool = VerificationPool(workers, callback)
+    pool.start()
+
+    start = time.time()
+    for data, echohash in packets:
+        pool.put(data, echohash)
+    done.wait()
+    elapsed = time.time() - start
+
+    pool.stop()
+
+    assert all(message is not None for message in received)
+    print_result('{} workers'.format(workers), len(packets), elapsed)
+
+
+def test_inline(iterations=ITERATIONS):
+    run_inline(make_packets(iterations))
+
+
+def test_pool(iterations=ITERATIONS, workers=4):
+    run_pool(make_packets(iterations), workers)
+
+
+def test_all(iterations=ITERATIONS):
+    packets = make_packets(iterations)
+
+    run_inline(packets)
+    for workers in WORKERS:
+        run_pool(packets, workers)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('name', default='test_all', nargs='?')
+    parser.add_argument('-i', '--iterations', default=ITERATIONS, type=int)
+
+    args = parser.parse_args()
+
+    test_name = args.name
+    if test_name not in globals():
+        raise ValueError('unknow test name: {}'.format(test_name))
+
+    globals()[test_name](iterations=args.iterations)
+
+
+if __name__ == '__main__':
+    main()
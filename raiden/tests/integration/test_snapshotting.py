@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import sqlite3
+
 import pytest
 
 from ethereum import slogging
@@ -50,3 +52,70 @@ def test_snapshotting(raiden_network, token_addresses):
         assert data['receivedhashes_to_acks'] == app.raiden.protocol.receivedhashes_to_acks
         assert data['nodeaddresses_to_nonces'] == app.raiden.protocol.nodeaddresses_to_nonces
         assert data['transfers'] == app.raiden.identifier_to_statemanagers
+
+
+@pytest.mark.parametrize('number_of_nodes', [3])
+@pytest.mark.parametrize('number_of_tokens', [1])
+@pytest.mark.parametrize('channels_per_node', [1])
+@pytest.mark.parametrize('settle_timeout', [16])
+@pytest.mark.parametrize('reveal_timeout', [4])
+@pytest.mark.parametrize('in_memory_database', [False])
+def test_snapshot_replay(raiden_network, token_addresses):
+    _, app1, app2 = raiden_network
+    raiden = app1.raiden
+
+    raiden.snapshot(compact=True)
+    snapshot_state_change_id = raiden.snapshot_state_change_id
+    data = load_snapshot(raiden.serialization_file)
+    assert data['state_change_id'] == snapshot_state_change_id
+    assert not raiden.transaction_log.get_state_changes_after(0)
+
+    api1 = RaidenAPI(raiden)
+    api1.transfer_and_wait(token_addresses[0], 5, app2.raiden.address)
+
+    # recover the state managers as if the node crashed after the transfer
+    running_statemanagers = raiden.identifier_to_statemanagers
+    raiden.restore_transfer_states(data['transfers'])
+    raiden.replay_state_changes(snapshot_state_change_id)
+
+    assert set(raiden.identifier_to_statemanagers) == set(running_statemanagers)
+    for identifier, manager_list in running_statemanagers.iteritems():
+        replayed_list = raiden.identifier_to_statemanagers[identifier]
+        assert [type(manager.current_state) for manager in replayed_list] == [
+            type(manager.current_state) for manager in manager_list
+        ]
+
+
+@pytest.mark.parametrize('number_of_nodes', [3])
+@pytest.mark.parametrize('number_of_tokens', [1])
+@pytest.mark.parametrize('channels_per_node', [1])
+@pytest.mark.parametrize('settle_timeout', [16])
+@pytest.mark.parametrize('reveal_timeout', [4])
+@pytest.mark.parametrize('in_memory_database', [False])
+def test_snapshot_group_commit(raiden_network, token_addresses):
+    _, app1, app2 = raiden_network
+    raiden = app1.raiden
+
+    # a group large enough to keep the state changes of the transfer pending
+    storage = raiden.transaction_log.storage
+    storage.group_commit_size = 10000
+    storage.group_commit_timeout = 600
+
+    api1 = RaidenAPI(raiden)
+    api1.transfer_and_wait(token_addresses[0], 5, app2.raiden.address)
+    assert storage.uncommitted_writes > 0
+
+    # the periodic snapshot
+    raiden.snapshot(compact=True)
+    assert storage.uncommitted_writes == 0
+
+    # the state changes covered by the snapshot are durable, after a crash
+    # their ids are not reused
+    data = load_snapshot(raiden.serialization_file)
+    conn = sqlite3.connect(raiden.config['database_path'])
+    committed_state_change_id = conn.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'state_changes'"
+    ).fetchone()[0]
+    conn.close()
+
+    assert committed_state_change_id == data['state_change_id']
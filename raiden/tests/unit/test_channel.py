@@ -2,6 +2,8 @@
 # pylint: disable=too-many-locals,too-many-statements
 from __future__ import division
 
+import cPickle as pickle
+
 import pytest
 from ethereum import slogging
 
@@ -10,6 +12,8 @@ from raiden.channel import (
     ChannelEndState,
     ChannelExternalState,
 )
+from raiden.channel.netting_channel import LazyNettingChannel
+from raiden.event_handler import StateMachineEventHandler
 from raiden.exceptions import (
     InsufficientBalance,
 )
@@ -21,6 +25,8 @@ from raiden.messages import (
     Secret,
     MediatedTransfer,
 )
+from raiden.network.channelgraph import ChannelDetails, ChannelGraph
+from raiden.raiden_service import RaidenService
 from raiden.tests.utils.factories import make_address, make_privkey_address
 from raiden.tests.utils.messages import make_mediated_transfer
 from raiden.tests.utils.transfer import assert_synched_channels, channel
@@ -30,6 +36,7 @@ from raiden.transfer.merkle_tree import (
     merkleroot,
 )
 from raiden.transfer.state import MerkleTreeState
+from raiden.transfer.state_change import ActionRegisterTransfer
 from raiden.utils import sha3
 
 log = slogging.getLogger(__name__)  # pylint: disable=invalid-name
@@ -220,6 +227,91 @@ def test_end_state():
     assert state2.nonce is None
 
 
+def test_candidate_merkletree_is_reused():
+    privkey, address = make_privkey_address()
+    channel_address = make_address()
+    state = ChannelEndState(address, 100, None, EMPTY_MERKLE_TREE)
+
+    lock_secret = sha3('test_candidate_merkletree_is_reused')
+    lock = Lock(10, 10, sha3(lock_secret))
+    locksroot = state.compute_merkleroot_with(lock)
+
+    mediated_transfer = LockedTransfer(
+        1,
+        nonce=1,
+        token=make_address(),
+        channel=channel_address,
+        transferred_amount=0,
+        recipient=make_address(),
+        locksroot=locksroot,
+        lock=lock,
+    ).to_mediatedtransfer(make_address(), make_address(), 0)
+    mediated_transfer.sign(privkey, address)
+
+    # the tree computed for the validation is the one registered
+    candidate_tree = state.candidate_merkletrees.values()[0]
+    state.register_locked_transfer(mediated_transfer)
+    assert state.merkletree is candidate_tree
+    assert not state.candidate_merkletrees
+
+    # the secret does not change the tree, the candidate stays valid
+    assert state.compute_merkleroot_without(lock) == EMPTY_MERKLE_ROOT
+    state.register_secret(lock_secret)
+    assert len(state.candidate_merkletrees) == 1
+
+    secret_message = Secret(1, 2, channel_address, 10, EMPTY_MERKLE_ROOT, lock_secret)
+    secret_message.sign(privkey, address)
+    state.register_secretmessage(secret_message)
+    assert state.merkletree is EMPTY_MERKLE_TREE
+    assert not state.candidate_merkletrees
+
+
+def test_lock_records_and_amount_locked():
+    privkey, address = make_privkey_address()
+    channel_address = make_address()
+    state = ChannelEndState(address, 100, None, EMPTY_MERKLE_TREE)
+
+    secrets = [sha3('test_lock_records:{}'.format(amount)) for amount in (3, 5)]
+    for nonce, (amount, lock_secret) in enumerate(zip((3, 5), secrets), 1):
+        lock = Lock(amount, 10, sha3(lock_secret))
+        mediated_transfer = LockedTransfer(
+            1,
+            nonce=nonce,
+            token=make_address(),
+            channel=channel_address,
+            transferred_amount=0,
+            recipient=make_address(),
+            locksroot=state.compute_merkleroot_with(lock),
+            lock=lock,
+        ).to_mediatedtransfer(make_address(), make_address(), 0)
+        mediated_transfer.sign(privkey, address)
+        state.register_locked_transfer(mediated_transfer)
+
+    assert state.amount_locked == 8
+    assert state.get_lock_by_hashlock(sha3(secrets[0])) == Lock(3, 10, sha3(secrets[0]))
+
+    # the amount stays locked until the balance proof is received
+    state.register_secret(secrets[0])
+    assert state.amount_locked == 8
+
+    restored = pickle.loads(pickle.dumps(state, -1))
+    assert restored == state
+    assert restored.amount_locked == 8
+
+    secret_message = Secret(
+        1,
+        3,
+        channel_address,
+        3,
+        state.compute_merkleroot_without(state.get_lock_by_hashlock(sha3(secrets[0]))),
+        secrets[0],
+    )
+    secret_message.sign(privkey, address)
+    state.register_secretmessage(secret_message)
+    assert state.amount_locked == 5
+    assert state.distributable(ChannelEndState(make_address(), 0, None, EMPTY_MERKLE_TREE)) == 92
+
+
 def test_sender_cannot_overspend():
     token_address = make_address()
     privkey1, address1 = make_privkey_address()
@@ -585,6 +677,374 @@ def test_channel_increase_nonce_and_transferred_amount():
         previous_transferred = new_transferred
 
 
+def test_channel_balance_view_is_invalidated():
+    """ The cached balances must be recomputed once the channel changes. """
+    token_address = make_address()
+    privkey1, address1 = make_privkey_address()
+    address2 = make_address()
+
+    our_state = ChannelEndState(address1, 70, None, EMPTY_MERKLE_TREE)
+    partner_state = ChannelEndState(address2, 110, None, EMPTY_MERKLE_TREE)
+    test_channel = Channel(
+        our_state,
+        partner_state,
+        make_external_state(),
+        token_address,
+        reveal_timeout=5,
+        settle_timeout=15,
+    )
+
+    balance_view = test_channel.balance_view
+    assert balance_view == (70, 70, 0, 0)
+    assert test_channel.balance_view is balance_view
+
+    lock_secret = sha3('test_channel_balance_view_is_invalidated')
+    mediated_transfer = test_channel.create_mediatedtransfer(
+        address1,
+        address2,
+        fee=0,
+        amount=10,
+        identifier=1,
+        expiration=10,
+        hashlock=sha3(lock_secret),
+    )
+    mediated_transfer.sign(privkey1, address1)
+
+    version = test_channel.version
+    test_channel.register_transfer(1, mediated_transfer)
+    assert test_channel.version == version + 1
+    assert test_channel.balance_view == (70, 60, 10, 0)
+
+    test_channel.register_secret(lock_secret)
+    assert test_channel.version == version + 2
+
+    secret_message = test_channel.create_secret(1, lock_secret)
+    secret_message.sign(privkey1, address1)
+    test_channel.register_transfer(1, secret_message)
+    assert test_channel.balance_view == (60, 60, 0, 0)
+
+    test_channel.update_contract_balance(address1, 100)
+    assert test_channel.version == version + 4
+    assert test_channel.balance_view == (90, 90, 0, 0)
+
+
+def test_unverified_channel_can_only_receive():
+    """ A channel restored lazily from a snapshot must not send transfers
+    until its on-chain state is verified.
+    """
+    token_address = make_address()
+    privkey1, address1 = make_privkey_address()
+    privkey2, address2 = make_privkey_address()
+
+    our_state = ChannelEndState(address1, 70, None, EMPTY_MERKLE_TREE)
+    partner_state = ChannelEndState(address2, 110, None, EMPTY_MERKLE_TREE)
+    test_channel = Channel(
+        our_state,
+        partner_state,
+        make_external_state(),
+        token_address,
+        reveal_timeout=5,
+        settle_timeout=15,
+    )
+    partner_channel = Channel(
+        ChannelEndState(address2, 110, None, EMPTY_MERKLE_TREE),
+        ChannelEndState(address1, 70, None, EMPTY_MERKLE_TREE),
+        make_external_state(),
+        token_address,
+        reveal_timeout=5,
+        settle_timeout=15,
+    )
+    test_channel.verified = False
+
+    assert not test_channel.can_transfer
+    with pytest.raises(ValueError):
+        test_channel.create_directtransfer(10, identifier=1)
+
+    received_transfer = partner_channel.create_directtransfer(10, identifier=1)
+    received_transfer.sign(privkey2, address2)
+    test_channel.register_transfer(1, received_transfer)
+    assert test_channel.distributable == 80
+
+    test_channel.verified = True
+    direct_transfer = test_channel.create_directtransfer(10, identifier=2)
+    direct_transfer.sign(privkey1, address1)
+    test_channel.register_transfer(1, direct_transfer)
+
+
+def test_registered_transfers_are_replayed():
+    """ The transfers logged by a channel must bring the same channel restored
+    from an older snapshot up to date when replayed.
+    """
+    token_address = make_address()
+    privkey1, address1 = make_privkey_address()
+    privkey2, address2 = make_privkey_address()
+
+    def make_channel(log_transfer):
+        external_state = ChannelExternalState(
+            lambda *args: None,
+            NettingChannelMock(),
+            log_transfer,
+        )
+        return Channel(
+            ChannelEndState(address1, 70, None, EMPTY_MERKLE_TREE),
+            ChannelEndState(address2, 110, None, EMPTY_MERKLE_TREE),
+            external_state,
+            token_address,
+            reveal_timeout=5,
+            settle_timeout=15,
+        )
+
+    state_changes = list()
+
+    def log_transfer(channel, block_number, transfer):
+        state_changes.append(ActionRegisterTransfer(
+            block_number,
+            channel.channel_address,
+            transfer.encode(),
+        ))
+
+    running_channel = make_channel(log_transfer)
+    restored_channel = make_channel(None)
+    partner_channel = Channel(
+        ChannelEndState(address2, 110, None, EMPTY_MERKLE_TREE),
+        ChannelEndState(address1, 70, None, EMPTY_MERKLE_TREE),
+        make_external_state(),
+        token_address,
+        reveal_timeout=5,
+        settle_timeout=15,
+    )
+
+    lock_secret = sha3('test_registered_transfers_are_replayed')
+    mediated_transfer = running_channel.create_mediatedtransfer(
+        address1,
+        address2,
+        fee=0,
+        amount=10,
+        identifier=1,
+        expiration=10,
+        hashlock=sha3(lock_secret),
+    )
+    mediated_transfer.sign(privkey1, address1)
+    running_channel.register_transfer(1, mediated_transfer)
+
+    direct_transfer = partner_channel.create_directtransfer(20, identifier=2)
+    direct_transfer.sign(privkey2, address2)
+    running_channel.register_transfer(2, direct_transfer)
+
+    running_channel.register_secret(lock_secret)
+    secret_message = running_channel.create_secret(1, lock_secret)
+    secret_message.sign(privkey1, address1)
+    running_channel.register_transfer(3, secret_message)
+
+    assert [state_change.block_number for state_change in state_changes] == [1, 2, 3]
+
+    sent = list()
+
+    class RaidenMock(object):
+        address = address1
+        identifier_to_statemanagers = dict()
+
+        def find_channel_by_address(self, channel_address):  # pylint: disable=no-self-use
+            if channel_address == restored_channel.channel_address:
+                return restored_channel
+            raise ValueError('unknown channel')
+
+        def send_async(self, recipient, message):  # pylint: disable=no-self-use
+            sent.append((recipient, message))
+
+    event_handler = StateMachineEventHandler(RaidenMock())
+    for state_change in state_changes:
+        event_handler.replay(state_change)
+
+    assert restored_channel.serialize() == running_channel.serialize()
+    assert restored_channel.balance_view == running_channel.balance_view
+
+    # the transfers sent after the snapshot are sent again, in order
+    assert sent == [(address2, mediated_transfer), (address2, secret_message)]
+
+    # the transfers of the channels that are not restored are skipped
+    event_handler.replay(ActionRegisterTransfer(
+        4,
+        make_address(),
+        state_changes[1].transfer_data,
+    ))
+
+
+def test_lazy_netting_channel():
+    """ The proxy of a channel restored lazily is only created when used. """
+
+    class ChainMock(object):
+        def __init__(self):
+            self.created = list()
+
+        def netting_channel(self, address):
+            self.created.append(address)
+            return NettingChannelMock()
+
+    chain = ChainMock()
+    netting_channel = LazyNettingChannel(chain, 'channeladdresschanne', 3, 0)
+    external_state = ChannelExternalState(lambda *args: None, netting_channel)
+
+    assert external_state.opened_block == 3
+    assert external_state.closed_block == 0
+    assert netting_channel.address == 'channeladdresschanne'
+    assert not chain.created
+
+    assert netting_channel.opened() == 3
+    assert netting_channel.get_proxy().opened() == 1
+    assert chain.created == ['channeladdresschanne']
+
+
+def test_restore_into_existing_channel():
+    """ Restoring a snapshot into a channel that already exists must update
+    its balances.
+    """
+    token_address = make_address()
+    privkey1, address1 = make_privkey_address()
+    privkey2, address2 = make_privkey_address()
+
+    running_channel = Channel(
+        ChannelEndState(address1, 70, None, EMPTY_MERKLE_TREE),
+        ChannelEndState(address2, 110, None, EMPTY_MERKLE_TREE),
+        make_external_state(),
+        token_address,
+        reveal_timeout=5,
+        settle_timeout=15,
+    )
+    partner_channel = Channel(
+        ChannelEndState(address2, 110, None, EMPTY_MERKLE_TREE),
+        ChannelEndState(address1, 70, None, EMPTY_MERKLE_TREE),
+        make_external_state(),
+        token_address,
+        reveal_timeout=5,
+        settle_timeout=15,
+    )
+
+    sent_transfer = running_channel.create_directtransfer(10, identifier=1)
+    sent_transfer.sign(privkey1, address1)
+    running_channel.register_transfer(1, sent_transfer)
+
+    received_transfer = partner_channel.create_directtransfer(20, identifier=2)
+    received_transfer.sign(privkey2, address2)
+    running_channel.register_transfer(2, received_transfer)
+
+    details = ChannelDetails(
+        running_channel.channel_address,
+        ChannelEndState(address1, 70, None, EMPTY_MERKLE_TREE),
+        ChannelEndState(address2, 110, None, EMPTY_MERKLE_TREE),
+        make_external_state(),
+        5,
+        15,
+    )
+    graph = ChannelGraph(address1, make_address(), token_address, [], [details])
+    existing_channel = graph.address_to_channel[running_channel.channel_address]
+    assert existing_channel.distributable == 70
+    version = existing_channel.version
+
+    class NettingChannelDetailMock(NettingChannelMock):
+        def detail(self):  # pylint: disable=no-self-use
+            return {
+                'our_address': address1,
+                'our_balance': 70,
+                'partner_address': address2,
+                'partner_balance': 110,
+                'settle_timeout': 15,
+            }
+
+    class ChainMock(object):
+        def netting_channel(self, address):  # pylint: disable=no-self-use,unused-argument
+            return NettingChannelDetailMock()
+
+    class RaidenMock(object):
+        chain = ChainMock()
+        token_to_channelgraph = {token_address: graph}
+
+        def register_channel_for_hashlock(self, *args):
+            pass
+
+        def log_channel_transfer(self, *args):
+            pass
+
+    RaidenService.restore_channel.__func__(RaidenMock(), running_channel.serialize())
+
+    assert graph.address_to_channel[running_channel.channel_address] is existing_channel
+    assert existing_channel.version > version
+    assert existing_channel.balance_view == running_channel.balance_view
+    assert existing_channel.distributable == 80
+
+
+def test_channel_serialization_round_trip():
+    """ The locks of both ends must be restored from the snapshot. """
+    token_address = make_address()
+    privkey1, address1 = make_privkey_address()
+    privkey2, address2 = make_privkey_address()
+
+    running_channel = Channel(
+        ChannelEndState(address1, 70, None, EMPTY_MERKLE_TREE),
+        ChannelEndState(address2, 110, None, EMPTY_MERKLE_TREE),
+        make_external_state(),
+        token_address,
+        reveal_timeout=5,
+        settle_timeout=15,
+    )
+    partner_channel = Channel(
+        ChannelEndState(address2, 110, None, EMPTY_MERKLE_TREE),
+        ChannelEndState(address1, 70, None, EMPTY_MERKLE_TREE),
+        make_external_state(),
+        token_address,
+        reveal_timeout=5,
+        settle_timeout=15,
+    )
+
+    sent_transfer = running_channel.create_mediatedtransfer(
+        address1,
+        address2,
+        fee=0,
+        amount=10,
+        identifier=1,
+        expiration=10,
+        hashlock=sha3('sent'),
+    )
+    sent_transfer.sign(privkey1, address1)
+    running_channel.register_transfer(1, sent_transfer)
+
+    for identifier, secret in enumerate(('received1', 'received2'), 2):
+        received_transfer = partner_channel.create_mediatedtransfer(
+            address2,
+            address1,
+            fee=0,
+            amount=5,
+            identifier=identifier,
+            expiration=10,
+            hashlock=sha3(secret),
+        )
+        received_transfer.sign(privkey2, address2)
+        partner_channel.register_transfer(1, received_transfer)
+        running_channel.register_transfer(1, received_transfer)
+
+    serialized = pickle.loads(pickle.dumps(running_channel.serialize(), -1))
+    assert len(serialized.our_leaves) == 1
+    assert len(serialized.partner_leaves) == 2
+
+    graph = ChannelGraph(address1, make_address(), token_address, [], [])
+
+    class RaidenMock(object):
+        chain = None
+        token_to_channelgraph = {token_address: graph}
+
+        def register_channel_for_hashlock(self, *args):
+            pass
+
+        def log_channel_transfer(self, *args):
+            pass
+
+    restored_channel = RaidenService.restore_channel_lazily.__func__(RaidenMock(), serialized)
+
+    assert restored_channel.serialize() == running_channel.serialize()
+    assert restored_channel.our_state.merkletree == running_channel.our_state.merkletree
+    assert restored_channel.partner_state.merkletree == running_channel.partner_state.merkletree
+
+
 @pytest.mark.parametrize('blockchain_type', ['tester'])
 @pytest.mark.parametrize('number_of_nodes', [2])
 def test_setup(raiden_network, deposit, token_addresses):
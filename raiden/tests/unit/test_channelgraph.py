@@ -61,3 +61,35 @@ def test_addchannel_must_not_overwrite():  # pylint: disable=too-many-locals
     graph.add_channel(channel_detail)
 
     assert first_instance is graph.address_to_channel[channel_address]
+
+
+def test_remove_channel():
+    our_address = make_address()
+    partner_address = make_address()
+    channel_address = make_address()
+
+    channel_detail = ChannelDetails(
+        channel_address,
+        ParticipantStateMock(our_address),
+        ParticipantStateMock(partner_address),
+        ExternalStateMock(NettingChannelMock(channel_address)),
+        5,
+        10,
+    )
+
+    graph = ChannelGraph(
+        our_address,
+        make_address(),
+        make_address(),
+        [],
+        [channel_detail],
+    )
+    channel = graph.address_to_channel[channel_address]
+    assert graph.has_channel(our_address, partner_address)
+
+    graph.remove_channel(channel)
+
+    assert channel_address not in graph.address_to_channel
+    assert partner_address not in graph.partneraddress_to_channel
+    assert not graph.has_channel(our_address, partner_address)
+    assert list(graph.get_neighbours()) == []
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from raiden.network.dedup import AckCache, HashFilter
+from raiden.utils import sha3
+
+A, B, C, D = [sha3(key) for key in 'abcd']
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class StorageMock(object):
+    def __init__(self):
+        self.acks = dict()
+        self.lookups = 0
+
+    def write_acks(self, acks):
+        for echohash, _, receiver_address, messagedata in acks:
+            self.acks[echohash] = (receiver_address, messagedata)
+
+    def get_ack(self, echohash):
+        self.lookups += 1
+        return self.acks.get(echohash)
+
+    def get_ack_hashes(self):
+        return list(self.acks)
+
+
+def test_ack_cache_evicts_least_recently_used():
+    storage = StorageMock()
+    cache = AckCache(maxsize=2, storage=storage)
+
+    cache[A] = ('receiver', 'ack a')
+    cache[B] = ('receiver', 'ack b')
+    assert cache[A] == ('receiver', 'ack a')
+
+    cache[C] = ('receiver', 'ack c')
+    assert set(cache) == {A, C}
+    assert len(cache) == 2
+
+    # the evicted entry is still served from the storage
+    assert storage.acks == {B: ('receiver', 'ack b')}
+    assert B in cache
+    assert cache.get(B) == ('receiver', 'ack b')
+    assert cache.get(D) is None
+
+    with pytest.raises(ValueError):
+        AckCache(maxsize=0)
+
+
+def test_ack_cache_expires_unused_entries():
+    clock = Clock()
+    storage = StorageMock()
+    cache = AckCache(maxsize=10, ttl=5, storage=storage, time_function=clock)
+
+    cache[A] = ('receiver', 'ack a')
+    clock.now = 3
+    cache[B] = ('receiver', 'ack b')
+    clock.now = 4
+    assert cache[A] == ('receiver', 'ack a')
+
+    clock.now = 9
+    cache[C] = ('receiver', 'ack c')
+    assert set(cache) == {A, C}
+    assert set(storage.acks) == {B}
+
+    # reading the items does not refresh the entries
+    assert dict(cache.items()) == {
+        A: ('receiver', 'ack a'),
+        C: ('receiver', 'ack c'),
+    }
+    assert list(cache) == [A, C]
+
+
+def test_ack_cache_without_storage_discards():
+    cache = AckCache(maxsize=1)
+
+    cache[A] = ('receiver', 'ack a')
+    cache[B] = ('receiver', 'ack b')
+
+    assert A not in cache
+    assert cache[B] == ('receiver', 'ack b')
+
+
+def test_ack_cache_queries_storage_for_spilled_hashes():
+    storage = StorageMock()
+    storage.acks[A] = ('receiver', 'ack a')
+    cache = AckCache(maxsize=1, storage=storage)
+
+    # the acks stored before the cache was created are found
+    assert cache[A] == ('receiver', 'ack a')
+    assert storage.lookups == 1
+
+    # new messages are not looked up in the storage
+    new_hashes = [sha3(str(number)) for number in range(100)]
+    assert all(cache.get(echohash) is None for echohash in new_hashes)
+    assert storage.lookups < 5
+
+    # the filter grows with the spilled acks
+    for echohash in new_hashes:
+        cache[echohash] = ('receiver', echohash)
+
+    assert len(storage.acks) == 100
+    assert all(cache[echohash] == ('receiver', echohash) for echohash in new_hashes)
+    assert cache.spilled.capacity >= 100
+
+
+def test_hash_filter():
+    present = [sha3('present {}'.format(number)) for number in range(1000)]
+    absent = [sha3('absent {}'.format(number)) for number in range(1000)]
+
+    hash_filter = HashFilter(len(present))
+    for echohash in present:
+        hash_filter.add(echohash)
+
+    assert all(echohash in hash_filter for echohash in present)
+    assert sum(echohash in hash_filter for echohash in absent) < 50
@@ -2,9 +2,15 @@
 
 import pytest
 
+from raiden.encoding.messages import (
+    ACK_FLAG_MULTIACK,
+    pack_envelopes,
+    unpack_envelope,
+)
 from raiden.messages import (
     decode,
     Ack,
+    MultiAck,
     Ping,
 )
 from raiden.utils import sha3
@@ -49,6 +55,44 @@ def test_hash():
     assert sha3(decoded_ping.encode()) == msghash
 
 
+def test_encoding_is_invalidated_on_mutation():
+    ping = Ping(nonce=0)
+    ping.sign(PRIVKEY, ADDRESS)
+    data = ping.encode()
+    assert ping.encode() is data
+
+    ping.nonce = 1
+    assert ping.encode() != data
+    assert decode(ping.encode()).nonce == 1
+
+
+def test_encoding_is_invalidated_on_lock_mutation():
+    mediated_transfer = make_mediated_transfer(amount=10)
+    mediated_transfer.sign(PRIVKEY, ADDRESS)
+    data = mediated_transfer.encode()
+    assert mediated_transfer.encode() is data
+
+    mediated_transfer.lock.amount = 5
+    assert mediated_transfer.encode() != data
+    assert decode(mediated_transfer.encode()).lock.amount == 5
+
+    # the lock of a decoded transfer
+    decoded_transfer = decode(data)
+    decoded_transfer.lock.expiration += 1
+    assert decode(decoded_transfer.encode()).lock == decoded_transfer.lock
+
+    # a lock shared with another transfer
+    refund_transfer = mediated_transfer.to_refundtransfer(
+        mediated_transfer.target,
+        mediated_transfer.initiator,
+    )
+    refund_transfer.sign(PRIVKEY, ADDRESS)
+    refund_data = refund_transfer.encode()
+    mediated_transfer.lock.amount = 1
+    assert refund_transfer.encode() != refund_data
+    assert decode(refund_transfer.encode()).lock.amount == 1
+
+
 def test_ack():
     echo = sha3('random')
     ack = Ack(ADDRESS, echo)
@@ -61,6 +105,52 @@ def test_ack():
     assert sha3(decoded_ack.encode()) == msghash
 
 
+def test_ack_flags():
+    echo = sha3('random')
+
+    assert decode(Ack(ADDRESS, echo).encode()).flags == 0
+
+    ack = Ack(ADDRESS, echo, ACK_FLAG_MULTIACK)
+    data = ack.encode()
+    assert len(data) == len(Ack(ADDRESS, echo).encode())
+    assert decode(data).flags & ACK_FLAG_MULTIACK
+
+
+def test_multiack():
+    echoes = [sha3(str(number)) for number in range(MultiAck.max_echoes)]
+    multiack = MultiAck(ADDRESS, echoes)
+
+    data = multiack.encode()
+    decoded_multiack = decode(data)
+    assert decoded_multiack.sender == ADDRESS
+    assert decoded_multiack.echoes == echoes
+    assert decoded_multiack.encode() == data
+
+    # truncated or with a wrong count
+    assert decode(data[:-1]) is None
+    assert decode(data[:-32]) is None
+
+
+def test_envelope():
+    messages_data = [
+        Ack(ADDRESS, sha3(str(number))).encode()
+        for number in range(30)
+    ]
+
+    # a single message is not wrapped
+    assert pack_envelopes(messages_data[:1], 1200) == messages_data[:1]
+
+    datagrams = pack_envelopes(messages_data, 1200)
+    assert len(datagrams) == 2
+    assert all(len(datagram) <= 1200 for datagram in datagrams)
+
+    unpacked = unpack_envelope(datagrams[0]) + unpack_envelope(datagrams[1])
+    assert unpacked == messages_data
+
+    assert unpack_envelope(datagrams[0][:-1]) is None
+    assert unpack_envelope(datagrams[0] + b'\x00') is None
+
+
 @pytest.mark.parametrize('amount', [-1, 2 ** 256])
 @pytest.mark.parametrize(
     'make',
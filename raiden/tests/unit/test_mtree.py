@@ -5,11 +5,17 @@ from raiden.messages import EMPTY_MERKLE_ROOT
 from raiden.exceptions import HashLengthNot32
 from raiden.utils import sha3
 from raiden.transfer.merkle_tree import (
+    EMPTY_MERKLE_TREE,
     MERKLEROOT,
     compute_layers,
     compute_merkleproof_for,
+    compute_merkleproofs_for,
     validate_proof,
     merkleroot,
+    merkleroot_with,
+    merkleroot_without,
+    merkletree_insert,
+    merkletree_remove,
 )
 from raiden.transfer.state import MerkleTreeState
 
@@ -144,3 +150,64 @@ def test_many(tree_up_to=10):
 
         reversed_tree = MerkleTreeState(compute_layers(reversed(leaves)))
         assert root == merkleroot(reversed_tree)
+
+
+def test_incremental_insert_and_remove(tree_up_to=40):
+    leaves = [sha3(str(value)) for value in range(tree_up_to)]
+
+    tree = EMPTY_MERKLE_TREE
+    for number_of_leaves, leaf in enumerate(leaves, 1):
+        expected_layers = compute_layers(leaves[:number_of_leaves])
+
+        assert merkleroot_with(tree, leaf) == expected_layers[MERKLEROOT][0]
+        tree = merkletree_insert(tree, leaf)
+        assert tree.layers == expected_layers
+
+    for number_of_leaves in range(tree_up_to - 1, 0, -1):
+        # remove from the middle of the sorted leaves
+        leaf = sorted(leaves)[number_of_leaves // 2]
+        leaves.remove(leaf)
+        expected_layers = compute_layers(leaves)
+
+        assert merkleroot_without(tree, leaf) == expected_layers[MERKLEROOT][0]
+        tree = merkletree_remove(tree, leaf)
+        assert tree.layers == expected_layers
+
+    assert merkleroot_without(tree, leaves[0]) == EMPTY_MERKLE_ROOT
+    assert merkletree_remove(tree, leaves[0]) == EMPTY_MERKLE_TREE
+
+
+def test_incremental_is_persistent():
+    leaves = [sha3(str(value)) for value in range(5)]
+    tree = MerkleTreeState(compute_layers(leaves))
+    expected_layers = compute_layers(leaves)
+
+    merkletree_insert(tree, sha3('new'))
+    merkletree_remove(tree, leaves[0])
+    assert tree.layers == expected_layers
+
+    with pytest.raises(ValueError):
+        merkletree_insert(tree, leaves[1])
+
+    with pytest.raises(ValueError):
+        merkletree_remove(tree, sha3('unknown'))
+
+    with pytest.raises(HashLengthNot32):
+        merkletree_insert(tree, 'not32bytes')
+
+
+def test_batch_proofs(tree_up_to=20):
+    for number_of_leaves in range(1, tree_up_to):
+        leaves = [sha3(str(value)) for value in range(number_of_leaves)]
+        tree = MerkleTreeState(compute_layers(leaves))
+
+        # a subset of the leaves, with a repeated leaf
+        elements = leaves[::2] + leaves[:1]
+        proofs = compute_merkleproofs_for(tree, elements)
+
+        assert proofs == [compute_merkleproof_for(tree, element) for element in elements]
+
+    assert compute_merkleproofs_for(tree, []) == []
+
+    with pytest.raises(IndexError):
+        compute_merkleproofs_for(tree, [sha3('unknown')])
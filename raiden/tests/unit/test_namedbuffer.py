@@ -66,3 +66,30 @@ def test_namedbuffer_does_not_expose_internals():
 def test_namedbuffer_type_exposes_details():
     assert SingleByte.format == '>B'
     assert SingleByte.fields_spec == [byte]
+
+
+def test_namedbuffer_unpack_from():
+    Mixed = namedbuffer('Mixed', [byte, hugeint])
+
+    data = bytearray(Mixed.size)
+    packed_data = Mixed(data)
+    packed_data.byte = b'\x07'
+    packed_data.huge = 2 ** 32
+
+    unpacked = Mixed.unpack_from(bytes(data))
+    assert unpacked.byte == packed_data.byte
+    assert unpacked.huge == packed_data.huge
+
+
+def test_namedbuffer_pack_into():
+    Mixed = namedbuffer('Mixed', [byte, hugeint])
+
+    data = bytearray(Mixed.size)
+    Mixed.pack_into(data, 0, {'byte': b'\x07', 'huge': 2 ** 32})
+
+    packed_data = Mixed(data)
+    assert packed_data.byte == b'\x07'
+    assert packed_data.huge == 2 ** 32
+
+    with pytest.raises(ValueError):
+        Mixed.pack_into(data, 0, {'huge': 2 ** (8 * 100)})
@@ -13,3 +13,15 @@ def test_copy():
 
     queue.put(2)
     assert queue.copy() == [1, 2], 'copy must preserve the items order'
+
+
+def test_peek_many():
+    queue = NotifyingQueue()
+    assert queue.peek_many(2) == []
+
+    queue.put(1)
+    queue.put(2)
+    queue.put(3)
+    assert queue.peek_many(2) == [1, 2]
+    assert queue.peek_many(5) == [1, 2, 3]
+    assert queue.copy() == [1, 2, 3], 'peek_many must preserve the queue'
@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+import time
+
+import gevent
+from gevent.event import AsyncResult, Event
+
+from raiden.encoding.messages import (
+    ACK_FLAG_ENVELOPE,
+    ACK_FLAG_MULTIACK,
+    pack_envelopes,
+    unpack_envelope,
+)
+from raiden.exceptions import InvalidNonce
+from raiden.messages import decode, Ack, MultiAck
+from raiden.network.protocol import (
+    HealthCheck,
+    NODE_NETWORK_REACHABLE,
+    NODE_NETWORK_UNREACHABLE,
+    QueueSender,
+    RaidenProtocol,
+    single_queue_send,
+)
+from raiden.network.scheduler import Scheduler
+from raiden.tests.utils.factories import make_privkey_address
+from raiden.tests.utils.messages import make_direct_transfer
+from raiden.transfer.log import StateChangeLog, StateChangeLogSQLiteBackend
+from raiden.utils import sha3
+from raiden.utils.notifying_queue import NotifyingQueue
+
+ADDRESS = b'\x01' * 20
+PEER = b'\x02' * 20
+
+
+class ProtocolMock(object):
+    def __init__(self):
+        self.sent = list()
+        self.results = dict()
+        self.network_state = None
+
+    def get_host_port(self, address):  # pylint: disable=unused-argument,no-self-use
+        return ('127.0.0.1', 40001)
+
+    def get_ping(self, nonce):  # pylint: disable=no-self-use
+        return 'ping{}'.format(nonce)
+
+    def set_node_network_state(self, node_address, node_state):  # pylint: disable=unused-argument
+        self.network_state = node_state
+
+    def send_raw_with_result(self, data, receiver_address):  # pylint: disable=unused-argument
+        async_result = self.results.setdefault(data, AsyncResult())
+
+        if not async_result.ready():
+            self.sent.append(data)
+
+        return async_result
+
+
+def test_single_queue_send_window():
+    protocol = ProtocolMock()
+    queue = NotifyingQueue()
+    event_stop = Event()
+    event_healthy = Event()
+    event_unhealthy = Event()
+    event_healthy.set()
+
+    for data in ('a', 'b', 'c', 'd'):
+        queue.put(data)
+
+    task = gevent.spawn(
+        single_queue_send,
+        protocol,
+        'receiver',
+        queue,
+        event_stop,
+        event_healthy,
+        event_unhealthy,
+        1,
+        0.05,
+        0.05,
+        2,
+    )
+    gevent.sleep(0.01)
+    assert protocol.sent == ['a', 'b']
+
+    # the window only moves once the head is acknowledged
+    protocol.results['b'].set(True)
+    gevent.sleep(0.01)
+    assert protocol.sent == ['a', 'b']
+    assert queue.copy() == ['a', 'b', 'c', 'd']
+
+    # only the unacknowledged message is retransmitted
+    gevent.sleep(0.05)
+    assert protocol.sent == ['a', 'b', 'a']
+
+    protocol.results['a'].set(True)
+    gevent.sleep(0.01)
+    assert protocol.sent == ['a', 'b', 'a', 'c', 'd']
+    assert queue.copy() == ['c', 'd']
+
+    protocol.results['c'].set(True)
+    protocol.results['d'].set(True)
+    gevent.sleep(0.01)
+    assert len(queue) == 0
+
+    queue.put('e')
+    gevent.sleep(0.01)
+    assert protocol.sent[-1] == 'e'
+
+    event_stop.set()
+    task.join(timeout=1)
+    assert task.ready()
+
+
+def test_queue_sender_window():
+    protocol = ProtocolMock()
+    queue = NotifyingQueue()
+    event_stop = Event()
+    event_healthy = Event()
+    event_unhealthy = Event()
+
+    scheduler = Scheduler(workers=1, resolution=0.005)
+    scheduler.start()
+
+    for data in ('a', 'b', 'c'):
+        queue.put(data)
+
+    QueueSender(
+        scheduler,
+        protocol,
+        'receiver',
+        queue,
+        event_stop,
+        event_healthy,
+        event_unhealthy,
+        1,
+        0.05,
+        0.05,
+        2,
+    ).wakeup()
+
+    # nothing is sent before the endpoint is known
+    gevent.sleep(0.01)
+    assert protocol.sent == []
+
+    event_healthy.set()
+    gevent.sleep(0.01)
+    assert protocol.sent == ['a', 'b']
+
+    protocol.results['b'].set(True)
+    gevent.sleep(0.01)
+    assert protocol.sent == ['a', 'b']
+
+    # only the unacknowledged message is retransmitted
+    gevent.sleep(0.06)
+    assert protocol.sent == ['a', 'b', 'a']
+
+    protocol.results['a'].set(True)
+    gevent.sleep(0.01)
+    assert protocol.sent == ['a', 'b', 'a', 'c']
+    assert queue.copy() == ['c']
+
+    event_stop.set()
+    scheduler.stop()
+
+
+def test_health_check():
+    protocol = ProtocolMock()
+    event_stop = Event()
+    event_healthy = Event()
+    event_unhealthy = Event()
+
+    scheduler = Scheduler(workers=1, resolution=0.005)
+    scheduler.start()
+
+    HealthCheck(
+        scheduler,
+        protocol,
+        'receiver',
+        event_stop,
+        event_healthy,
+        event_unhealthy,
+        2,
+        0.02,
+        0.05,
+        {'nonce': 0},
+    ).wakeup()
+
+    gevent.sleep(0.01)
+    assert event_healthy.is_set()
+    assert protocol.sent == ['ping1']
+
+    protocol.results['ping1'].set(True)
+    gevent.sleep(0.01)
+    assert protocol.network_state == NODE_NETWORK_REACHABLE
+
+    # the next Ping is not acknowledged, the node becomes unreachable once
+    # the retries are exhausted
+    gevent.sleep(0.1)
+    assert protocol.sent[:4] == ['ping1', 'ping2', 'ping2', 'ping2']
+    assert protocol.network_state == NODE_NETWORK_UNREACHABLE
+    assert event_unhealthy.is_set()
+    assert not event_healthy.is_set()
+
+    protocol.results['ping2'].set(True)
+    gevent.sleep(0.01)
+    assert protocol.network_state == NODE_NETWORK_REACHABLE
+    assert event_healthy.is_set()
+
+    event_stop.set()
+    scheduler.stop()
+
+
+class TransportMock(object):
+    def __init__(self):
+        self.server = Event()
+        self.server.started = True
+        self.sent = list()
+
+    def send(self, sender, host_port, bytes_):  # pylint: disable=unused-argument
+        self.sent.append(bytes_)
+
+
+class DiscoveryMock(object):
+    def get(self, address):  # pylint: disable=unused-argument,no-self-use
+        return ('127.0.0.1', 40001)
+
+
+class RaidenMock(object):
+    address = ADDRESS
+
+
+def make_protocol(ack_delay=0, batch_messages=False):
+    return RaidenProtocol(
+        TransportMock(),
+        DiscoveryMock(),
+        RaidenMock(),
+        retry_interval=1,
+        retries_before_backoff=1,
+        nat_keepalive_retries=1,
+        nat_keepalive_timeout=1,
+        nat_invitation_timeout=1,
+        ack_delay=ack_delay,
+        batch_messages=batch_messages,
+    )
+
+
+def test_acks_are_coalesced():
+    protocol = make_protocol(ack_delay=0.01)
+    echoes = [sha3(str(number)) for number in range(3)]
+
+    # Acks are not coalesced for nodes that did not advertise MultiAck
+    protocol.maybe_send_ack(PEER, Ack(ADDRESS, echoes[0], ACK_FLAG_MULTIACK))
+    assert len(protocol.transport.sent) == 1
+    assert isinstance(decode(protocol.transport.sent[0]), Ack)
+
+    protocol.receive_message(None, None, Ack(PEER, sha3('peer'), ACK_FLAG_MULTIACK))
+    assert protocol.nodeaddresses_to_flags[PEER] & ACK_FLAG_MULTIACK
+
+    protocol.maybe_send_ack(PEER, Ack(ADDRESS, echoes[1], ACK_FLAG_MULTIACK))
+    protocol.maybe_send_ack(PEER, Ack(ADDRESS, echoes[2], ACK_FLAG_MULTIACK))
+    assert len(protocol.transport.sent) == 1
+
+    gevent.sleep(0.05)
+    assert len(protocol.transport.sent) == 2
+
+    multiack = decode(protocol.transport.sent[1])
+    assert isinstance(multiack, MultiAck)
+    assert multiack.echoes == echoes[1:]
+
+    # the Ack of a retransmission is replayed right away
+    assert protocol.receivedhashes_to_acks[echoes[2]][0] == PEER
+
+
+def test_receive_multiack():
+    protocol = make_protocol(ack_delay=0)
+    data = [b'message1', b'message2']
+
+    results = [
+        protocol.send_raw_with_result(message_data, PEER)
+        for message_data in data
+    ]
+    echoes = [sha3(message_data + PEER) for message_data in data]
+
+    protocol.receive_message(None, None, MultiAck(PEER, echoes))
+
+    assert all(result.get(block=False) for result in results)
+    assert protocol.nodeaddresses_to_flags[PEER] & ACK_FLAG_MULTIACK
+
+
+def test_messages_are_batched():
+    protocol = make_protocol(batch_messages=True)
+    data = [b'message1', b'message2', b'message3']
+
+    # nodes that did not advertise envelopes get one datagram per message
+    protocol.send_raw_with_result(data[0], PEER)
+    assert protocol.transport.sent == data[:1]
+
+    protocol.receive_message(None, None, Ack(PEER, sha3('peer'), ACK_FLAG_ENVELOPE))
+
+    protocol.send_raw_with_result(data[1], PEER)
+    protocol.send_raw_with_result(data[2], PEER)
+    assert len(protocol.transport.sent) == 1
+
+    gevent.sleep(0)
+    assert len(protocol.transport.sent) == 2
+    assert unpack_envelope(protocol.transport.sent[1]) == data[1:]
+
+
+def test_receive_envelope():
+    protocol = make_protocol()
+    data = [b'message1', b'message2']
+
+    results = [
+        protocol.send_raw_with_result(message_data, PEER)
+        for message_data in data
+    ]
+    acks = [
+        Ack(PEER, sha3(message_data + PEER)).encode()
+        for message_data in data
+    ]
+
+    protocol.receive(pack_envelopes(acks, 1200)[0])
+
+    assert all(result.get(block=False) for result in results)
+
+
+class PairTransport(TransportMock):
+    """ Delivers the packets to the protocol of the other node, each one
+    from its own greenlet as the UDP server does.
+    """
+
+    def __init__(self):
+        super(PairTransport, self).__init__()
+        self.peer_protocol = None
+
+    def send(self, sender, host_port, bytes_):
+        super(PairTransport, self).send(sender, host_port, bytes_)
+        gevent.spawn(self.peer_protocol.receive, bytes_)
+
+    def stop_accepting(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class TransactionLogMock(object):
+    def get_commit_result(self):  # pylint: disable=no-self-use
+        async_result = AsyncResult()
+        async_result.set(True)
+        return async_result
+
+
+class NodeMock(object):
+    """ Checks the nonces of the received transfers as the channels do. """
+
+    def __init__(self):
+        self.privkey, self.address = make_privkey_address()
+        self.transaction_log = TransactionLogMock()
+        self.nonces = list()
+
+    def sign(self, message):
+        message.sign(self.privkey, self.address)
+
+    def on_message(self, message, echohash):  # pylint: disable=unused-argument
+        # the first transfer takes longer to handle, e.g. to wait for a
+        # group commit
+        if message.nonce == 1:
+            gevent.sleep(0.05)
+
+        if message.nonce != len(self.nonces) + 1:
+            raise InvalidNonce(message)
+
+        self.nonces.append(message.nonce)
+
+
+def test_send_window_end_to_end():
+    nodes = [NodeMock(), NodeMock()]
+    protocols = [
+        RaidenProtocol(
+            PairTransport(),
+            DiscoveryMock(),
+            node,
+            # a rejected transfer would only be retransmitted after the test
+            retry_interval=10,
+            retries_before_backoff=1,
+            nat_keepalive_retries=1,
+            nat_keepalive_timeout=10,
+            nat_invitation_timeout=10,
+            send_window=5,
+        )
+        for node in nodes
+    ]
+    protocols[0].transport.peer_protocol = protocols[1]
+    protocols[1].transport.peer_protocol = protocols[0]
+
+    sender, receiver = nodes
+    results = list()
+    for nonce in range(1, 6):
+        transfer = make_direct_transfer(nonce=nonce)
+        sender.sign(transfer)
+        results.append(protocols[0].send_async(receiver.address, transfer))
+
+    with gevent.Timeout(1):
+        assert all(result.get() for result in results)
+
+    assert receiver.nonces == range(1, 6)
+
+    for protocol in protocols:
+        protocol.stop_and_wait()
+
+
+class LoggingNodeMock(object):
+    """ Logs a state change for every received message, as the node does. """
+
+    def __init__(self, transaction_log):
+        self.address = ADDRESS
+        self.transaction_log = transaction_log
+        self.received = list()
+
+    def on_message(self, message, echohash):  # pylint: disable=unused-argument
+        self.transaction_log.log((message.sender, message.nonce))
+        self.received.append(message)
+
+
+def test_group_commit_with_verification_pool():
+    group_commit_timeout = 0.2
+    transaction_log = StateChangeLog(
+        storage_instance=StateChangeLogSQLiteBackend(
+            ':memory:',
+            group_commit_size=10,
+            group_commit_timeout=group_commit_timeout,
+        ),
+    )
+    node = LoggingNodeMock(transaction_log)
+    protocol = RaidenProtocol(
+        TransportMock(),
+        DiscoveryMock(),
+        node,
+        retry_interval=10,
+        retries_before_backoff=1,
+        nat_keepalive_retries=1,
+        nat_keepalive_timeout=10,
+        nat_invitation_timeout=10,
+        ack_delay=0,
+        verify_workers=2,
+    )
+    protocol.verification_pool.start()
+
+    result = protocol.send_raw_with_result(b'message', PEER)
+    sent_count = len(protocol.transport.sent)
+
+    senders = [make_privkey_address() for _ in range(4)]
+    for privkey, address in senders:
+        transfer = make_direct_transfer(nonce=1)
+        transfer.sign(privkey, address)
+        protocol.receive(transfer.encode())
+
+    # the ack is in the same batch as the transfers, it must not wait for
+    # their commit
+    protocol.receive(Ack(PEER, sha3(b'message' + PEER)).encode())
+
+    start = time.time()
+    with gevent.Timeout(group_commit_timeout / 2):
+        assert result.get()
+
+    # the transfers of all the senders are committed together instead of
+    # one group commit timeout each
+    with gevent.Timeout(group_commit_timeout * 2):
+        while len(protocol.transport.sent) < sent_count + len(senders):
+            gevent.sleep(0.01)
+
+    assert time.time() - start < group_commit_timeout * 2
+    assert len(node.received) == len(senders)
+
+    acks = [decode(data) for data in protocol.transport.sent[sent_count:]]
+    assert all(isinstance(ack, Ack) for ack in acks)
+
+    protocol.verification_pool.stop()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import time
+
+import gevent
+import pytest
+
+from raiden.network.scheduler import ScheduledTask, Scheduler, TimerWheel
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def expire(wheel, clock, until):
+    """ Advance the wheel tick by tick, returns the time each callback ran. """
+    fired = list()
+
+    while clock.now < until:
+        clock.now += wheel.resolution
+        for timer in wheel.advance():
+            fired.append((timer.args[0], clock.now))
+
+    return fired
+
+
+def test_timer_wheel():
+    clock = Clock()
+    wheel = TimerWheel(resolution=1, slots=4, levels=2, time_function=clock)
+
+    # the delays cover the first level, the second level and the overflow
+    delays = [0.5, 3, 5, 13, 16, 40]
+    timers = {
+        delay: wheel.schedule(delay, None, delay)
+        for delay in delays
+    }
+    timers[13].cancel()
+
+    fired = expire(wheel, clock, 50)
+    assert [delay for delay, _ in fired] == [0.5, 3, 5, 16, 40]
+
+    # no timer runs early nor more than a tick late
+    for delay, fired_at in fired:
+        assert delay <= fired_at <= delay + 1
+
+    assert not timers[40].active
+
+    with pytest.raises(ValueError):
+        TimerWheel(resolution=0)
+
+
+def test_timer_wheel_schedule_while_running():
+    clock = Clock()
+    wheel = TimerWheel(resolution=1, slots=4, levels=2, time_function=clock)
+
+    clock.now = 7.5
+    wheel.advance()
+    wheel.schedule(10, None, 'late')
+
+    fired = expire(wheel, clock, 30)
+    assert len(fired) == 1
+    assert 17.5 <= fired[0][1] <= 18.5
+
+
+class CounterTask(ScheduledTask):
+    def __init__(self, scheduler):
+        super(CounterTask, self).__init__(scheduler)
+        self.runs = 0
+
+    def run(self):
+        self.runs += 1
+
+        # a wakeup while running makes the task run once more, not twice
+        if self.runs == 1:
+            self.wakeup()
+            self.wakeup()
+
+
+def test_scheduled_task():
+    scheduler = Scheduler(workers=2, resolution=0.01)
+    scheduler.start()
+
+    task = CounterTask(scheduler)
+    task.wakeup()
+    task.wakeup()
+    gevent.sleep(0.01)
+    assert task.runs == 2
+
+    task.wakeup_at(time.time() + 10)
+    task.wakeup_at(time.time() + 0.05)
+    gevent.sleep(0.2)
+    assert task.runs == 3
+
+    scheduler.stop()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import glob
+import os
+
+import pytest
+
+from raiden.exceptions import CorruptedTransactionLog
+from raiden.tests.utils import factories
+from raiden.transfer.events import (
+    EventTransferReceivedSuccess,
+    EventTransferSentFailed,
+)
+from raiden.transfer.log import StateChangeLog
+from raiden.transfer.segment_log import StateChangeLogSegmentBackend
+from raiden.transfer.state_change import Block
+
+
+def open_log(log_dir, **kwargs):
+    return StateChangeLog(
+        storage_instance=StateChangeLogSegmentBackend(log_dir, **kwargs)
+    )
+
+
+def segment_files(log_dir):
+    return sorted(glob.glob(os.path.join(log_dir, 'segment-*.log')))
+
+
+def test_write_read_and_reopen(tmpdir):
+    log_dir = os.path.join(tmpdir.strpath, 'log')
+    log = open_log(log_dir)
+
+    for block_number in range(1, 4):
+        state_change_id = log.log(Block(block_number), events_pending=True)
+        log.log_events(
+            state_change_id,
+            [EventTransferSentFailed(block_number, 'whatever')],
+            block_number,
+        )
+
+    received = EventTransferReceivedSuccess(4, 10, factories.HOP1)
+    log.log_events(log.log(Block(4)), [received], 4)
+    log.snapshot(3, 'snapshot')
+    log.storage.flush()
+
+    for log in (log, open_log(log_dir)):
+        assert log.last_state_change_id == 4
+        assert log.get_state_change_by_id(2).block_number == 2
+        state_change_id, snapshot_data = log.storage.get_state_snapshot()
+        assert state_change_id == 3
+        assert log.serializer.deserialize(snapshot_data) == 'snapshot'
+
+        events = log.get_events(from_block=2)
+        assert [event.identifier for event in events] == [2, 3, 4]
+        assert [event.state_change_id for event in events] == [2, 3, 4]
+        assert log.get_events(partner=factories.HOP1)[0].event_object == received
+        assert len(log.get_events(event_types=[EventTransferSentFailed], to_block=2)) == 2
+
+    with pytest.raises(ValueError):
+        log.log_events(5, [received], 4)
+
+
+def test_interrupted_write_is_truncated(tmpdir):
+    log_dir = os.path.join(tmpdir.strpath, 'log')
+    log = open_log(log_dir)
+    log.log(Block(1))
+    log.log(Block(2))
+    del log
+
+    last_segment = segment_files(log_dir)[-1]
+    size = os.path.getsize(last_segment)
+    with open(last_segment, 'r+b') as handler:
+        handler.truncate(size - 3)
+
+    log = open_log(log_dir)
+    assert log.last_state_change_id == 1
+    assert log.log(Block(3)) == 2
+    assert log.get_state_change_by_id(2).block_number == 3
+
+
+def test_corrupted_segment(tmpdir):
+    log_dir = os.path.join(tmpdir.strpath, 'log')
+    log = open_log(log_dir, segment_size=64)
+    for block_number in range(10):
+        log.log(Block(block_number))
+    del log
+
+    first_segment = segment_files(log_dir)[0]
+    with open(first_segment, 'r+b') as handler:
+        handler.seek(-1, os.SEEK_END)
+        handler.write('\xff')
+
+    with pytest.raises(CorruptedTransactionLog):
+        open_log(log_dir)
+
+
+def test_segment_rotation_and_removal(tmpdir):
+    log_dir = os.path.join(tmpdir.strpath, 'log')
+    log = open_log(log_dir, segment_size=256)
+
+    for block_number in range(1, 21):
+        state_change_id = log.log(Block(block_number), events_pending=True)
+        log.log_events(
+            state_change_id,
+            [EventTransferSentFailed(block_number, 'whatever')],
+            block_number,
+        )
+    all_segments = segment_files(log_dir)
+    assert len(all_segments) > 10
+
+    # the segments with only compacted state changes and pruned events are
+    # deleted
+    log.compact(15)
+    log.prune(16, 15, live_identifiers=set())
+    remaining_segments = segment_files(log_dir)
+    assert all_segments[0] not in remaining_segments
+    assert len(remaining_segments) < len(all_segments) - 10
+    assert [identifier for identifier, _ in log.get_state_changes_after(0)] == range(16, 21)
+
+    log = open_log(log_dir, segment_size=256)
+    assert [identifier for identifier, _ in log.get_state_changes_after(0)] == range(16, 21)
+    assert [event.identifier for event in log.get_events()] == range(16, 21)
+    assert log.log(Block(21)) == 21
+
+
+def test_acks(tmpdir):
+    log_dir = os.path.join(tmpdir.strpath, 'log')
+    log = open_log(log_dir, segment_size=256)
+
+    log.write_acks([
+        ('hash1', 10.0, factories.ADDR, 'ack1'),
+        ('hash2', 20.0, factories.HOP1, 'ack2'),
+    ])
+    log.write_acks([('hash1', 30.0, factories.ADDR, 'ack1 again')])
+    log.prune_acks(15.0)
+    log.write_acks([('hash3', 40.0, factories.HOP1, 'ack3')])
+    log.storage.flush()
+
+    for log in (log, open_log(log_dir, segment_size=256)):
+        assert log.get_ack('hash1') == (factories.ADDR, 'ack1 again')
+        assert log.get_ack('hash2') == (factories.HOP1, 'ack2')
+        assert log.get_ack('hash3') == (factories.HOP1, 'ack3')
+        assert sorted(log.get_ack_hashes()) == ['hash1', 'hash2', 'hash3']
+
+    # the segments with only pruned acks are deleted
+    all_segments = segment_files(log_dir)
+    log.prune_acks(50.0)
+    assert log.get_ack_hashes() == []
+    assert len(segment_files(log_dir)) < len(all_segments)
+
+    log = open_log(log_dir, segment_size=256)
+    assert log.get_ack('hash2') is None
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import inspect
+import pickle
+
+import pytest
+
+from raiden.tests.utils import factories
+from raiden.transfer import events, state_change
+from raiden.transfer.architecture import Event, StateChange
+from raiden.transfer.mediated_transfer import (
+    events as mediated_events,
+    state_change as mediated_state_change,
+)
+from raiden.transfer.serialization import (
+    CompactTransactionSerializer,
+    SCHEMAS,
+)
+from raiden.transfer.state import RoutesState
+from raiden.transfer.state_change import Block, ActionRouteChange
+
+
+def test_all_state_changes_and_events_have_a_schema():
+    registered = set(class_ for _, class_, _, _ in SCHEMAS)
+    modules = (events, state_change, mediated_events, mediated_state_change)
+
+    for module in modules:
+        for _, class_ in inspect.getmembers(module, inspect.isclass):
+            is_transfer_class = (
+                class_.__module__ == module.__name__ and
+                issubclass(class_, (Event, StateChange))
+            )
+
+            if is_transfer_class:
+                assert class_ in registered, class_.__name__
+
+    tags = [tag for tag, _, _, _ in SCHEMAS]
+    assert len(tags) == len(set(tags))
+
+
+@pytest.mark.parametrize('schema', SCHEMAS, ids=lambda schema: schema[1].__name__)
+def test_roundtrip_schemas(schema):
+    serializer = CompactTransactionSerializer()
+    _, class_, _, attributes = schema
+
+    sample_values = [
+        factories.ADDR,
+        2 ** 64 - 1,
+        None,
+        factories.make_route(factories.HOP1, 10),
+        [factories.make_transfer(1, factories.HOP1, factories.HOP2, 10)],
+        -1,
+        u'reason',
+        {'key': (True, False)},
+    ]
+
+    instance = class_.__new__(class_)
+    for position, attribute in enumerate(attributes):
+        setattr(instance, attribute, sample_values[position % len(sample_values)])
+
+    data = serializer.serialize(instance)
+    result = serializer.deserialize(data)
+
+    assert type(result) is class_
+    for attribute in attributes:
+        assert getattr(result, attribute) == getattr(instance, attribute)
+    assert serializer.serialize(result) == data
+
+
+def test_compact_serializer():
+    serializer = CompactTransactionSerializer()
+
+    block = Block(1337)
+    assert serializer.deserialize(serializer.serialize(block)) == block
+
+    route = factories.make_route(factories.HOP1, 79)
+    route_change = serializer.deserialize(serializer.serialize(ActionRouteChange(42, route)))
+    assert route_change.identifier == 42
+    assert route_change.route == route
+
+    routes = RoutesState([route])
+    routes.canceled_routes.append(factories.make_route(factories.HOP2, 1))
+    assert serializer.deserialize(serializer.serialize(routes)) == routes
+
+    # the records are smaller than pickle's
+    assert len(serializer.serialize(block)) < len(pickle.dumps(block, -1))
+
+    # values without a schema are embedded as pickle data
+    unknown = set([1, 2])
+    assert serializer.deserialize(serializer.serialize(unknown)) == unknown
+
+    # records written with the pickle serializer are still readable
+    assert serializer.deserialize(pickle.dumps(block, -1)) == block
+
+    with pytest.raises(ValueError):
+        serializer.deserialize('\x01\x0b\xff\xff\x01')
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+import glob
+import os
+from collections import defaultdict
+
+from raiden.channel import (
+    Channel,
+    ChannelEndState,
+    ChannelExternalState,
+)
+from raiden.snapshot import (
+    delta_file_name,
+    load_snapshot,
+    read_snapshot_file,
+    SnapshotWriter,
+)
+from raiden.tests.utils import factories
+from raiden.transfer.architecture import StateManager
+from raiden.transfer.merkle_tree import EMPTY_MERKLE_TREE
+
+TOKEN_ADDRESS = factories.make_address()
+
+
+class NettingChannelMock(object):
+    # pylint: disable=no-self-use
+
+    def __init__(self, address):
+        self.address = address
+
+    def opened(self):
+        return 1
+
+    def closed(self):
+        return 0
+
+
+class ChannelGraphMock(object):
+    def __init__(self, channels):
+        self.address_to_channel = {
+            channel.channel_address: channel
+            for channel in channels
+        }
+
+
+class ProtocolMock(object):
+    def __init__(self):
+        self.channel_queue = dict()
+        self.receivedhashes_to_acks = dict()
+        self.nodeaddresses_to_nonces = dict()
+
+
+class RaidenMock(object):
+    def __init__(self, channels):
+        self.token_to_channelgraph = {
+            TOKEN_ADDRESS: ChannelGraphMock(channels),
+        }
+        self.protocol = ProtocolMock()
+        self.identifier_to_statemanagers = defaultdict(list)
+
+
+def state_transition(current_state, state_change):  # pylint: disable=unused-argument
+    pass
+
+
+def make_channel(channel_address, our_address, partner_address):
+    our_state = ChannelEndState(our_address, 100, None, EMPTY_MERKLE_TREE)
+    partner_state = ChannelEndState(partner_address, 100, None, EMPTY_MERKLE_TREE)
+    external_state = ChannelExternalState(
+        lambda *args: None,
+        NettingChannelMock(channel_address),
+    )
+
+    return Channel(
+        our_state,
+        partner_state,
+        external_state,
+        TOKEN_ADDRESS,
+        reveal_timeout=5,
+        settle_timeout=15,
+    )
+
+
+def assert_snapshot_matches(data, raiden):
+    snapshot_channels = {
+        serialized_channel.channel_address: serialized_channel
+        for serialized_channel in data['channels']
+    }
+    network = raiden.token_to_channelgraph[TOKEN_ADDRESS]
+    assert set(snapshot_channels) == set(network.address_to_channel)
+    for channel_address, channel in network.address_to_channel.iteritems():
+        assert channel.serialize() == snapshot_channels[channel_address]
+
+    assert data['receivedhashes_to_acks'] == raiden.protocol.receivedhashes_to_acks
+    assert data['transfers'] == raiden.identifier_to_statemanagers
+
+
+def test_differential_snapshot(tmpdir):
+    serialization_file = os.path.join(tmpdir.strpath, 'data.pickle')
+    privkey, address = factories.make_privkey_address()
+
+    channels = [
+        make_channel('channel{}'.format(i).ljust(20), address, factories.make_address())
+        for i in range(5)
+    ]
+    raiden = RaidenMock(channels)
+    raiden.identifier_to_statemanagers[1].append(StateManager(state_transition, None))
+    raiden.identifier_to_statemanagers[2].append(StateManager(state_transition, None))
+    raiden.protocol.receivedhashes_to_acks['hash1'] = ('receiver', 'ack1')
+
+    writer = SnapshotWriter(serialization_file, deltas_per_base=2)
+    writer.save(raiden, 10)
+    assert not glob.glob(serialization_file + '.delta.*')
+    assert_snapshot_matches(load_snapshot(serialization_file), raiden)
+
+    # change a single channel, transfer and acknowledgment
+    direct_transfer = channels[0].create_directtransfer(10, identifier=1)
+    direct_transfer.sign(privkey, address)
+    channels[0].register_transfer(1, direct_transfer)
+    raiden.identifier_to_statemanagers[2][0].current_state = factories.make_route(
+        factories.HOP1,
+        10,
+    )
+    raiden.protocol.receivedhashes_to_acks['hash2'] = ('receiver', 'ack2')
+
+    writer.save(raiden, 11)
+    delta = read_snapshot_file(delta_file_name(serialization_file, 2))
+    assert [channel.channel_address for channel in delta['channels']] == [
+        channels[0].channel_address,
+    ]
+    assert delta['transfers'].keys() == [2]
+    assert delta['receivedhashes_to_acks'].keys() == ['hash2']
+
+    data = load_snapshot(serialization_file)
+    assert data['state_change_id'] == 11
+    assert data['sequence'] == 2
+    assert_snapshot_matches(data, raiden)
+
+    # a state without changes is still recorded, with an empty delta
+    writer.save(raiden, 12)
+    delta = read_snapshot_file(delta_file_name(serialization_file, 3))
+    assert not delta['channels']
+    assert not delta['transfers']
+
+    # the deltas are compacted into a new base
+    writer.save(raiden, 13)
+    assert not glob.glob(serialization_file + '.delta.*')
+    data = load_snapshot(serialization_file)
+    assert data['sequence'] == 4
+    assert_snapshot_matches(data, raiden)
+
+
+def test_delta_removes_channels(tmpdir):
+    serialization_file = os.path.join(tmpdir.strpath, 'data.pickle')
+    _, address = factories.make_privkey_address()
+
+    channels = [
+        make_channel('channel{}'.format(i).ljust(20), address, factories.make_address())
+        for i in range(3)
+    ]
+    raiden = RaidenMock(channels)
+    raiden.identifier_to_statemanagers[1].append(StateManager(state_transition, None))
+    raiden.identifier_to_statemanagers[2].append(StateManager(state_transition, None))
+
+    writer = SnapshotWriter(serialization_file, deltas_per_base=2)
+    writer.save(raiden, 1)
+
+    # e.g. a restored channel that does not match the blockchain
+    network = raiden.token_to_channelgraph[TOKEN_ADDRESS]
+    del network.address_to_channel[channels[1].channel_address]
+    del raiden.identifier_to_statemanagers[2]
+
+    writer.save(raiden, 2)
+    delta = read_snapshot_file(delta_file_name(serialization_file, 2))
+    assert delta['removed_channels'] == [channels[1].channel_address]
+    assert delta['removed_transfers'] == [2]
+
+    data = load_snapshot(serialization_file)
+    assert_snapshot_matches(data, raiden)
+
+    # the removals are not repeated by the next delta
+    writer.save(raiden, 3)
+    delta = read_snapshot_file(delta_file_name(serialization_file, 3))
+    assert not delta['removed_channels']
+    assert not delta['removed_transfers']
+    assert_snapshot_matches(load_snapshot(serialization_file), raiden)
+
+
+def test_stale_deltas_are_ignored(tmpdir):
+    serialization_file = os.path.join(tmpdir.strpath, 'data.pickle')
+    raiden = RaidenMock([])
+
+    writer = SnapshotWriter(serialization_file, deltas_per_base=2)
+    writer.save(raiden, 1)
+
+    raiden.protocol.receivedhashes_to_acks['hash1'] = ('receiver', 'ack1')
+    writer.save(raiden, 2)
+
+    # a crash after the base was written and before the deltas were removed
+    stale_delta = delta_file_name(serialization_file, 2)
+    with open(stale_delta, 'rb') as handler:
+        stale_data = handler.read()
+
+    writer.start_from(2)
+    raiden.protocol.receivedhashes_to_acks.clear()
+    writer.save(raiden, 3)
+
+    with open(stale_delta, 'wb') as handler:
+        handler.write(stale_data)
+
+    data = load_snapshot(serialization_file)
+    assert data['sequence'] == 3
+    assert not data['receivedhashes_to_acks']
@@ -2,10 +2,24 @@ import os
 import sqlite3
 import pytest
 
+from raiden.event_handler import StateMachineEventHandler
 from raiden.tests.utils import factories
 from raiden.tests.utils.log import get_all_state_events
-from raiden.transfer.events import EventTransferSentFailed
-from raiden.transfer.log import StateChangeLog, StateChangeLogSQLiteBackend
+from raiden.transfer.architecture import StateManager, TransitionResult
+from raiden.transfer.events import (
+    EventTransferReceivedSuccess,
+    EventTransferSentFailed,
+    EventTransferSentSuccess,
+)
+from raiden.transfer.log import (
+    event_index,
+    StateChangeLog,
+    StateChangeLogArchive,
+    StateChangeLogSQLiteBackend,
+    StateChangeLogStorageBackend,
+    StateChangeLogWALSQLiteBackend,
+)
+from raiden.transfer.mediated_transfer.events import SendBalanceProof
 from raiden.transfer.mediated_transfer.state_change import ContractReceiveWithdraw
 from raiden.transfer.state_change import Block, ActionRouteChange
 from raiden.transfer.state import RouteState
@@ -70,14 +84,325 @@ def test_write_read_log(tmpdir, in_memory_database):
 def test_write_read_events(tmpdir, in_memory_database):
     log = init_database(tmpdir, in_memory_database)
     event = EventTransferSentFailed(1, 'whatever')
+    event_data = (None, 1, 1, log.serializer.serialize(event)) + event_index(event)
     with pytest.raises(sqlite3.IntegrityError):
-        log.storage.write_state_events(1, [(None, 1, 1, log.serializer.serialize(event))])
+        log.storage.write_state_events(1, [event_data])
     assert(len(get_all_state_events(log)) == 0)
 
     log.storage.write_state_change('statechangedata')
-    log.storage.write_state_events(1, [(None, 1, 1, log.serializer.serialize(event))])
+    log.storage.write_state_events(1, [event_data])
     logged_events = get_all_state_events(log)
     assert(len(logged_events) == 1)
     assert(logged_events[0].identifier == 1)
     assert(logged_events[0].state_change_id == 1)
     assert(isinstance(logged_events[0].event_object, EventTransferSentFailed))
+
+
+def test_query_events(tmpdir, in_memory_database):
+    log = init_database(tmpdir, in_memory_database)
+
+    big_identifier = 2 ** 64 - 1
+    sent = EventTransferSentSuccess(big_identifier, 10, factories.HOP1)
+    received = EventTransferReceivedSuccess(2, 10, factories.HOP2)
+    balance_proof = SendBalanceProof(
+        3,
+        factories.ADDR,
+        factories.UNIT_TOKEN_ADDRESS,
+        factories.HOP1,
+        factories.UNIT_SECRET,
+    )
+
+    state_change_id = log.log(Block(1))
+    log.log_events(state_change_id, [sent, received], 1)
+    state_change_id = log.log(Block(2))
+    log.log_events(state_change_id, [balance_proof], 2)
+
+    def query(**filters):
+        return [event.event_object.identifier for event in log.get_events(**filters)]
+
+    assert query() == [big_identifier, 2, 3]
+    assert query(from_block=2) == [3]
+    assert query(to_block=1) == [big_identifier, 2]
+    assert query(event_types=[EventTransferReceivedSuccess, SendBalanceProof]) == [2, 3]
+    assert query(identifier=big_identifier) == [big_identifier]
+    assert query(partner=factories.HOP1) == [big_identifier, 3]
+    assert query(partner=factories.HOP1, to_block=1) == [big_identifier]
+    assert query(token=factories.UNIT_TOKEN_ADDRESS) == [3]
+    assert query(channel_address=factories.ADDR) == [3]
+    assert query(channel_address=factories.HOP1) == []
+
+
+def test_index_events_from_older_version(tmpdir):
+    database_path = os.path.join(tmpdir.strpath, 'database.db')
+    log = StateChangeLog(
+        storage_instance=StateChangeLogSQLiteBackend(database_path=database_path)
+    )
+    state_change_id = log.log(Block(1))
+    log.log_events(state_change_id, [EventTransferSentFailed(1, 'whatever')], 1)
+
+    # older versions did not have the index columns
+    log.storage.conn.execute('UPDATE state_events SET event_type=NULL, transfer_identifier=NULL')
+    log.storage.conn.commit()
+
+    log = StateChangeLog(
+        storage_instance=StateChangeLogSQLiteBackend(database_path=database_path)
+    )
+    logged_events = log.get_events(event_types=[EventTransferSentFailed], identifier=1)
+    assert len(logged_events) == 1
+
+
+def test_group_commit(tmpdir):
+    database_path = os.path.join(tmpdir.strpath, 'database.db')
+    log = StateChangeLog(
+        storage_instance=StateChangeLogSQLiteBackend(
+            database_path=database_path,
+            group_commit_size=3,
+            group_commit_timeout=60,
+        )
+    )
+    reader = sqlite3.connect(database_path)
+
+    def committed_state_changes():
+        return reader.execute('SELECT count(*) FROM state_changes').fetchone()[0]
+
+    state_change_id = log.log(Block(1))
+    log.log_events(state_change_id, [EventTransferSentFailed(1, 'whatever')], 1)
+    commit_result = log.get_commit_result()
+
+    assert not commit_result.ready()
+    assert committed_state_changes() == 0
+
+    # the pending writes are visible to the log's own connection
+    assert isinstance(log.get_state_change_by_id(state_change_id), Block)
+
+    assert log.log(Block(2)) == 2
+    assert commit_result.ready()
+    assert committed_state_changes() == 2
+    assert log.get_commit_result().ready()
+
+
+def test_group_commit_timeout(tmpdir):
+    database_path = os.path.join(tmpdir.strpath, 'database.db')
+    log = StateChangeLog(
+        storage_instance=StateChangeLogSQLiteBackend(
+            database_path=database_path,
+            group_commit_size=100,
+            group_commit_timeout=0.01,
+        )
+    )
+
+    log.log(Block(1))
+    commit_result = log.get_commit_result()
+    assert commit_result.wait(timeout=1) is True
+
+    log.log(Block(2))
+    commit_result = log.get_commit_result()
+    log.flush()
+    assert commit_result.ready()
+
+    with pytest.raises(ValueError):
+        StateChangeLogSQLiteBackend(database_path, group_commit_size=2)
+
+
+def test_wal_backend(tmpdir):
+    database_path = os.path.join(tmpdir.strpath, 'database.db')
+    storage = StateChangeLogWALSQLiteBackend(
+        database_path=database_path,
+        synchronous='normal',
+    )
+    log = StateChangeLog(storage_instance=storage)
+
+    assert storage.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert storage.read_conn is not storage.conn
+
+    event = EventTransferSentFailed(1, 'whatever')
+    state_change_id = log.log(Block(1))
+    log.log_events(state_change_id, [event], 1)
+
+    logged_events = log.get_events_in_block_range(0, 1)
+    assert len(logged_events) == 1
+    assert isinstance(logged_events[0].event_object, EventTransferSentFailed)
+
+    # the events are queried through a read-only connection
+    with pytest.raises(sqlite3.OperationalError):
+        storage.read_conn.execute('DELETE FROM state_events')
+
+    with pytest.raises(ValueError):
+        StateChangeLogWALSQLiteBackend(database_path, synchronous='SOMETIMES')
+
+    # the finalizer of a backend that failed before connecting
+    StateChangeLogWALSQLiteBackend.__new__(StateChangeLogWALSQLiteBackend).__del__()
+
+
+def test_state_changes_after_snapshot(tmpdir):
+    database_path = os.path.join(tmpdir.strpath, 'database.db')
+    log = StateChangeLog(
+        storage_instance=StateChangeLogSQLiteBackend(database_path=database_path)
+    )
+    assert log.last_state_change_id == 0
+
+    for block_number in range(1, 6):
+        state_change_id = log.log(Block(block_number))
+        log.log_events(state_change_id, [EventTransferSentFailed(block_number, 'whatever')], 1)
+
+    assert log.last_state_change_id == 5
+
+    pending_state_changes = log.get_state_changes_after(3)
+    assert [identifier for identifier, _ in pending_state_changes] == [4, 5]
+    assert [state_change.block_number for _, state_change in pending_state_changes] == [4, 5]
+
+    # the compacted state changes are dropped but their events are kept
+    log.compact(3)
+    assert [identifier for identifier, _ in log.get_state_changes_after(0)] == [4, 5]
+    assert len(log.get_events_in_block_range(0, 1)) == 5
+
+    log = StateChangeLog(
+        storage_instance=StateChangeLogSQLiteBackend(database_path=database_path)
+    )
+    assert log.last_state_change_id == 5
+    assert log.log(Block(6)) == 6
+
+
+def test_prune_and_archive(tmpdir):
+    database_path = os.path.join(tmpdir.strpath, 'database.db')
+    archive = StateChangeLogArchive(os.path.join(tmpdir.strpath, 'archive'))
+    log = StateChangeLog(
+        storage_instance=StateChangeLogSQLiteBackend(database_path=database_path),
+        archive_instance=archive,
+    )
+
+    for block_number in range(1, 6):
+        state_change_id = log.log(Block(block_number))
+        log.log_events(
+            state_change_id,
+            [EventTransferSentFailed(block_number, 'whatever')],
+            block_number,
+        )
+    log.compact(4)
+
+    # the transfer 2 is not finalized and its events are kept
+    assert log.prune(4, 4, live_identifiers={2}) == 2
+    assert [event.event_object.identifier for event in get_all_state_events(log)] == [2, 4, 5]
+    assert [identifier for identifier, _ in log.get_state_changes_after(0)] == [5]
+    assert len(os.listdir(archive.archive_dir)) == 1
+
+    # the archived events are still queryable
+    def query(**filters):
+        return [event.event_object.identifier for event in log.get_events(**filters)]
+
+    assert query() == [1, 2, 3, 4, 5]
+    assert query(to_block=3) == [1, 2, 3]
+    assert query(from_block=3) == [3, 4, 5]
+    assert query(identifier=3) == [3]
+    assert query(event_types=[EventTransferSentSuccess]) == []
+
+    # the segment is decoded once and sliced by block number
+    segment_name, = os.listdir(archive.archive_dir)
+    os.remove(os.path.join(archive.archive_dir, segment_name))
+    assert query(from_block=2, to_block=3) == [2, 3]
+    assert [row[2] for row in archive.read_block_range(segment_name, None, None)] == [1, 3]
+    assert [row[2] for row in archive.read_block_range(segment_name, 2, 3)] == [3]
+    assert archive.read_block_range(segment_name, 4, None) == []
+
+    # without an archive the events are discarded
+    log.archive = None
+    assert log.prune(5, 4, live_identifiers=set()) == 2
+    assert query() == [5]
+
+    # the identifiers are not reused after the latest state changes are pruned
+    log.compact(5)
+    log.prune(6, 5, live_identifiers=set())
+    log = StateChangeLog(
+        storage_instance=StateChangeLogSQLiteBackend(database_path=database_path)
+    )
+    assert log.log(Block(6)) == 6
+
+
+def test_state_change_and_events_single_commit(tmpdir):
+    database_path = os.path.join(tmpdir.strpath, 'database.db')
+    storage = StateChangeLogSQLiteBackend(database_path=database_path)
+    log = StateChangeLog(storage_instance=storage)
+    reader = sqlite3.connect(database_path)
+
+    def committed(table):
+        return reader.execute('SELECT count(*) FROM {}'.format(table)).fetchone()[0]
+
+    state_change_id = log.log(Block(1), events_pending=True)
+    assert committed('state_changes') == 0
+
+    events = [EventTransferSentFailed(identifier, 'whatever') for identifier in range(3)]
+    log.log_events(state_change_id, events, 1)
+    assert committed('state_changes') == 1
+    assert committed('state_events') == 3
+
+    # the identifiers of the pruned events are not reused
+    log.compact(state_change_id)
+    log.prune(2, state_change_id, live_identifiers=set())
+    assert committed('state_events') == 0
+
+    log = StateChangeLog(
+        storage_instance=StateChangeLogSQLiteBackend(database_path=database_path)
+    )
+    state_change_id = log.log(Block(2), events_pending=True)
+    log.log_events(state_change_id, [EventTransferSentFailed(4, 'whatever')], 2)
+    assert [event.identifier for event in get_all_state_events(log)] == [4]
+
+
+def test_events_are_executed_after_logging(tmpdir):
+    database_path = os.path.join(tmpdir.strpath, 'database.db')
+    reader = sqlite3.connect(database_path)
+
+    def committed(table):
+        return reader.execute('SELECT count(*) FROM {}'.format(table)).fetchone()[0]
+
+    def state_transition(current_state, state_change):
+        events = [EventTransferSentFailed(state_change.block_number, 'whatever')]
+        return TransitionResult(current_state, events)
+
+    class RaidenMock(object):
+        transaction_log = StateChangeLog(
+            storage_instance=StateChangeLogSQLiteBackend(database_path=database_path)
+        )
+
+        def get_block_number(self):  # pylint: disable=no-self-use
+            return 1
+
+    executed = list()
+
+    class EventHandler(StateMachineEventHandler):
+        def on_event(self, event):
+            executed.append((committed('state_changes'), committed('state_events')))
+
+    managers = [StateManager(state_transition, None) for _ in range(2)]
+    EventHandler(RaidenMock()).log_and_dispatch_to_managers(managers, Block(1))
+
+    assert executed == [(1, 2), (1, 2)]
+
+
+def test_acks(tmpdir, in_memory_database):
+    log = init_database(tmpdir, in_memory_database)
+
+    log.write_acks([
+        ('hash1', 10.0, factories.ADDR, 'ack1'),
+        ('hash2', 20.0, factories.HOP1, 'ack2'),
+    ])
+
+    assert log.get_ack('hash1') == (factories.ADDR, 'ack1')
+    assert log.get_ack('hash2') == (factories.HOP1, 'ack2')
+    assert log.get_ack('hash3') is None
+    assert sorted(log.get_ack_hashes()) == ['hash1', 'hash2']
+
+    log.prune_acks(15.0)
+    assert log.get_ack('hash1') is None
+    assert log.get_ack('hash2') == (factories.HOP1, 'ack2')
+    assert log.get_ack_hashes() == ['hash2']
+
+
+def test_storage_backend_interface():
+    class IncompleteBackend(StateChangeLogStorageBackend):
+        def write_state_change(self, data, events_pending=False):
+            pass
+
+    # the backends must implement every method used by StateChangeLog
+    with pytest.raises(TypeError):
+        IncompleteBackend()
@@ -893,3 +893,36 @@ def test_transfer_from_outdated(raiden_network, settle_timeout):
         app1.raiden.address,
         app1,
     )
+
+
+@pytest.mark.parametrize('blockchain_type', ['tester'])
+@pytest.mark.parametrize('number_of_nodes', [1])
+@pytest.mark.parametrize('channels_per_node', [0])
+def test_receive_retransmission_is_decoded_once(raiden_network):
+    app0 = raiden_network[0]  # pylint: disable=unbalanced-tuple-unpacking
+    graph0 = app0.raiden.token_to_channelgraph.values()[0]
+    protocol = app0.raiden.protocol
+
+    other_key, other_address = make_privkey_address()
+    direct_transfer_message = DirectTransfer(
+        identifier=1,
+        nonce=1,
+        token=graph0.token_address,
+        channel=other_address,
+        transferred_amount=10,
+        recipient=app0.raiden.address,
+        locksroot=UNIT_HASHLOCK,
+    )
+    direct_transfer_message.sign(other_key, other_address)
+    message_data = direct_transfer_message.encode()
+    echohash = sha3(message_data + app0.raiden.address)
+
+    # the transfer is for an unknown channel, it is not acknowledged but the
+    # decoded message is kept for the retransmissions
+    protocol.receive(message_data)
+    decoded = protocol.receivedhashes_to_messages[echohash]
+    assert decoded == direct_transfer_message
+    assert decoded.sender == other_address
+
+    protocol.receive(message_data)
+    assert protocol.receivedhashes_to_messages[echohash] is decoded
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import gevent
+from gevent.event import Event
+
+from raiden.messages import Ping
+from raiden.network.verification import (
+    decode_batch,
+    split_batch,
+    VerificationPool,
+)
+from raiden.tests.utils.factories import make_privkey_address
+from raiden.tests.utils.messages import make_direct_transfer
+from raiden.utils import sha3
+
+
+def make_ping(nonce, privkey, address):
+    ping = Ping(nonce=nonce)
+    ping.sign(privkey, address)
+    return ping.encode()
+
+
+def make_invalid_transfer(privkey, address):
+    """ A signed message that fails the validation done by `decode`. """
+    direct_transfer = make_direct_transfer()
+    direct_transfer.nonce = 0
+    direct_transfer.sign(privkey, address)
+    return direct_transfer.encode()
+
+
+def test_split_batch():
+    packets = range(10)
+
+    chunks = split_batch(packets, 3)
+    assert [len(chunk) for chunk in chunks] == [4, 3, 3]
+    assert sum(chunks, []) == packets
+
+    # the empty chunks are not returned
+    assert split_batch(packets[:2], 3) == [[0], [1]]
+    assert split_batch([], 3) == []
+
+
+def test_decode_batch_failing_packet():
+    privkey, address = make_privkey_address()
+    packets = [
+        (make_ping(1, privkey, address), None),
+        (make_invalid_transfer(privkey, address), None),
+        (make_ping(2, privkey, address), None),
+    ]
+
+    first, invalid, last = decode_batch(packets)
+
+    assert first.nonce == 1
+    assert invalid is None
+    assert last.nonce == 2
+
+
+def test_verification_pool_keeps_order():
+    senders = [make_privkey_address() for _ in range(2)]
+
+    packets = list()
+    for nonce in range(1, 11):
+        for privkey, address in senders:
+            packets.append(make_ping(nonce, privkey, address))
+    packets.insert(5, make_invalid_transfer(*senders[0]))
+
+    received = list()
+    event_done = Event()
+
+    def callback(data, echohash, message):
+        received.append((data, message))
+
+        if len(received) == len(packets):
+            event_done.set()
+
+    pool = VerificationPool(3, callback)
+    pool.start()
+
+    try:
+        for data in packets:
+            pool.put(data, sha3(data))
+
+        with gevent.Timeout(10):
+            event_done.wait()
+
+        assert [data for data, _ in received] == packets
+        assert received[5][1] is None
+
+        for _, address in senders:
+            nonces = [
+                message.nonce
+                for _, message in received
+                if message is not None and message.sender == address
+            ]
+            assert nonces == range(1, 11)
+
+    finally:
+        pool.stop()
+
+
+def test_verification_pool_bounded():
+    privkey, address = make_privkey_address()
+    pool = VerificationPool(1, lambda data, echohash, message: None, max_pending=2)
+
+    for nonce in range(1, 4):
+        data = make_ping(nonce, privkey, address)
+        pool.put(data, sha3(data))
+
+    assert len(pool.pending) == 2
+    assert pool.dropped == 1
+
+    pool.stop()
@@ -12,10 +12,12 @@ def get_db_state_changes(storage, table):
 
 
 def get_all_state_changes(log):
-    """ Returns a list of tuples of identifiers and state changes"""
+    """ Returns a list of tuples of identifiers and state changes, the
+    compacted state changes are skipped"""
     return [
         (res[0], log.serializer.deserialize(res[1]))
         for res in get_db_state_changes(log.storage, 'state_changes')
+        if res[1] is not None
     ]
 
 
@@ -7,6 +7,15 @@ from ethereum import slogging
 
 from raiden.app import App
 from raiden.network.transport import DummyPolicy
+from raiden.settings import (
+    DEFAULT_PROTOCOL_ACK_CACHE_SIZE,
+    DEFAULT_PROTOCOL_ACK_CACHE_TTL,
+    DEFAULT_PROTOCOL_ACK_DELAY,
+    DEFAULT_PROTOCOL_BATCH_MESSAGES,
+    DEFAULT_PROTOCOL_SCHEDULER_WORKERS,
+    DEFAULT_PROTOCOL_SEND_WINDOW,
+    DEFAULT_PROTOCOL_VERIFY_WORKERS,
+)
 from raiden.utils import privatekey_to_address
 
 log = slogging.getLogger(__name__)  # pylint: disable=invalid-name
@@ -285,6 +294,13 @@ def create_apps(
                 'nat_invitation_timeout': nat_invitation_timeout,
                 'nat_keepalive_retries': nat_keepalive_retries,
                 'nat_keepalive_timeout': nat_keepalive_timeout,
+                'verify_workers': DEFAULT_PROTOCOL_VERIFY_WORKERS,
+                'ack_cache_size': DEFAULT_PROTOCOL_ACK_CACHE_SIZE,
+                'ack_cache_ttl': DEFAULT_PROTOCOL_ACK_CACHE_TTL,
+                'send_window': DEFAULT_PROTOCOL_SEND_WINDOW,
+                'ack_delay': DEFAULT_PROTOCOL_ACK_DELAY,
+                'batch_messages': DEFAULT_PROTOCOL_BATCH_MESSAGES,
+                'scheduler_workers': DEFAULT_PROTOCOL_SCHEDULER_WORKERS,
             },
             'rpc': True,
             'console': False,
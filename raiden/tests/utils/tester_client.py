@@ -140,6 +140,9 @@ class ChannelExternalStateTester(object):
         self.callbacks_on_settled = list()
         self.hashlocks_channels = defaultdict(list)
 
+        # the transfers are not logged
+        self.log_transfer = None
+
     def get_block_number(self):
         return self.tester_state.block.number
 
@@ -308,6 +308,8 @@ def increase_transferred_amount(from_channel, to_channel, amount):
     # signed
     from_channel.our_state.register_direct_transfer(direct_transfer_message)
     to_channel.partner_state.register_direct_transfer(direct_transfer_message)
+    from_channel.changed()
+    to_channel.changed()
 
 
 def make_direct_transfer_from_channel(block_number, from_channel, partner_channel, amount, pkey):
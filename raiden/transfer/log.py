@@ -1,15 +1,93 @@
 # -*- coding: utf-8 -*-
+import os
 import pickle
 import sqlite3
+import sys
 import threading
+import zlib
 from abc import ABCMeta, abstractmethod
+from bisect import bisect_left, bisect_right
 from collections import namedtuple
 
+import cachetools
+import gevent
+from gevent.event import AsyncResult
+
 InternalEvent = namedtuple(
     'InternalEvent',
     ('identifier', 'state_change_id', 'block_number', 'event_object'),
 )
 
+# Denormalized event data stored next to the serialized event, allows the
+# events to be filtered without deserializing them.
+EventIndex = namedtuple(
+    'EventIndex',
+    ('event_type', 'token', 'channel_address', 'transfer_identifier', 'partner'),
+)
+
+# The first of these attributes that an event has is the partner node of the
+# event
+EVENT_PARTNER_ATTRIBUTES = ('receiver', 'target', 'initiator')
+
+# SQLite integers are signed 64bits, transfer identifiers are unsigned 64bits
+INT64_OFFSET = 2 ** 64
+INT64_MAX = 2 ** 63 - 1
+
+
+def sqlite_int64(value):
+    """ Map an unsigned 64bits integer to a signed one. """
+    if value is None or value <= INT64_MAX:
+        return value
+    return value - INT64_OFFSET
+
+
+def event_row_matches(  # pylint: disable=too-many-arguments
+        row,
+        from_block=None,
+        to_block=None,
+        event_types=None,
+        token=None,
+        channel_address=None,
+        transfer_identifier=None,
+        partner=None):
+    """ Python version of the filters of `query_events` for the archived
+    rows, which have the same columns as the state_events table.
+    """
+    _, _, block_number, _, event_type, row_token, row_channel, row_identifier, row_partner = row
+
+    filters = (
+        (row_token, token),
+        (row_channel, channel_address),
+        (row_identifier, sqlite_int64(transfer_identifier)),
+        (row_partner, partner),
+    )
+
+    return (
+        block_number >= (from_block or 0) and
+        (to_block is None or block_number <= to_block) and
+        (event_types is None or event_type in event_types) and
+        all(value is None or value == column for column, value in filters)
+    )
+
+
+def event_index(event):
+    """ Return the EventIndex of `event`, attributes that the event does not
+    have are None.
+    """
+    partner = None
+    for attribute in EVENT_PARTNER_ATTRIBUTES:
+        partner = getattr(event, attribute, None)
+        if partner is not None:
+            break
+
+    return EventIndex(
+        type(event).__name__,
+        getattr(event, 'token', None),
+        getattr(event, 'channel_address', None),
+        sqlite_int64(getattr(event, 'identifier', None)),
+        partner,
+    )
+
 
 # TODO:
 # - snapshots should be used to reduce the log file size
@@ -57,7 +135,7 @@ class StateChangeLogStorageBackend(object):
     __metaclass__ = ABCMeta
 
     @abstractmethod
-    def write_state_change(self, data):
+    def write_state_change(self, data, events_pending=False):
         pass
 
     @abstractmethod
@@ -68,13 +146,218 @@ class StateChangeLogStorageBackend(object):
     def read(self):
         pass
 
+    @abstractmethod
+    def flush(self):
+        pass
+
+    @abstractmethod
+    def get_commit_result(self):
+        pass
+
+    @abstractmethod
+    def write_state_events(self, statechange_id, events_data):
+        pass
+
+    @abstractmethod
+    def get_unindexed_events(self):
+        pass
+
+    @abstractmethod
+    def write_events_index(self, events_index):
+        pass
+
+    @abstractmethod
+    def get_state_change_by_id(self, identifier):
+        pass
+
+    @abstractmethod
+    def get_last_state_change_id(self):
+        pass
+
+    @abstractmethod
+    def get_state_changes_after(self, identifier):
+        pass
+
+    @abstractmethod
+    def compact_state_changes(self, identifier):
+        pass
+
+    @abstractmethod
+    def get_prunable_events(self, before_block, state_change_id):
+        pass
+
+    @abstractmethod
+    def prune(self, event_identifiers, state_change_id, segment=None):
+        pass
+
+    @abstractmethod
+    def get_archive_segments(self, from_block, to_block):
+        pass
+
+    @abstractmethod
+    def get_events_in_range(self, from_block, to_block):
+        pass
+
+    @abstractmethod
+    def query_events(  # pylint: disable=too-many-arguments
+            self,
+            from_block=None,
+            to_block=None,
+            event_types=None,
+            token=None,
+            channel_address=None,
+            transfer_identifier=None,
+            partner=None):
+        pass
+
+    @abstractmethod
+    def write_acks(self, acks):
+        """ Store the acknowledgments evicted from the protocol's memory,
+        `acks` is a list of tuples of the form:
+        (echohash, last_use, receiver_address, messagedata)
+        """
+        pass
+
+    @abstractmethod
+    def get_ack(self, echohash):
+        """ Return the (receiver_address, messagedata) stored for `echohash`,
+        None if it is unknown.
+        """
+        pass
+
+    @abstractmethod
+    def get_ack_hashes(self):
+        """ Return the echohashes of the stored acknowledgments. """
+        pass
+
+    @abstractmethod
+    def prune_acks(self, before_timestamp):
+        """ Delete the acknowledgments last used before `before_timestamp`. """
+        pass
+
+
+class GroupCommitMixin(object):
+    """ Commits the writes of a storage backend either one by one or in
+    groups.
+
+    With group commit enabled (`group_commit_size` larger than one) the
+    writes are pending until `group_commit_size` writes accumulated or
+    `group_commit_timeout` seconds elapsed since the first pending write,
+    whichever comes first.
+
+    Subclasses call `_write_done` after every write, with the `write_lock`
+    held, and implement `_sync` to make the pending writes durable.
+    """
+
+    def init_group_commit(self, group_commit_size, group_commit_timeout):
+        if group_commit_size < 1:
+            raise ValueError('group_commit_size must be a positive integer')
+
+        if group_commit_size > 1 and group_commit_timeout is None:
+            # without the timeout a partial group would never be committed
+            raise ValueError('group_commit_timeout is required for group commits')
+
+        self.group_commit_size = group_commit_size
+        self.group_commit_timeout = group_commit_timeout
+        self.uncommitted_writes = 0
+        self.commit_result = None
+        self.commit_timer = None
+
+    def flush(self):
+        """ Commit all pending writes. """
+        with self.write_lock:
+            if self.uncommitted_writes:
+                self._commit()
+
+    def get_commit_result(self):
+        """ Return an AsyncResult that is set once all the writes done so far
+        are committed.
+        """
+        if self.uncommitted_writes == 0:
+            result = AsyncResult()
+            result.set(True)
+            return result
+
+        if self.commit_result is None:
+            self.commit_result = AsyncResult()
+
+        return self.commit_result
+
+    def _write_done(self):
+        """ Commit the current transaction if the group is full, otherwise
+        make sure it will be committed once the group times out.
+
+        Must be called with the write_lock held.
+        """
+        self.uncommitted_writes += 1
 
-class StateChangeLogSQLiteBackend(StateChangeLogStorageBackend):
+        if self.uncommitted_writes >= self.group_commit_size:
+            self._commit()
 
-    def __init__(self, database_path):
-        self.conn = sqlite3.connect(database_path)
-        self.conn.text_factory = str
-        self.conn.execute("PRAGMA foreign_keys=ON")
+        elif self.commit_timer is None:
+            self.commit_timer = gevent.spawn_later(
+                self.group_commit_timeout,
+                self.flush,
+            )
+
+    def _commit(self):
+        """ Must be called with the write_lock held. """
+        commit_result, self.commit_result = self.commit_result, None
+        commit_timer, self.commit_timer = self.commit_timer, None
+
+        # flush() is called by the timer, which must not kill itself
+        if commit_timer is not None and commit_timer is not gevent.getcurrent():
+            commit_timer.kill(block=False)
+
+        try:
+            self._sync()
+        except Exception as e:
+            if commit_result is not None:
+                commit_result.set_exception(e)
+            raise
+        finally:
+            self.uncommitted_writes = 0
+
+        if commit_result is not None:
+            commit_result.set(True)
+
+
+class StateChangeLogSQLiteBackend(GroupCommitMixin, StateChangeLogStorageBackend):
+    """ SQLite storage for the transaction log.
+
+    By default every write is committed on its own. With group commit enabled
+    (`group_commit_size` larger than one) the writes are done inside an open
+    transaction which is committed once `group_commit_size` writes are
+    pending or `group_commit_timeout` seconds elapsed since the first pending
+    write, whichever comes first, trading the latency of a single write for
+    one fsync per group of writes.
+
+    Callers that must not proceed before their writes are durable should wait
+    on the AsyncResult returned by `get_commit_result`.
+    """
+
+    STATE_EVENTS_INDEX_COLUMNS = (
+        ('event_type', 'text'),
+        ('token', 'binary'),
+        ('channel_address', 'binary'),
+        ('transfer_identifier', 'integer'),
+        ('partner', 'binary'),
+    )
+
+    STATE_EVENTS_INDEXES = (
+        ('state_events_block_number', 'block_number'),
+        ('state_events_event_type', 'event_type, block_number'),
+        ('state_events_token', 'token, block_number'),
+        ('state_events_channel_address', 'channel_address, block_number'),
+        ('state_events_transfer_identifier', 'transfer_identifier'),
+        ('state_events_partner', 'partner, block_number'),
+        ('state_events_source_statechange_id', 'source_statechange_id'),
+    )
+
+    def __init__(self, database_path, group_commit_size=1, group_commit_timeout=None):
+        self.init_group_commit(group_commit_size, group_commit_timeout)
+
+        self.conn = self.connect(database_path)
         cursor = self.conn.cursor()
         cursor.execute(
             'CREATE TABLE IF NOT EXISTS state_changes ('
@@ -91,11 +374,42 @@ class StateChangeLogSQLiteBackend(StateChangeLogStorageBackend):
             'CREATE TABLE IF NOT EXISTS state_events ('
             'identifier integer primary key, source_statechange_id integer NOT NULL, '
             'block_number integer NOT NULL, data binary, '
+            'event_type text, token binary, channel_address binary, '
+            'transfer_identifier integer, partner binary, '
             'FOREIGN KEY(source_statechange_id) REFERENCES state_changes(id)'
             ')'
         )
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS sequences ('
+            'name text primary key, value integer NOT NULL'
+            ')'
+        )
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS archive_segments ('
+            'identifier integer primary key, path text NOT NULL, '
+            'from_block integer NOT NULL, to_block integer NOT NULL'
+            ')'
+        )
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS acks ('
+            'echohash blob primary key, last_use real NOT NULL, '
+            'receiver_address blob NOT NULL, data blob NOT NULL'
+            ')'
+        )
+        cursor.execute('CREATE INDEX IF NOT EXISTS acks_last_use ON acks(last_use)')
+        self.migrate_state_events()
+        for name, columns in self.STATE_EVENTS_INDEXES:
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS {} ON state_events({})'.format(name, columns)
+            )
         self.conn.commit()
         self.sanity_check()
+
+        # The events identifiers are assigned by the log instead of sqlite, so
+        # the identifiers of pruned events are never reused. The sequence is
+        # persisted in the same transaction as the events, it is consistent
+        # with the state_events table after a crash.
+        self.last_event_identifier = self.get_last_event_identifier()
         # When writting to a table where the primary key is the identifier and we want
         # to return said identifier we use cursor.lastrowid, which uses sqlite's last_insert_rowid
         # https://github.com/python/cpython/blob/2.7/Modules/_sqlite/cursor.c#L727-L732
@@ -110,6 +424,32 @@ class StateChangeLogSQLiteBackend(StateChangeLogStorageBackend):
         # condition.
         self.write_lock = threading.Lock()
 
+        # Queries that may be slow and don't need to read the pending writes
+        # use this connection
+        self.read_conn = self.conn
+
+    def connect(self, database_path):  # pylint: disable=no-self-use
+        conn = sqlite3.connect(database_path)
+        conn.text_factory = str
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def migrate_state_events(self):
+        """ Add the index columns to a state_events table created by an older
+        version, the columns of the existing rows are NULL and are filled by
+        the StateChangeLog.
+        """
+        existing_columns = set(
+            row[1]
+            for row in self.conn.execute('PRAGMA table_info(state_events)')
+        )
+
+        for column, column_type in self.STATE_EVENTS_INDEX_COLUMNS:
+            if column not in existing_columns:
+                self.conn.execute(
+                    'ALTER TABLE state_events ADD COLUMN {} {}'.format(column, column_type)
+                )
+
     def sanity_check(self):
         """ Ensures that NUL character can be safely inserted and recovered
         from the database.
@@ -132,7 +472,14 @@ class StateChangeLogSQLiteBackend(StateChangeLogStorageBackend):
 
         self.conn.rollback()
 
-    def write_state_change(self, data):
+    def write_state_change(self, data, events_pending=False):
+        """ Write a state change and return its identifier.
+
+        Args:
+            data (bin): The serialized state change.
+            events_pending (bool): If True the state change is committed
+                together with its events by the next `write_state_events`.
+        """
         with self.write_lock:
             cursor = self.conn.cursor()
             cursor.execute(
@@ -140,7 +487,9 @@ class StateChangeLogSQLiteBackend(StateChangeLogStorageBackend):
                 (data,)
             )
             last_id = cursor.lastrowid
-            self.conn.commit()
+
+            if not events_pending:
+                self._write_done()
 
         return last_id
 
@@ -157,21 +506,71 @@ class StateChangeLogSQLiteBackend(StateChangeLogStorageBackend):
                 (1, statechange_id, data)
             )
             last_id = cursor.lastrowid
-            self.conn.commit()
+            self._commit()
 
         return last_id
 
     def write_state_events(self, statechange_id, events_data):
         """Do an 'execute_many' write of state events. `events_data` should be a
         list of tuples of the form:
-        (None, source_statechange_id, block_number, serialized_event_data)
+        (None, source_statechange_id, block_number, serialized_event_data,
+        event_type, token, channel_address, transfer_identifier, partner)
+
+        The events are given monotonically increasing identifiers, the
+        first column is ignored.
+        """
+        with self.write_lock:
+            first_identifier = self.last_event_identifier + 1
+            events_rows = [
+                (identifier, ) + tuple(event_data[1:])
+                for identifier, event_data in enumerate(events_data, first_identifier)
+            ]
+
+            cursor = self.conn.cursor()
+            if events_rows:
+                cursor.executemany(
+                    'INSERT INTO state_events('
+                    'identifier, source_statechange_id, block_number, data, '
+                    'event_type, token, channel_address, transfer_identifier, partner'
+                    ') VALUES(?,?,?,?,?,?,?,?,?)',
+                    events_rows
+                )
+
+                last_identifier = first_identifier + len(events_rows) - 1
+                cursor.execute(
+                    "INSERT OR REPLACE INTO sequences(name, value) VALUES('state_events', ?)",
+                    (last_identifier, ),
+                )
+                self.last_event_identifier = last_identifier
+
+            self._write_done()
+
+    def get_unindexed_events(self):
+        """ Return a list of (identifier, data) of the events written before the
+        index columns existed.
         """
         cursor = self.conn.cursor()
-        cursor.executemany(
-            'INSERT INTO state_events('
-            'identifier, source_statechange_id, block_number, data) VALUES(?,?,?,?)',
-            events_data
+        result = cursor.execute(
+            'SELECT identifier, data FROM state_events WHERE event_type IS NULL'
         )
+        return result.fetchall()
+
+    def write_events_index(self, events_index):
+        """ Set the index columns of existing events. `events_index` should be
+        a list of tuples of the form:
+        (event_type, token, channel_address, transfer_identifier, partner, identifier)
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                'UPDATE state_events SET '
+                'event_type=?, token=?, channel_address=?, transfer_identifier=?, partner=? '
+                'WHERE identifier=?',
+                events_index
+            )
+            self._commit()
+
+    def _sync(self):
         self.conn.commit()
 
     def get_state_snapshot(self):
@@ -195,28 +594,348 @@ class StateChangeLogSQLiteBackend(StateChangeLogStorageBackend):
             result = result[0][0]
         return result
 
-    def get_events_in_range(self, from_block, to_block):
+    def get_last_state_change_id(self):
+        # The AUTOINCREMENT sequence is used instead of MAX(id) because the
+        # latest state changes may have been pruned
         cursor = self.conn.cursor()
-        if from_block is None:
-            from_block = 0
-        if to_block is None:
-            result = cursor.execute(
-                'SELECT * from  state_events WHERE block_number >= ?',
-                (from_block,)
+        result = cursor.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'state_changes'"
+        ).fetchone()
+        return result[0] if result else 0
+
+    def get_last_event_identifier(self):
+        cursor = self.conn.cursor()
+        sequence = cursor.execute(
+            "SELECT value FROM sequences WHERE name = 'state_events'"
+        ).fetchone()
+        # databases written by older versions don't have the sequence
+        last_event = cursor.execute(
+            'SELECT MAX(identifier) FROM state_events'
+        ).fetchone()
+
+        return max(
+            sequence[0] if sequence else 0,
+            last_event[0] or 0,
+        )
+
+    def get_state_changes_after(self, identifier):
+        """ Return the (id, data) of the state changes logged after
+        `identifier` that were not compacted, sorted by id.
+        """
+        cursor = self.conn.cursor()
+        result = cursor.execute(
+            'SELECT id, data FROM state_changes WHERE id > ? AND data IS NOT NULL ORDER BY id',
+            (identifier,),
+        )
+        return result.fetchall()
+
+    def compact_state_changes(self, identifier):
+        """ Drop the data of the state changes up to and including
+        `identifier`.
+
+        The rows are kept because the events reference their state change.
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'UPDATE state_changes SET data=NULL WHERE id <= ? AND data IS NOT NULL',
+                (identifier,),
             )
-        else:
-            result = cursor.execute(
-                'SELECT * from  state_events WHERE block_number '
-                'BETWEEN ? AND ?', (from_block, to_block)
+            self._commit()
+
+    def get_prunable_events(self, before_block, state_change_id):
+        """ Return the rows, with all the columns, of the events older than
+        `before_block` which were generated by a state change up to
+        `state_change_id`.
+        """
+        cursor = self.conn.cursor()
+        result = cursor.execute(
+            'SELECT identifier, source_statechange_id, block_number, data, '
+            'event_type, token, channel_address, transfer_identifier, partner '
+            'FROM state_events WHERE block_number < ? AND source_statechange_id <= ? '
+            'ORDER BY identifier',
+            (before_block, state_change_id),
+        )
+        return result.fetchall()
+
+    def prune(self, event_identifiers, state_change_id, segment=None):
+        """ Delete the events in `event_identifiers` and the state changes up
+        to `state_change_id` which are not referenced anymore.
+
+        Args:
+            event_identifiers (list): The identifiers of the events to delete.
+            state_change_id (int): The last state change that can be deleted.
+            segment (tuple): (path, from_block, to_block) of the archive
+                segment with the deleted events, registered in the same
+                transaction.
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+
+            if segment is not None:
+                cursor.execute(
+                    'INSERT INTO archive_segments(identifier, path, from_block, to_block) '
+                    'VALUES(null,?,?,?)',
+                    segment,
+                )
+
+            cursor.executemany(
+                'DELETE FROM state_events WHERE identifier = ?',
+                ((identifier, ) for identifier in event_identifiers),
             )
-        result = result.fetchall()
-        return result
+            cursor.execute(
+                'DELETE FROM state_changes WHERE id <= ? '
+                'AND NOT EXISTS ('
+                '    SELECT 1 FROM state_events WHERE source_statechange_id = state_changes.id'
+                ') '
+                'AND id NOT IN (SELECT statechange_id FROM state_snapshot)',
+                (state_change_id, ),
+            )
+            self._commit()
+
+    def write_acks(self, acks):
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                'INSERT OR REPLACE INTO acks(echohash, last_use, receiver_address, data) '
+                'VALUES(?,?,?,?)',
+                acks,
+            )
+            self._write_done()
+
+    def get_ack(self, echohash):
+        # the acks are looked up right after being spilled, the pending
+        # writes must be visible
+        cursor = self.conn.cursor()
+        result = cursor.execute(
+            'SELECT receiver_address, data FROM acks WHERE echohash = ?',
+            (echohash, ),
+        ).fetchone()
+        return tuple(result) if result else None
+
+    def get_ack_hashes(self):
+        cursor = self.conn.cursor()
+        result = cursor.execute('SELECT echohash FROM acks')
+        return [row[0] for row in result]
+
+    def prune_acks(self, before_timestamp):
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'DELETE FROM acks WHERE last_use < ?',
+                (before_timestamp, ),
+            )
+            self._commit()
+
+    def get_archive_segments(self, from_block, to_block):
+        """ Return the paths of the archive segments with events in the
+        inclusive block range, `to_block` None is the latest block.
+        """
+        conditions = ['to_block >= ?']
+        arguments = [from_block or 0]
+
+        if to_block is not None:
+            conditions.append('from_block <= ?')
+            arguments.append(to_block)
+
+        cursor = self.read_conn.cursor()
+        result = cursor.execute(
+            'SELECT path FROM archive_segments WHERE {} ORDER BY identifier'.format(
+                ' AND '.join(conditions)
+            ),
+            arguments,
+        )
+        return [row[0] for row in result]
+
+    def get_events_in_range(self, from_block, to_block):
+        return self.query_events(from_block, to_block)
+
+    def query_events(  # pylint: disable=too-many-arguments
+            self,
+            from_block=None,
+            to_block=None,
+            event_types=None,
+            token=None,
+            channel_address=None,
+            transfer_identifier=None,
+            partner=None):
+        """ Return the events that match all of the given filters as a list of
+        tuples of the form:
+        (identifier, source_statechange_id, block_number, serialized_event_data)
+
+        The block range is inclusive, filters that are None are not applied.
+        """
+        conditions = ['block_number >= ?']
+        arguments = [from_block or 0]
+
+        if to_block is not None:
+            conditions.append('block_number <= ?')
+            arguments.append(to_block)
+
+        if event_types is not None:
+            conditions.append('event_type IN ({})'.format(
+                ','.join('?' * len(event_types))
+            ))
+            arguments.extend(event_types)
+
+        filters = (
+            ('token', token),
+            ('channel_address', channel_address),
+            ('transfer_identifier', sqlite_int64(transfer_identifier)),
+            ('partner', partner),
+        )
+        for column, value in filters:
+            if value is not None:
+                conditions.append('{} = ?'.format(column))
+                arguments.append(value)
+
+        cursor = self.read_conn.cursor()
+        result = cursor.execute(
+            'SELECT identifier, source_statechange_id, block_number, data '
+            'FROM state_events WHERE {} ORDER BY identifier'.format(' AND '.join(conditions)),
+            arguments,
+        )
+        return result.fetchall()
 
     def read(self):
         pass
 
     def __del__(self):
-        self.conn.close()
+        # __init__ may have failed before connecting
+        conn = getattr(self, 'conn', None)
+        if conn is not None:
+            conn.close()
+
+
+class StateChangeLogWALSQLiteBackend(StateChangeLogSQLiteBackend):
+    """ SQLite storage for the transaction log tuned for concurrent access.
+
+    - The database uses a write-ahead log, so readers don't block the writer
+      and the writer doesn't block readers.
+    - `synchronous` sets how often SQLite waits for the data to hit the disk,
+      with the write-ahead log NORMAL is safe from corruption and only the
+      last commits may be rolled back after a power loss.
+    - The statements are prepared once and kept in a per connection cache of
+      `cached_statements` entries, all the queries use constant SQL strings
+      so that they are reused.
+    - The event queries are done through a separate read-only connection,
+      which sees only the committed data and never blocks the writes.
+    """
+
+    SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+    def __init__(
+            self,
+            database_path,
+            synchronous='NORMAL',
+            cached_statements=100,
+            group_commit_size=1,
+            group_commit_timeout=None):
+
+        synchronous = synchronous.upper()
+        if synchronous not in self.SYNCHRONOUS_LEVELS:
+            raise ValueError('synchronous must be one of {}'.format(
+                ', '.join(self.SYNCHRONOUS_LEVELS)
+            ))
+
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+
+        super(StateChangeLogWALSQLiteBackend, self).__init__(
+            database_path,
+            group_commit_size,
+            group_commit_timeout,
+        )
+
+        # every connection to an in memory database has its own database
+        if database_path != ':memory:':
+            self.read_conn = self.connect(database_path)
+            self.read_conn.execute('PRAGMA query_only=ON')
+
+    def connect(self, database_path):
+        conn = sqlite3.connect(
+            database_path,
+            cached_statements=self.cached_statements,
+        )
+        conn.text_factory = str
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous={}'.format(self.synchronous))
+        return conn
+
+    def sanity_check(self):
+        # The NUL character bug was fixed in python 2.7.3, checking the
+        # version avoids a write transaction on every start.
+        if sys.version_info < (2, 7, 3):
+            super(StateChangeLogWALSQLiteBackend, self).sanity_check()
+
+    def __del__(self):
+        read_conn = getattr(self, 'read_conn', None)
+        if read_conn is not None and read_conn is not getattr(self, 'conn', None):
+            read_conn.close()
+
+        super(StateChangeLogWALSQLiteBackend, self).__del__()
+
+
+class StateChangeLogArchive(object):
+    """ Compressed segment files with the events pruned from the
+    database.
+
+    A segment has the rows of the state_events table, with all of its
+    columns, so it can be filtered as the table.
+    """
+
+    def __init__(self, archive_dir, cache_size=8):
+        self.archive_dir = archive_dir
+
+        # The segments are immutable, the decoded rows of the recently read
+        # ones are kept sorted by block number with their block numbers, see
+        # `read_block_range`
+        self.segments_cache = cachetools.LRUCache(maxsize=cache_size)
+
+        if not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+
+    def write_segment(self, rows):
+        """ Write `rows` into a new segment and return its file name. """
+        segment_name = 'events-{}-{}.segment'.format(rows[0][0], rows[-1][0])
+        segment_path = os.path.join(self.archive_dir, segment_name)
+        temporary_path = segment_path + '.tmp'
+
+        data = zlib.compress(pickle.dumps([tuple(row) for row in rows], protocol=2))
+        with open(temporary_path, 'wb') as handler:
+            handler.write(data)
+            handler.flush()
+            os.fsync(handler.fileno())
+
+        os.rename(temporary_path, segment_path)
+        return segment_name
+
+    def read_segment(self, segment_name):
+        with open(os.path.join(self.archive_dir, segment_name), 'rb') as handler:
+            return pickle.loads(zlib.decompress(handler.read()))
+
+    def read_block_range(self, segment_name, from_block, to_block):
+        """ Return the rows of the segment in the inclusive block range,
+        `to_block` None is the latest block, sorted by block number.
+        """
+        try:
+            block_numbers, rows = self.segments_cache[segment_name]
+        except KeyError:
+            rows = sorted(
+                self.read_segment(segment_name),
+                key=lambda row: (row[2], row[0]),
+            )
+            block_numbers = [row[2] for row in rows]
+            self.segments_cache[segment_name] = (block_numbers, rows)
+
+        start = bisect_left(block_numbers, from_block or 0)
+        if to_block is None:
+            end = len(rows)
+        else:
+            end = bisect_right(block_numbers, to_block)
+
+        return rows[start:end]
 
 
 class StateChangeLog(object):
@@ -224,7 +943,8 @@ class StateChangeLog(object):
     def __init__(
             self,
             storage_instance,
-            serializer_instance=PickleTransactionSerializer()):
+            serializer_instance=PickleTransactionSerializer(),
+            archive_instance=None):
 
         if not isinstance(serializer_instance, StateChangeLogSerializer):
             raise ValueError(
@@ -237,13 +957,34 @@ class StateChangeLog(object):
                 'storage_instance must follow the StateChangeLogStorageBackend interface'
             )
         self.storage = storage_instance
+        self.last_state_change_id = self.storage.get_last_state_change_id()
+
+        # Where the pruned events are archived, None to discard them
+        self.archive = archive_instance
+
+        self.index_unindexed_events()
+
+    def index_unindexed_events(self):
+        """ Fill the index columns of events logged by an older version. """
+        unindexed_events = self.storage.get_unindexed_events()
+
+        if unindexed_events:
+            self.storage.write_events_index([
+                event_index(self.serializer.deserialize(data)) + (identifier, )
+                for identifier, data in unindexed_events
+            ])
 
-    def log(self, state_change):
-        """ Log a state change and return its identifier"""
-        # TODO: Issue 587
-        # Implement a queue of state changes for batch writting
+    def log(self, state_change, events_pending=False):
+        """ Log a state change and return its identifier.
+
+        With `events_pending` the write is completed by the `log_events` call
+        for the same state change, the state change and all of its events are
+        then committed at once.
+        """
         serialized_data = self.serializer.serialize(state_change)
-        return self.storage.write_state_change(serialized_data)
+        state_change_id = self.storage.write_state_change(serialized_data, events_pending)
+        self.last_state_change_id = state_change_id
+        return state_change_id
 
     def log_events(self, state_change_id, events, current_block_number):
         """ Log the events that were generated by `state_change_id` into the write ahead Log
@@ -251,8 +992,11 @@ class StateChangeLog(object):
         assert isinstance(events, list)
         self.storage.write_state_events(
             state_change_id,
-            [(None, state_change_id, current_block_number, self.serializer.serialize(event))
-             for event in events]
+            [
+                (None, state_change_id, current_block_number, self.serializer.serialize(event)) +
+                event_index(event)
+                for event in events
+            ]
         )
 
     def get_events_in_block_range(self, from_block, to_block):
@@ -262,7 +1006,67 @@ class StateChangeLog(object):
         This function returns a list of tuples of the form:
         (identifier, generated_statechange_id, block_number, event_object)
         """
-        results = self.storage.get_events_in_range(from_block, to_block)
+        return self.get_events(from_block, to_block)
+
+    def get_events(  # pylint: disable=too-many-arguments
+            self,
+            from_block=None,
+            to_block=None,
+            event_types=None,
+            token=None,
+            channel_address=None,
+            identifier=None,
+            partner=None):
+        """ Get the raiden events that match all the given filters, the
+        filtering is done by the storage and only the matching events are
+        deserialized.
+
+        Args:
+            from_block (int): First block of the range, inclusive.
+            to_block (int): Last block of the range, inclusive, None for the
+                latest block.
+            event_types (list): The event classes to return.
+            token (address): The token of the event.
+            channel_address (address): The channel of the event.
+            identifier (int): The transfer identifier.
+            partner (address): The receiver, target or initiator of the event.
+
+        Returns:
+            List[InternalEvent]: The events sorted by identifier.
+        """
+        if event_types is not None:
+            event_types = [event_type.__name__ for event_type in event_types]
+
+        results = self.storage.query_events(
+            from_block,
+            to_block,
+            event_types,
+            token,
+            channel_address,
+            identifier,
+            partner,
+        )
+
+        if self.archive is not None:
+            archived_results = [
+                row[:4]
+                for segment_name in self.storage.get_archive_segments(from_block, to_block)
+                for row in self.archive.read_block_range(segment_name, from_block, to_block)
+                if event_row_matches(
+                    row,
+                    from_block,
+                    to_block,
+                    event_types,
+                    token,
+                    channel_address,
+                    identifier,
+                    partner,
+                )
+            ]
+
+            if archived_results:
+                results = sorted(archived_results + list(results))
+
         return [
             InternalEvent(res[0], res[1], res[2], self.serializer.deserialize(res[3]))
             for res in results
@@ -272,6 +1076,94 @@ class StateChangeLog(object):
         serialized_data = self.storage.get_state_change_by_id(identifier)
         return self.serializer.deserialize(serialized_data)
 
+    def get_state_changes_after(self, state_change_id):
+        """ Return a list of tuples (identifier, state_change) of the state
+        changes logged after `state_change_id`, these are the state changes
+        that must be replayed on top of a snapshot taken at `state_change_id`.
+        """
+        return [
+            (identifier, self.serializer.deserialize(data))
+            for identifier, data in self.storage.get_state_changes_after(state_change_id)
+        ]
+
+    def prune(self, before_block, state_change_id, live_identifiers):
+        """ Delete the events older than `before_block` and the state
+        changes that are not needed anymore, archiving the events if an
+        archive is configured.
+
+        Args:
+            before_block (int): Events of this block and later are kept.
+            state_change_id (int): The last state change included in a
+                snapshot, later state changes and their events are kept.
+            live_identifiers (set): Identifiers of the transfers that are not
+                finalized, their events are kept.
+
+        Returns:
+            int: The number of pruned events.
+        """
+        live_identifiers = set(sqlite_int64(identifier) for identifier in live_identifiers)
+        rows = [
+            row
+            for row in self.storage.get_prunable_events(before_block, state_change_id)
+            if row[7] not in live_identifiers
+        ]
+
+        segment = None
+        if rows and self.archive is not None:
+            segment = (
+                self.archive.write_segment(rows),
+                min(row[2] for row in rows),
+                max(row[2] for row in rows),
+            )
+
+        self.storage.prune(
+            [row[0] for row in rows],
+            state_change_id,
+            segment,
+        )
+
+        return len(rows)
+
+    def write_acks(self, acks):
+        """ Store the acknowledgments evicted from the protocol's memory, see
+        `AckCache`.
+        """
+        self.storage.write_acks(acks)
+
+    def get_ack(self, echohash):
+        return self.storage.get_ack(echohash)
+
+    def get_ack_hashes(self):
+        return self.storage.get_ack_hashes()
+
+    def prune_acks(self, before_timestamp):
+        """ Delete the stored acknowledgments last used before
+        `before_timestamp`, retransmissions of their messages are not
+        acknowledged anymore.
+        """
+        self.storage.prune_acks(before_timestamp)
+
+    def compact(self, state_change_id):
+        """ Discard the state changes that are already part of a snapshot
+        taken at `state_change_id`.
+        """
+        self.storage.compact_state_changes(state_change_id)
+
+    def flush(self):
+        """ Commit the state changes and events that are pending because of a
+        group commit.
+        """
+        self.storage.flush()
+
+    def get_commit_result(self):
+        """ Return an AsyncResult that is set once every state change and
+        event logged so far is durable.
+
+        Useful to wait for the state changes of a message to be persisted
+        before acknowledging it.
+        """
+        return self.storage.get_commit_result()
+
     def snapshot(self, state_change_id, state):
         serialized_data = self.serializer.serialize(state)
         self.storage.write_state_snapshot(state_change_id, serialized_data)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import division
 
+from bisect import bisect_left
 from itertools import izip_longest
 
 from raiden.exceptions import HashLengthNot32
@@ -74,6 +75,103 @@ def compute_layers(elements):
     return tree
 
 
+def validate_leaf(leaf):
+    if not isinstance(leaf, (str, bytes)):
+        raise ValueError('all elements must be str')
+
+    if len(leaf) != 32:
+        raise HashLengthNot32()
+
+
+def update_layers(layers, leaves, index):
+    """ Computes the layers of the merkletree for the sorted `leaves`, reusing
+    the hashes of `layers` for the leaves before `index`.
+
+    The leaves up to `index` must be the same as in `layers`, so only the
+    nodes with a changed descendant are hashed. Because the leaves are sorted,
+    changing the leaf at `index` shifts the leaves after it and all of their
+    parents must be rehashed, changing the last leaf costs O(log n) hashes.
+    """
+    tree = [leaves]
+
+    layer = leaves
+    depth = 1
+    while len(layer) > 1:
+        # the parents of the unchanged pairs are kept
+        index = index // 2
+        if depth < len(layers):
+            parents = layers[depth][:index]
+        else:
+            parents = []
+
+        layer_length = len(layer)
+        for position in xrange(2 * index, layer_length, 2):
+            if position + 1 < layer_length:
+                parents.append(hash_pair(layer[position], layer[position + 1]))
+            else:
+                parents.append(layer[position])
+
+        tree.append(parents)
+        layer = parents
+        depth += 1
+
+    return tree
+
+
+def merkletree_insert(merkletree, leaf):
+    """ Return a new merkletree with `leaf` added, `merkletree` is not
+    changed.
+
+    Raises:
+        ValueError: If `leaf` is already in the tree.
+    """
+    validate_leaf(leaf)
+
+    leaves = merkletree.layers[LEAVES]
+    index = bisect_left(leaves, leaf)
+
+    if index < len(leaves) and leaves[index] == leaf:
+        raise ValueError('Duplicated element')
+
+    new_leaves = leaves[:index]
+    new_leaves.append(leaf)
+    new_leaves.extend(leaves[index:])
+
+    return MerkleTreeState(update_layers(merkletree.layers, new_leaves, index))
+
+
+def merkletree_remove(merkletree, leaf):
+    """ Return a new merkletree with `leaf` removed, `merkletree` is not
+    changed.
+
+    Raises:
+        ValueError: If `leaf` is not in the tree.
+    """
+    leaves = merkletree.layers[LEAVES]
+    index = bisect_left(leaves, leaf)
+
+    if index == len(leaves) or leaves[index] != leaf:
+        raise ValueError('Unknown element')
+
+    if len(leaves) == 1:
+        return EMPTY_MERKLE_TREE
+
+    new_leaves = leaves[:index]
+    new_leaves.extend(leaves[index + 1:])
+
+    return MerkleTreeState(update_layers(merkletree.layers, new_leaves, index))
+
+
+def merkleroot_with(merkletree, leaf):
+    """ Return the root that the tree would have with `leaf` added. """
+    return merkleroot(merkletree_insert(merkletree, leaf))
+
+
+def merkleroot_without(merkletree, leaf):
+    """ Return the root that the tree would have with `leaf` removed. """
+    return merkleroot(merkletree_remove(merkletree, leaf))
+
+
 def compute_merkleproof_for(merkletree, element):
     """ Containment proof for element.
 
@@ -102,6 +200,49 @@ def compute_merkleproof_for(merkletree, element):
     return proof
 
 
+def compute_merkleproofs_for(merkletree, elements):
+    """ Containment proofs for all the `elements`, in the same order.
+
+    Equivalent to calling `compute_merkleproof_for` for each element, but the
+    leaves are indexed once instead of searched for every element. The proofs
+    reference the node objects of the tree, the siblings shared by several
+    proofs are not copied.
+
+    Raises:
+        IndexError: If an element is not part of the merkletree.
+    """
+    layers = [
+        (layer, len(layer))
+        for layer in merkletree.layers
+    ]
+    leaf_to_index = {
+        leaf: index
+        for index, leaf in enumerate(merkletree.layers[LEAVES])
+    }
+
+    proofs = list()
+    for element in elements:
+        idx = leaf_to_index.get(element)
+        if idx is None:
+            raise IndexError('element is not part of the merkletree')
+
+        proof = list()
+        for layer, layer_length in layers:
+            # the pair of an even index is the next element, of an odd index
+            # the previous one
+            pair = idx ^ 1
+
+            # with an odd number of elements the rightmost one does not have a pair.
+            if pair < layer_length:
+                proof.append(layer[pair])
+
+            idx >>= 1
+
+        proofs.append(proof)
+
+    return proofs
+
+
 def validate_proof(proof, root, leaf_element):
     """ Checks that `leaf_element` was contained in the tree represented by
     `merkleroot`.
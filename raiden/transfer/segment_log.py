@@ -0,0 +1,681 @@
+# -*- coding: utf-8 -*-
+""" Append-only storage for the transaction log.
+
+The log is a directory of segment files, every write appends records to the
+active segment and a new segment is started once it grows past
+`segment_size`. A record is framed as:
+
+    crc32 (4 bytes) | record type (1 byte) | payload length (4 bytes) | payload
+
+The position of every state change, event, snapshot and acknowledgment is
+kept in an in memory index which is rebuilt by scanning the segments on
+start, the data itself is read back through a memory map of the segment. A
+record that is cut short or fails its checksum at the end of the last
+segment is the result of an interrupted write and is truncated, anywhere else
+it is corruption.
+
+Compaction and pruning are records as well. Segments that only contain dead
+records are deleted from the start of the log, every segment begins with a
+header record that has the counters needed once the previous segments are
+gone.
+"""
+import glob
+import marshal
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from collections import defaultdict
+
+from raiden.exceptions import CorruptedTransactionLog
+from raiden.transfer.log import (
+    event_row_matches,
+    GroupCommitMixin,
+    StateChangeLogStorageBackend,
+)
+
+# crc32, record type, payload length
+RECORD_HEADER = struct.Struct('<IBI')
+# state change id
+STATE_CHANGE_HEADER = struct.Struct('<Q')
+# identifier, source state change id, block number, length of the event index
+STATE_EVENT_HEADER = struct.Struct('<QQqI')
+# state change id
+STATE_SNAPSHOT_HEADER = struct.Struct('<Q')
+# last use, length of the echohash, length of the receiver address
+ACK_HEADER = struct.Struct('<dII')
+
+RECORD_SEGMENT_START = 0
+RECORD_STATE_CHANGE = 1
+RECORD_STATE_EVENT = 2
+RECORD_STATE_SNAPSHOT = 3
+RECORD_COMPACT = 4
+RECORD_PRUNE = 5
+RECORD_ACK = 6
+RECORD_PRUNE_ACKS = 7
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+
+# The offsets are stored in unsigned 32bits arrays
+MAX_SEGMENT_SIZE = 2 ** 32 - 1
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def segment_file_name(log_dir, segment):
+    return os.path.join(log_dir, '{}{:010d}{}'.format(SEGMENT_PREFIX, segment, SEGMENT_SUFFIX))
+
+
+def segment_number(segment_file):
+    name = os.path.basename(segment_file)
+    return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+# The checksum covers the record type and the payload, the checksum of the
+# type is computed once
+RECORD_TYPE_CHECKSUMS = [zlib.crc32(chr(record_type)) for record_type in range(256)]
+
+
+def record_checksum(record_type, payload):
+    return zlib.crc32(payload, RECORD_TYPE_CHECKSUMS[record_type]) & 0xffffffff
+
+
+class StateChangeLogSegmentBackend(GroupCommitMixin, StateChangeLogStorageBackend):
+    """ Transaction log storage in append-only segment files.
+
+    The writes are sequential appends and a commit is a single fsync of the
+    active segment, the group commit works as for the SQLite backend. The
+    event queries are filtered in memory, this backend is meant for nodes
+    that rarely query the events.
+
+    Args:
+        log_dir (str): Directory of the segment files, created if missing.
+        segment_size (int): Size in bytes after which a new segment is
+            started.
+    """
+
+    def __init__(
+            self,
+            log_dir,
+            segment_size=64 * 1024 * 1024,
+            group_commit_size=1,
+            group_commit_timeout=None):
+
+        if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+            raise ValueError('segment_size must be between 1 and {}'.format(MAX_SEGMENT_SIZE))
+
+        self.init_group_commit(group_commit_size, group_commit_timeout)
+
+        self.log_dir = log_dir
+        self.segment_size = segment_size
+        self.write_lock = threading.Lock()
+
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+
+        self.segments = list()
+        self.segment_maps = dict()
+        self.live_records = defaultdict(int)
+
+        # The location of the state change `state_change_base + i + 1` is at
+        # the position `i` of the arrays, the state changes up to
+        # `state_change_base` were compacted and their segments deleted.
+        self.state_change_base = 0
+        self.state_change_segments = array('I')
+        self.state_change_offsets = array('I')
+        self.state_change_lengths = array('I')
+        self.last_state_change_id = 0
+        self.compacted_up_to = 0
+
+        # identifier -> (identifier, source_statechange_id, block_number,
+        # location, event_type, token, channel_address, transfer_identifier,
+        # partner), the columns of the SQLite state_events table with the
+        # location of the data instead of the data. The identifiers are sorted
+        # by the queries, which are rare.
+        self.events = dict()
+        self.last_event_identifier = 0
+
+        self.snapshot = None
+        self.archive_segments = list()
+
+        # echohash -> (last_use, receiver_address, location of the message)
+        self.acks = dict()
+
+        self.active_segment = None
+        self.active_file = None
+        self.active_offset = 0
+
+        segment_files = glob.glob(os.path.join(log_dir, SEGMENT_PREFIX + '*' + SEGMENT_SUFFIX))
+        self.segments.extend(sorted(
+            segment_number(segment_file)
+            for segment_file in segment_files
+        ))
+
+        for position, segment in enumerate(self.segments):
+            is_last = position == len(self.segments) - 1
+            self.load_segment(segment, is_last)
+
+        if self.segments:
+            self.open_segment(self.segments[-1])
+        else:
+            self.start_segment(0)
+
+    def load_segment(self, segment, is_last):
+        """ Rebuild the index from the records of `segment`. """
+        segment_file = segment_file_name(self.log_dir, segment)
+        size = os.path.getsize(segment_file)
+
+        position = 0
+        if size:
+            with open(segment_file, 'rb') as handler:
+                data = mmap.mmap(handler.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                position = self.load_records(segment, data, is_last)
+            finally:
+                data.close()
+
+        if position != size:
+            # the last records were not completely written
+            with open(segment_file, 'r+b') as handler:
+                handler.truncate(position)
+                handler.flush()
+                os.fsync(handler.fileno())
+
+    def load_records(self, segment, data, is_last):
+        """ Index the records of `data` and return the position after the
+        last valid record.
+        """
+        size = len(data)
+        position = 0
+
+        while position + RECORD_HEADER.size <= size:
+            checksum, record_type, length = RECORD_HEADER.unpack_from(data, position)
+            payload_offset = position + RECORD_HEADER.size
+            end = payload_offset + length
+            payload = data[payload_offset:end]
+
+            if end > size or record_checksum(record_type, payload) != checksum:
+                break
+
+            self.load_record(segment, record_type, payload_offset, payload)
+            position = end
+
+        if position != size and not is_last:
+            raise CorruptedTransactionLog(
+                'invalid record in segment {} at position {}'.format(segment, position)
+            )
+
+        return position
+
+    def load_record(self, segment, record_type, payload_offset, payload):
+        if record_type == RECORD_STATE_CHANGE:
+            identifier, = STATE_CHANGE_HEADER.unpack_from(payload)
+            self.index_state_change(
+                identifier,
+                segment,
+                payload_offset + STATE_CHANGE_HEADER.size,
+                len(payload) - STATE_CHANGE_HEADER.size,
+            )
+
+        elif record_type == RECORD_STATE_EVENT:
+            identifier, statechange_id, block_number, index_length = \
+                STATE_EVENT_HEADER.unpack_from(payload)
+            index_end = STATE_EVENT_HEADER.size + index_length
+            data_location = (
+                segment,
+                payload_offset + index_end,
+                len(payload) - index_end,
+            )
+            self.index_event(
+                identifier,
+                statechange_id,
+                block_number,
+                data_location,
+                marshal.loads(payload[STATE_EVENT_HEADER.size:index_end]),
+            )
+
+        elif record_type == RECORD_STATE_SNAPSHOT:
+            statechange_id, = STATE_SNAPSHOT_HEADER.unpack_from(payload)
+            self.index_snapshot(
+                statechange_id,
+                (
+                    segment,
+                    payload_offset + STATE_SNAPSHOT_HEADER.size,
+                    len(payload) - STATE_SNAPSHOT_HEADER.size,
+                ),
+            )
+
+        elif record_type == RECORD_COMPACT:
+            self.apply_compact(marshal.loads(payload))
+
+        elif record_type == RECORD_PRUNE:
+            event_identifiers, _, archive_segment = marshal.loads(payload)
+            self.apply_prune(event_identifiers, archive_segment)
+
+        elif record_type == RECORD_ACK:
+            last_use, echohash_length, receiver_length = ACK_HEADER.unpack_from(payload)
+            receiver_offset = ACK_HEADER.size + echohash_length
+            data_offset = receiver_offset + receiver_length
+            self.index_ack(
+                payload[ACK_HEADER.size:receiver_offset],
+                last_use,
+                payload[receiver_offset:data_offset],
+                (
+                    segment,
+                    payload_offset + data_offset,
+                    len(payload) - data_offset,
+                ),
+            )
+
+        elif record_type == RECORD_PRUNE_ACKS:
+            self.apply_prune_acks(marshal.loads(payload))
+
+        elif record_type == RECORD_SEGMENT_START:
+            # only the header of the first segment is needed, the following
+            # headers repeat what the records before them already set
+            if segment == self.segments[0]:
+                (
+                    last_state_change_id,
+                    self.last_event_identifier,
+                    self.compacted_up_to,
+                    archive_segments,
+                ) = marshal.loads(payload)
+
+                self.state_change_base = last_state_change_id
+                self.last_state_change_id = last_state_change_id
+                self.archive_segments = list(archive_segments)
+
+        else:
+            raise CorruptedTransactionLog(
+                'unknown record type {} in segment {}'.format(record_type, segment)
+            )
+
+    def index_state_change(self, identifier, segment, offset, length):
+        assert identifier == self.state_change_base + len(self.state_change_offsets) + 1
+
+        self.state_change_segments.append(segment)
+        self.state_change_offsets.append(offset)
+        self.state_change_lengths.append(length)
+        self.last_state_change_id = identifier
+        self.live_records[segment] += 1
+
+    def index_event(self, identifier, statechange_id, block_number, location, event_index):
+        self.events[identifier] = (identifier, statechange_id, block_number, location) + \
+            tuple(event_index)
+        self.last_event_identifier = max(self.last_event_identifier, identifier)
+        self.live_records[location[0]] += 1
+
+    def index_snapshot(self, statechange_id, location):
+        if self.snapshot is not None:
+            self.live_records[self.snapshot[1][0]] -= 1
+
+        self.snapshot = (statechange_id, location)
+        self.live_records[location[0]] += 1
+
+    def apply_compact(self, identifier):
+        first = max(self.compacted_up_to, self.state_change_base)
+        last = min(identifier, self.last_state_change_id)
+
+        for position in range(first - self.state_change_base, last - self.state_change_base):
+            self.live_records[self.state_change_segments[position]] -= 1
+
+        self.compacted_up_to = max(self.compacted_up_to, identifier)
+
+    def apply_prune(self, event_identifiers, archive_segment):
+        for identifier in event_identifiers:
+            event = self.events.pop(identifier, None)
+            if event is not None:
+                self.live_records[event[3][0]] -= 1
+
+        if archive_segment is not None:
+            self.archive_segments.append(tuple(archive_segment))
+
+    def index_ack(self, echohash, last_use, receiver_address, location):
+        previous = self.acks.get(echohash)
+        if previous is not None:
+            self.live_records[previous[2][0]] -= 1
+
+        self.acks[echohash] = (last_use, receiver_address, location)
+        self.live_records[location[0]] += 1
+
+    def apply_prune_acks(self, before_timestamp):
+        pruned = [
+            echohash
+            for echohash, (last_use, _, _) in self.acks.iteritems()
+            if last_use < before_timestamp
+        ]
+
+        for echohash in pruned:
+            _, _, location = self.acks.pop(echohash)
+            self.live_records[location[0]] -= 1
+
+    def start_segment(self, segment):
+        """ Create the segment file and write its header. """
+        self.segments.append(segment)
+        self.open_segment(segment)
+
+        header = (
+            self.last_state_change_id,
+            self.last_event_identifier,
+            self.compacted_up_to,
+            self.archive_segments,
+        )
+        self.append_record(RECORD_SEGMENT_START, marshal.dumps(header))
+
+    def open_segment(self, segment):
+        segment_file = segment_file_name(self.log_dir, segment)
+
+        self.active_segment = segment
+        self.active_file = open(segment_file, 'ab', WRITE_BUFFER_SIZE)
+        self.active_offset = os.path.getsize(segment_file)
+
+    def rotate_if_full(self):
+        """ Start a new segment if the active one is full, must be called
+        with the write_lock held and before the records of a write.
+        """
+        if self.active_offset < self.segment_size:
+            return
+
+        self._sync()
+        self.active_file.close()
+        self.start_segment(self.active_segment + 1)
+
+    def append_record(self, record_type, payload):
+        """ Append a record to the active segment and return the offset of
+        its payload.
+        """
+        header = RECORD_HEADER.pack(
+            record_checksum(record_type, payload),
+            record_type,
+            len(payload),
+        )
+        self.active_file.write(header + payload)
+
+        payload_offset = self.active_offset + RECORD_HEADER.size
+        self.active_offset = payload_offset + len(payload)
+        return payload_offset
+
+    def read_location(self, location):
+        segment, offset, length = location
+        data = self.segment_maps.get(segment)
+
+        if data is None or offset + length > len(data):
+            if segment == self.active_segment:
+                # the record may still be in the write buffer
+                self.active_file.flush()
+
+            if data is not None:
+                data.close()
+
+            with open(segment_file_name(self.log_dir, segment), 'rb') as handler:
+                data = mmap.mmap(handler.fileno(), 0, access=mmap.ACCESS_READ)
+            self.segment_maps[segment] = data
+
+        return data[offset:offset + length]
+
+    def remove_dead_segments(self):
+        """ Delete the segments at the start of the log that have no live
+        records, must be called after the compaction or pruning is committed.
+        """
+        while len(self.segments) > 1 and self.live_records[self.segments[0]] <= 0:
+            segment = self.segments.pop(0)
+            self.live_records.pop(segment, None)
+
+            data = self.segment_maps.pop(segment, None)
+            if data is not None:
+                data.close()
+
+            os.remove(segment_file_name(self.log_dir, segment))
+
+    def write_state_change(self, data, events_pending=False):
+        with self.write_lock:
+            self.rotate_if_full()
+
+            identifier = self.last_state_change_id + 1
+            payload = STATE_CHANGE_HEADER.pack(identifier) + data
+            payload_offset = self.append_record(RECORD_STATE_CHANGE, payload)
+            self.index_state_change(
+                identifier,
+                self.active_segment,
+                payload_offset + STATE_CHANGE_HEADER.size,
+                len(data),
+            )
+
+            if not events_pending:
+                self._write_done()
+
+        return identifier
+
+    def write_state_events(self, statechange_id, events_data):
+        """ Append the events, `events_data` has the same format as for the
+        SQLite backend and the first column is ignored.
+        """
+        with self.write_lock:
+            if not 0 < statechange_id <= self.last_state_change_id:
+                raise ValueError('unknown state change {}'.format(statechange_id))
+
+            for event_data in events_data:
+                identifier = self.last_event_identifier + 1
+                _, source_statechange_id, block_number, data = event_data[:4]
+                event_index = tuple(event_data[4:])
+
+                serialized_index = marshal.dumps(event_index)
+                payload = STATE_EVENT_HEADER.pack(
+                    identifier,
+                    source_statechange_id,
+                    block_number,
+                    len(serialized_index),
+                ) + serialized_index + data
+
+                payload_offset = self.append_record(RECORD_STATE_EVENT, payload)
+                location = (
+                    self.active_segment,
+                    payload_offset + STATE_EVENT_HEADER.size + len(serialized_index),
+                    len(data),
+                )
+                self.index_event(
+                    identifier,
+                    source_statechange_id,
+                    block_number,
+                    location,
+                    event_index,
+                )
+
+            self._write_done()
+
+    def write_state_snapshot(self, statechange_id, data):
+        with self.write_lock:
+            self.rotate_if_full()
+
+            payload = STATE_SNAPSHOT_HEADER.pack(statechange_id) + data
+            payload_offset = self.append_record(RECORD_STATE_SNAPSHOT, payload)
+            self.index_snapshot(
+                statechange_id,
+                (
+                    self.active_segment,
+                    payload_offset + STATE_SNAPSHOT_HEADER.size,
+                    len(data),
+                ),
+            )
+            self._commit()
+
+    def compact_state_changes(self, identifier):
+        """ Drop the data of the state changes up to and including
+        `identifier`.
+        """
+        with self.write_lock:
+            self.rotate_if_full()
+
+            self.append_record(RECORD_COMPACT, marshal.dumps(identifier))
+            self.apply_compact(identifier)
+            self._commit()
+            self.remove_dead_segments()
+
+    def prune(self, event_identifiers, state_change_id, segment=None):
+        """ Delete the events in `event_identifiers`, the data of the state
+        changes is already dropped by the compaction.
+        """
+        with self.write_lock:
+            self.rotate_if_full()
+
+            event_identifiers = list(event_identifiers)
+            payload = marshal.dumps((event_identifiers, state_change_id, segment))
+            self.append_record(RECORD_PRUNE, payload)
+            self.apply_prune(event_identifiers, segment)
+            self._commit()
+            self.remove_dead_segments()
+
+    def write_acks(self, acks):
+        with self.write_lock:
+            self.rotate_if_full()
+
+            for echohash, last_use, receiver_address, data in acks:
+                header = ACK_HEADER.pack(last_use, len(echohash), len(receiver_address))
+                payload = header + echohash + receiver_address + data
+                payload_offset = self.append_record(RECORD_ACK, payload)
+                self.index_ack(
+                    echohash,
+                    last_use,
+                    receiver_address,
+                    (
+                        self.active_segment,
+                        payload_offset + len(payload) - len(data),
+                        len(data),
+                    ),
+                )
+
+            self._write_done()
+
+    def prune_acks(self, before_timestamp):
+        with self.write_lock:
+            self.rotate_if_full()
+
+            self.append_record(RECORD_PRUNE_ACKS, marshal.dumps(before_timestamp))
+            self.apply_prune_acks(before_timestamp)
+            self._commit()
+            self.remove_dead_segments()
+
+    def _sync(self):
+        self.active_file.flush()
+        os.fsync(self.active_file.fileno())
+
+    def get_state_snapshot(self):
+        """ Return the last state snapshot as a tuple of (state_change_id, data)"""
+        if self.snapshot is None:
+            return None
+
+        statechange_id, location = self.snapshot
+        return (statechange_id, self.read_location(location))
+
+    def get_state_change_by_id(self, identifier):
+        position = identifier - self.state_change_base - 1
+        is_live = (
+            identifier > self.compacted_up_to and
+            0 <= position < len(self.state_change_offsets)
+        )
+
+        if not is_live:
+            return None
+
+        return self.read_location((
+            self.state_change_segments[position],
+            self.state_change_offsets[position],
+            self.state_change_lengths[position],
+        ))
+
+    def get_last_state_change_id(self):
+        return self.last_state_change_id
+
+    def get_ack(self, echohash):
+        ack = self.acks.get(echohash)
+
+        if ack is None:
+            return None
+
+        _, receiver_address, location = ack
+        return (receiver_address, self.read_location(location))
+
+    def get_ack_hashes(self):
+        return list(self.acks)
+
+    def get_state_changes_after(self, identifier):
+        """ Return the (id, data) of the state changes logged after
+        `identifier` that were not compacted, sorted by id.
+        """
+        first = max(identifier, self.compacted_up_to, self.state_change_base) + 1
+        return [
+            (state_change_id, self.get_state_change_by_id(state_change_id))
+            for state_change_id in range(first, self.last_state_change_id + 1)
+        ]
+
+    def sorted_events(self):
+        events = self.events
+        return [events[identifier] for identifier in sorted(events)]
+
+    def get_unindexed_events(self):  # pylint: disable=no-self-use
+        # the events are always written with their index
+        return list()
+
+    def write_events_index(self, events_index):
+        # there are no unindexed events to update, see get_unindexed_events
+        if events_index:
+            raise ValueError('the segment log events are always indexed')
+
+    def get_prunable_events(self, before_block, state_change_id):
+        return [
+            event[:3] + (self.read_location(event[3]), ) + event[4:]
+            for event in self.sorted_events()
+            if event[2] < before_block and event[1] <= state_change_id
+        ]
+
+    def get_archive_segments(self, from_block, to_block):
+        return [
+            path
+            for path, segment_from_block, segment_to_block in self.archive_segments
+            if segment_to_block >= (from_block or 0) and
+            (to_block is None or segment_from_block <= to_block)
+        ]
+
+    def get_events_in_range(self, from_block, to_block):
+        return self.query_events(from_block, to_block)
+
+    def query_events(  # pylint: disable=too-many-arguments
+            self,
+            from_block=None,
+            to_block=None,
+            event_types=None,
+            token=None,
+            channel_address=None,
+            transfer_identifier=None,
+            partner=None):
+        """ Same as the SQLite backend, the events are filtered in memory and
+        only the data of the matching events is read.
+        """
+        return [
+            event[:3] + (self.read_location(event[3]), )
+            for event in self.sorted_events()
+            if event_row_matches(
+                event,
+                from_block,
+                to_block,
+                event_types,
+                token,
+                channel_address,
+                transfer_identifier,
+                partner,
+            )
+        ]
+
+    def read(self):
+        pass
+
+    def __del__(self):
+        for data in self.segment_maps.values():
+            data.close()
+
+        if self.active_file is not None:
+            self.active_file.close()
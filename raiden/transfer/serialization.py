@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+""" Schema driven binary serialization for the transaction log.
+
+A record is a format byte followed by an encoded value. Every value starts
+with a one byte kind, objects of the classes registered in `SCHEMAS` are
+encoded as a type tag, the schema version and the attribute values in the
+schema order, so the records don't depend on the python class paths.
+
+Values that are not covered by the schemas (e.g. the secret generator of
+ActionInitInitiator) are embedded as pickle data.
+"""
+import pickle
+import struct
+
+from raiden.transfer.log import StateChangeLogSerializer
+from raiden.transfer import events, state, state_change
+from raiden.transfer.mediated_transfer import (
+    events as mediated_events,
+    state as mediated_state,
+    state_change as mediated_state_change,
+)
+
+# pickle protocol 2 and above start with the PROTO opcode, records written
+# by the PickleTransactionSerializer are still readable
+PICKLE_PROTO = b'\x80'
+FORMAT_V1 = b'\x01'
+
+KIND_NONE = b'\x00'
+KIND_FALSE = b'\x01'
+KIND_TRUE = b'\x02'
+KIND_UINT = b'\x03'
+KIND_NEGINT = b'\x04'
+KIND_SHORT_BYTES = b'\x05'
+KIND_BYTES = b'\x06'
+KIND_UNICODE = b'\x07'
+KIND_LIST = b'\x08'
+KIND_TUPLE = b'\x09'
+KIND_DICT = b'\x0a'
+KIND_OBJECT = b'\x0b'
+KIND_PICKLE = b'\x0c'
+
+LENGTH = struct.Struct('>I')
+OBJECT_HEADER = struct.Struct('>HB')
+
+# (type tag, class, schema version, attributes)
+#
+# The type tags are part of the storage format and must never be reused, a
+# change to the attributes of a class requires a new schema version.
+SCHEMAS = (
+    # States nested in the state changes and events
+    (1, state.RouteState, 1, (
+        'state', 'node_address', 'channel_address', 'available_balance',
+        'settle_timeout', 'reveal_timeout', 'closed_block',
+    )),
+    (2, state.RoutesState, 1, (
+        'available_routes', 'ignored_routes', 'refunded_routes', 'canceled_routes',
+    )),
+    (3, state.BalanceProofState, 1, (
+        'nonce', 'transferred_amount', 'locksroot', 'channel_address',
+        'message_hash', 'signature',
+    )),
+    (4, state.MerkleTreeState, 1, ('layers', )),
+    (5, mediated_state.LockedTransferState, 1, (
+        'identifier', 'amount', 'token', 'initiator', 'target', 'expiration',
+        'hashlock', 'secret',
+    )),
+    (6, mediated_state.InitiatorState, 1, (
+        'our_address', 'transfer', 'routes', 'block_number', 'random_generator',
+        'message', 'route', 'secretrequest', 'revealsecret', 'canceled_transfers',
+    )),
+    (7, mediated_state.MediatorState, 1, (
+        'our_address', 'routes', 'block_number', 'hashlock', 'secret', 'transfers_pair',
+    )),
+    (8, mediated_state.TargetState, 1, (
+        'our_address', 'from_route', 'from_transfer', 'block_number', 'secret', 'state',
+    )),
+    (9, mediated_state.MediationPairState, 1, (
+        'payee_route', 'payee_transfer', 'payee_state',
+        'payer_route', 'payer_transfer', 'payer_state',
+    )),
+
+    # State changes
+    (100, state_change.Block, 1, ('block_number', )),
+    (101, state_change.ActionRouteChange, 1, ('identifier', 'route')),
+    (102, state_change.ActionCancelTransfer, 1, ('identifier', )),
+    (103, state_change.ActionTransferDirect, 1, (
+        'identifier', 'amount', 'token_address', 'node_address',
+    )),
+    (104, state_change.ReceiveTransferDirect, 1, (
+        'identifier', 'amount', 'token_address', 'sender',
+    )),
+    (105, mediated_state_change.ActionInitInitiator, 1, (
+        'our_address', 'transfer', 'routes', 'random_generator', 'block_number',
+    )),
+    (106, mediated_state_change.ActionInitMediator, 1, (
+        'our_address', 'from_transfer', 'routes', 'from_route', 'block_number',
+    )),
+    (107, mediated_state_change.ActionInitTarget, 1, (
+        'our_address', 'from_route', 'from_transfer', 'block_number',
+    )),
+    (108, mediated_state_change.ActionCancelRoute, 1, ('identifier', )),
+    (109, mediated_state_change.ReceiveSecretRequest, 1, (
+        'identifier', 'amount', 'hashlock', 'sender', 'revealsecret',
+    )),
+    (110, mediated_state_change.ReceiveSecretReveal, 1, ('secret', 'sender')),
+    (111, mediated_state_change.ReceiveTransferRefund, 1, ('sender', 'transfer')),
+    (112, mediated_state_change.ReceiveBalanceProof, 1, (
+        'identifier', 'node_address', 'balance_proof',
+    )),
+    (113, mediated_state_change.ContractReceiveWithdraw, 1, (
+        'channel_address', 'secret', 'receiver',
+    )),
+    (114, mediated_state_change.ContractReceiveClosed, 1, (
+        'channel_address', 'closing_address', 'block_number',
+    )),
+    (115, mediated_state_change.ContractReceiveSettled, 1, (
+        'channel_address', 'block_number',
+    )),
+    (116, mediated_state_change.ContractReceiveBalance, 1, (
+        'channel_address', 'token_address', 'participant_address', 'balance', 'block_number',
+    )),
+    (117, mediated_state_change.ContractReceiveNewChannel, 1, (
+        'manager_address', 'channel_address', 'participant1', 'participant2',
+        'settle_timeout',
+    )),
+    (118, mediated_state_change.ContractReceiveTokenAdded, 1, (
+        'registry_address', 'token_address', 'manager_address',
+    )),
+    (119, state_change.ActionRegisterTransfer, 1, (
+        'block_number', 'channel_address', 'transfer_data',
+    )),
+
+    # Events
+    (200, events.EventTransferSentSuccess, 1, ('identifier', 'amount', 'target')),
+    (201, events.EventTransferSentFailed, 1, ('identifier', 'reason')),
+    (202, events.EventTransferReceivedSuccess, 1, ('identifier', 'amount', 'initiator')),
+    (203, mediated_events.SendMediatedTransfer, 1, (
+        'identifier', 'token', 'amount', 'hashlock', 'initiator', 'target',
+        'expiration', 'receiver',
+    )),
+    (204, mediated_events.SendRevealSecret, 1, (
+        'identifier', 'secret', 'token', 'receiver', 'sender',
+    )),
+    (205, mediated_events.SendBalanceProof, 1, (
+        'identifier', 'channel_address', 'token', 'receiver', 'secret',
+    )),
+    (206, mediated_events.SendSecretRequest, 1, (
+        'identifier', 'amount', 'hashlock', 'receiver',
+    )),
+    (207, mediated_events.SendRefundTransfer, 1, (
+        'identifier', 'token', 'amount', 'hashlock', 'initiator', 'target',
+        'expiration', 'receiver',
+    )),
+    (208, mediated_events.ContractSendChannelClose, 1, ('channel_address', 'token')),
+    (209, mediated_events.ContractSendWithdraw, 1, ('transfer', 'channel_address')),
+    (210, mediated_events.EventUnlockSuccess, 1, ('identifier', 'hashlock')),
+    (211, mediated_events.EventUnlockFailed, 1, ('identifier', 'hashlock', 'reason')),
+    (212, mediated_events.EventWithdrawSuccess, 1, ('identifier', 'hashlock')),
+    (213, mediated_events.EventWithdrawFailed, 1, ('identifier', 'hashlock', 'reason')),
+)
+
+CLASS_TO_SCHEMA = {
+    class_: (OBJECT_HEADER.pack(tag, version), attributes)
+    for tag, class_, version, attributes in SCHEMAS
+}
+TAG_TO_SCHEMA = {
+    tag: (class_, version, attributes)
+    for tag, class_, version, attributes in SCHEMAS
+}
+
+
+def encode_int(value, append):
+    if value < 0:
+        append(KIND_NEGINT)
+        value = -value
+    else:
+        append(KIND_UINT)
+
+    hex_value = '%x' % value
+    if len(hex_value) % 2:
+        hex_value = '0' + hex_value
+
+    data = hex_value.decode('hex')
+    append(chr(len(data)))
+    append(data)
+
+
+def encode_bytes(value, append):
+    length = len(value)
+
+    if length < 256:
+        append(KIND_SHORT_BYTES)
+        append(chr(length))
+    else:
+        append(KIND_BYTES)
+        append(LENGTH.pack(length))
+
+    append(value)
+
+
+def encode_unicode(value, append):
+    data = value.encode('utf8')
+    append(KIND_UNICODE)
+    append(LENGTH.pack(len(data)))
+    append(data)
+
+
+def encode_sequence(kind, value, append):
+    append(kind)
+    append(LENGTH.pack(len(value)))
+    for item in value:
+        encode_value(item, append)
+
+
+def encode_dict(value, append):
+    append(KIND_DICT)
+    append(LENGTH.pack(len(value)))
+    for key, item in value.iteritems():
+        encode_value(key, append)
+        encode_value(item, append)
+
+
+def encode_value(value, append):
+    value_type = type(value)
+
+    if value_type is str:
+        encode_bytes(value, append)
+
+    elif value_type is int or value_type is long:
+        encode_int(value, append)
+
+    elif value is None:
+        append(KIND_NONE)
+
+    elif value_type in CLASS_TO_SCHEMA:
+        header, attributes = CLASS_TO_SCHEMA[value_type]
+        append(KIND_OBJECT)
+        append(header)
+        for attribute in attributes:
+            encode_value(getattr(value, attribute), append)
+
+    elif value_type is bool:
+        append(KIND_TRUE if value else KIND_FALSE)
+
+    elif value_type is list:
+        encode_sequence(KIND_LIST, value, append)
+
+    elif value_type is tuple:
+        encode_sequence(KIND_TUPLE, value, append)
+
+    elif value_type is dict:
+        encode_dict(value, append)
+
+    elif value_type is unicode:
+        encode_unicode(value, append)
+
+    else:
+        data = pickle.dumps(value, -1)
+        append(KIND_PICKLE)
+        append(LENGTH.pack(len(data)))
+        append(data)
+
+
+def decode_value(data, offset):
+    """ Decode the value at `offset` and return it with the offset of the next
+    value.
+    """
+    # pylint: disable=too-many-return-statements,too-many-branches
+    kind = data[offset]
+    offset += 1
+
+    if kind == KIND_SHORT_BYTES:
+        end = offset + 1 + ord(data[offset])
+        return data[offset + 1:end], end
+
+    if kind == KIND_UINT or kind == KIND_NEGINT:
+        end = offset + 1 + ord(data[offset])
+        value = int(data[offset + 1:end].encode('hex') or '0', 16)
+        if kind == KIND_NEGINT:
+            value = -value
+        return value, end
+
+    if kind == KIND_NONE:
+        return None, offset
+
+    if kind == KIND_OBJECT:
+        tag, version = OBJECT_HEADER.unpack_from(data, offset)
+        offset += OBJECT_HEADER.size
+
+        schema = TAG_TO_SCHEMA.get(tag)
+        if schema is None:
+            raise ValueError('unknown type tag {}'.format(tag))
+
+        class_, schema_version, attributes = schema
+        if version != schema_version:
+            raise ValueError('unsupported version {} for {}'.format(version, class_.__name__))
+
+        # the constructors validate and compute data, the attribute values are
+        # restored as they were serialized
+        value = class_.__new__(class_)
+        for attribute in attributes:
+            attribute_value, offset = decode_value(data, offset)
+            setattr(value, attribute, attribute_value)
+
+        return value, offset
+
+    if kind == KIND_TRUE:
+        return True, offset
+
+    if kind == KIND_FALSE:
+        return False, offset
+
+    if kind == KIND_LIST or kind == KIND_TUPLE:
+        length, = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+
+        value = list()
+        for _ in xrange(length):
+            item, offset = decode_value(data, offset)
+            value.append(item)
+
+        if kind == KIND_TUPLE:
+            value = tuple(value)
+
+        return value, offset
+
+    if kind == KIND_DICT:
+        length, = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+
+        value = dict()
+        for _ in xrange(length):
+            key, offset = decode_value(data, offset)
+            value[key], offset = decode_value(data, offset)
+
+        return value, offset
+
+    if kind in (KIND_BYTES, KIND_UNICODE, KIND_PICKLE):
+        length, = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        end = offset + length
+        value = data[offset:end]
+
+        if kind == KIND_UNICODE:
+            value = value.decode('utf8')
+        elif kind == KIND_PICKLE:
+            value = pickle.loads(value)
+
+        return value, end
+
+    raise ValueError('invalid kind {!r} at offset {}'.format(kind, offset - 1))
+
+
+class CompactTransactionSerializer(StateChangeLogSerializer):
+    """ CompactTransactionSerializer
+
+        A transaction serializer using a binary format described by the
+        `SCHEMAS` of the state changes and events. Records written by the
+        PickleTransactionSerializer can be deserialized.
+    """
+    def serialize(self, transaction):
+        result = [FORMAT_V1]
+        encode_value(transaction, result.append)
+        return b''.join(result)
+
+    def deserialize(self, data):
+        if data[0] == PICKLE_PROTO:
+            return pickle.loads(data)
+
+        if data[0] != FORMAT_V1:
+            raise ValueError('unknown record format {!r}'.format(data[0]))
+
+        value, offset = decode_value(data, 1)
+
+        if offset != len(data):
+            raise ValueError('trailing data in record')
+
+        return value
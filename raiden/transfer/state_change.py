@@ -159,3 +159,40 @@ class ReceiveTransferDirect(StateChange):
             self.token_address,
             self.sender,
         )
+
+
+class ActionRegisterTransfer(StateChange):
+    """ A signed transfer, sent or received, was registered in a channel.
+
+    The channels are only saved by the snapshots, this state change is
+    replayed to bring a restored channel up to date.
+
+    Args:
+        block_number: The block number used to register the transfer.
+        channel_address: The channel the transfer belongs to.
+        transfer_data: The encoded transfer message.
+    """
+
+    def __init__(self, block_number, channel_address, transfer_data):
+        self.block_number = block_number
+        self.channel_address = channel_address
+        self.transfer_data = transfer_data
+
+    def __eq__(self, other):
+        if not isinstance(other, ActionRegisterTransfer):
+            return False
+
+        return (
+            self.block_number == other.block_number and
+            self.channel_address == other.channel_address and
+            self.transfer_data == other.transfer_data
+        )
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __str__(self):
+        return 'ActionRegisterTransfer(block_number:{} channel_address:{})'.format(
+            self.block_number,
+            self.channel_address,
+        )
@@ -199,7 +199,8 @@ def channel_to_api_dict(channel):
         'settle_timeout': channel.settle_timeout,
         'reveal_timeout': channel.reveal_timeout,
         'balance': channel.distributable,
-        'state': channel.state
+        'state': channel.state,
+        'verified': channel.verified,
     }
 
 
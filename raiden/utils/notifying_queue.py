@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from itertools import islice
+
 from gevent.queue import Queue
 from gevent.event import Event
 
@@ -23,6 +25,12 @@ class NotifyingQueue(Event):
     def peek(self, block=True, timeout=None):
         return self._queue.peek(block, timeout)
 
+    def peek_many(self, count):
+        """ Returns up to `count` items from the head of the queue without
+        removing them.
+        """
+        return list(islice(self._queue.queue, count))
+
     def __len__(self):
         return len(self._queue)
 